@@ -16,14 +16,14 @@ schools = tb_env.POIDataset.from_overpass("""node({})->.crossing;
                                                 out center;""".format(crossing_node_id),
                                           name="schools")
 
-## Normal & Flood scenarios. Pass along an extra parameter to osrm-routed
-## so that the max duration table size is enough for all origin:dest pairs
-routed_args = {"max_table_size": len(homesteads) * len(schools) + 1}
+## Normal & Flood scenarios. Only compile the network around the homesteads
+## and schools, plus a 2km detour buffer
+extent = {"extent": [homesteads, schools], "extent_buffer": 2000}
 
 normal = tb_env.Scenario(highways, "./profiles/walk_normal.lua",
-                         routed_args=routed_args, name="normal")
+                         name="normal", **extent)
 flood = tb_env.Scenario(highways, "./profiles/walk_flood.lua",
-                        routed_args=routed_args, name="flood")
+                        name="flood", **extent)
 
 ## Run normal and flood scenarios in parallel
 parallel_scenarios = ParallelScenarios(normal, flood)
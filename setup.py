@@ -17,11 +17,17 @@ setuptools.setup(
     license="MIT",
     install_requires=[
         "osrm",
+        "polyline",
         "geojson",
         "geopandas",
         "overpass",
         "sh"
     ],
+    extras_require={
+        "osmium": ["osmium"],
+        "async": ["aiohttp"],
+        "io": ["pyogrio", "pyarrow"]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: MacOS",
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+
+from . import defaults
+from . import utils
+
+## aiohttp is only required for the asyncio client
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+def _require_aiohttp():
+    if aiohttp is None:
+        raise ImportError("aiohttp is required for the asyncio client (pip install aiohttp)")
+
+class AsyncClient():
+    '''
+    asyncio client of the `osrm-routed` HTTP API. Requests share a pool of keep-alive
+    connections, at most `concurrency` requests are in flight at once, and requests
+    failing with a connection error, timeout or 5xx response are retried with an
+    exponential backoff. Requires aiohttp.
+
+    The client is usually obtained from a running Scenario with `Scenario.aclient`, or used
+    implicitly by `Scenario.aroute` and `Scenario.aroute_many`.
+
+    Example
+    -------
+    >>> with scenario() as api:
+    >>>     async def main():
+    >>>         async with api.aclient(concurrency=64) as client:
+    >>>             return await client.route_many(pairs)
+    >>>
+    >>>     routes = asyncio.run(main())
+
+    Parameters
+    ----------
+    url_config : osrm.RequestConfig
+        HTTP API configuration of the server (see `Scenario.config`)
+    concurrency : int, optional
+        Maximum number of requests in flight, and of pooled connections
+    retries : int, optional
+        Number of times a failed request is retried
+    backoff : float, optional
+        Seconds to wait before the first retry, doubled at every retry
+    timeout : float, optional
+        Seconds after which a request is considered failed
+    '''
+
+    def __init__(self, url_config, concurrency=64, retries=3, backoff=0.1, timeout=60):
+        _require_aiohttp()
+
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.url_config = url_config
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = None
+        self.semaphore = None
+        self.loop = None ## Event loop of the connection pool
+        self.closer = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """Open the connection pool in the running event loop"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.loop = asyncio.get_running_loop()
+
+            ## Suspended async generators are closed when the loop shuts down (ex. at the end of
+            ## asyncio.run), which closes the pool if it is still open by then
+            self.closer = self._close_on_shutdown()
+            await self.closer.__anext__()
+
+    async def _close_on_shutdown(self):
+        try:
+            yield
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, service, coords, **params):
+        '''
+        Query an osrm-routed service and return its JSON response as a dict
+
+        Parameters
+        ----------
+        service : str
+            osrm-routed service ("route", "table", "nearest", "match", "trip")
+        coords : list of 2-floats tuple
+            Coordinates as (x, y), sent as a polyline
+        **params
+            Service query parameters. Booleans are lowercased and lists are joined with ";"
+        '''
+
+        await self.open()
+
+        url = utils.get_request_url(self.url_config, service, coords, **params)
+        headers = {"Authorization": self.url_config.auth} if getattr(self.url_config, "auth", None) else None
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url, headers=headers) as response:
+                        ## 4xx responses are OSRM errors (ex. NoRoute), not worth retrying
+                        if response.status < 500:
+                            parsed_json = await response.json(content_type=None)
+                            break
+
+                        error = "HTTP {}".format(response.status)
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as exc:
+                error = repr(exc)
+
+            if attempt == self.retries:
+                raise ConnectionError("{} request failed after {} attempts: {}".format(service, attempt + 1, error))
+
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+        if "Ok" not in parsed_json.get("code", ""):
+            raise ValueError('Error - OSRM status : {} \n Full json reponse : {}'.format(
+                parsed_json.get("code"), parsed_json))
+
+        return parsed_json
+
+    async def route(self, coord_origin, coord_dest, coord_intermediate=None,
+                    alternatives=False, steps=False, output="full", geometry="polyline",
+                    overview="simplified", annotations="true", continue_straight="default"):
+        '''
+        Compute a route between an origin and destination, with the same parameters and
+        results as `osrm.simple_route`. `geometry` can also be "polyline6", for route geometries
+        encoded with a precision of 6 decimals (see `utils.decode_polylines`)
+        '''
+
+        coords = [coord_origin] + (list(coord_intermediate) if coord_intermediate else []) + [coord_dest]
+        geometries = "geojson" if "geojson" in geometry.lower() else \
+            "polyline6" if geometry.lower() == "polyline6" else "polyline"
+
+        parsed_json = await self.request("route", coords, alternatives=alternatives, steps=steps,
+                                         overview=overview, annotations=annotations,
+                                         continue_straight=continue_straight,
+                                         geometries=geometries)
+
+        utils.decode_routes(parsed_json["routes"], geometry)
+
+        return parsed_json if output == "full" else parsed_json["routes"]
+
+    async def route_many(self, pairs, concurrency=None, return_exceptions=True, **kwargs):
+        '''
+        Compute routes for many (origin, destination) pairs concurrently. Pairs are consumed
+        lazily through a bounded queue, so a generator of pairs is never read far ahead of
+        the requests in flight.
+
+        Parameters
+        ----------
+        pairs : iterable of (2-floats tuple, 2-floats tuple)
+            (origin, destination) coordinates as (x, y)
+        concurrency : int, optional
+            Number of concurrent requests. Defaults to the client `concurrency`
+        return_exceptions : bool, optional
+            Return the exception of a failed pair in place of its route instead of raising it
+        **kwargs
+            Any additional parameters to be passed to `route`
+
+        Returns
+        -------
+        list
+            Route result of every pair, in the order of `pairs`
+        '''
+
+        await self.open()
+
+        concurrency = concurrency if concurrency else self.concurrency
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+        results = {}
+
+        async def worker():
+            while True:
+                item = await queue.get()
+
+                if item is None:
+                    return
+
+                idx, (origin, dest) = item
+
+                try:
+                    results[idx] = await self.route(origin, dest, **kwargs)
+                except Exception as exc:
+                    if not return_exceptions:
+                        raise
+                    results[idx] = exc
+
+        async def producer():
+            for item in enumerate(pairs):
+                await queue.put(item) ## Blocks while the queue is full
+
+            for i in range(concurrency):
+                await queue.put(None)
+
+        tasks = [asyncio.ensure_future(producer())] + \
+                [asyncio.ensure_future(worker()) for i in range(concurrency)]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return [results[idx] for idx in range(len(results))]
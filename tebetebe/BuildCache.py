@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import threading
+import logging
+import shutil
+import json
+import time
+import os
+
+from pathlib import Path
+
+from . import defaults
+from . import utils
+
+class BuildCache():
+    '''
+    Content-addressed store of compiled OSRM networks. Each build is kept in a
+    `<cache_dir>/<fingerprint>/` folder along with a `manifest.json` describing the
+    inputs it was compiled from. The manifest is written last, so a build is only
+    considered complete once its manifest exists.
+
+    The cache is shared by every Scenario (and Environment) pointing to the same
+    `cache_dir`, so a build is reused regardless of the Scenario name.
+
+    Parameters
+    ----------
+    cache_dir: str, optional
+        Directory to store compiled networks
+    '''
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, cache_dir=defaults.CACHE_DIR):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.cache_dir = Path(cache_dir)
+
+    def get_path(self, fingerprint):
+        """Return path of the .osrm file of a cached build"""
+        return self.cache_dir / fingerprint / "{}.osrm".format(fingerprint)
+
+    def get_manifest(self, fingerprint):
+        """Return manifest dict of a cached build, or None if it is not complete"""
+        manifest_path = self.cache_dir / fingerprint / self.MANIFEST
+
+        if not manifest_path.is_file():
+            return None
+
+        return json.loads(manifest_path.read_text())
+
+    def has(self, fingerprint):
+        """True if a complete build exists for a fingerprint, False otherwise"""
+        return self.get_manifest(fingerprint) is not None
+
+    def get_files(self, fingerprint):
+        """Return paths of all .osrm* files of a cached build"""
+        return sorted(self.get_path(fingerprint).parent.glob("{}.osrm*".format(fingerprint)))
+
+    def build(self, fingerprint, inputs, compile_fn):
+        '''
+        Compile a network into the cache. `compile_fn` is called with the .osrm path of a
+        staging folder, which is moved into place once compilation has succeeded.
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the build inputs
+        inputs: dict
+            Description of the build inputs to be recorded in the manifest
+        compile_fn: function
+            Function compiling the network to the .osrm path it is passed
+
+        Returns
+        -------
+        Path
+            Path of the cached .osrm file
+        '''
+
+        entry_dir = self.cache_dir / fingerprint
+        stage_dir = self.cache_dir / "{}.{}-{}.partial".format(fingerprint, os.getpid(),
+                                                                  threading.get_ident())
+        stage_path = stage_dir / "{}.osrm".format(fingerprint)
+
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True)
+
+        try:
+            started = time.time()
+            compile_fn(stage_path)
+
+            manifest = {"fingerprint": fingerprint,
+                        "inputs": inputs,
+                        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "build_seconds": round(time.time() - started, 2),
+                        "files": sorted(p.name for p in stage_dir.glob("{}.osrm*".format(fingerprint)))}
+
+            (stage_dir / self.MANIFEST).write_text(json.dumps(manifest, indent=2, default=str))
+
+            ## Move build into place, unless another process completed it meanwhile
+            if not self.has(fingerprint):
+                self.remove(fingerprint)
+
+                try:
+                    stage_dir.rename(entry_dir)
+                except OSError:
+                    if not self.has(fingerprint):
+                        raise
+
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+        return self.get_path(fingerprint)
+
+    def link(self, fingerprint, dst_path):
+        '''
+        Hard link (or copy) the .osrm* files of a cached build to `dst_path`, renaming
+        them after the .osrm file name of `dst_path`
+        '''
+
+        dst_path = Path(dst_path)
+        dst_path.parent.mkdir(parents=True, exist_ok=True)
+
+        for src_path in self.get_files(fingerprint):
+            dst_name = src_path.name.replace(fingerprint, dst_path.stem, 1)
+            utils.link_or_copy(src_path, dst_path.parent / dst_name)
+
+        return dst_path
+
+    def remove(self, fingerprint):
+        """Remove a build from the cache"""
+        shutil.rmtree(self.cache_dir / fingerprint, ignore_errors=True)
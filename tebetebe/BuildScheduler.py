@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import threading
+import logging
+import time
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .OverlayScenario import OverlayScenario
+from . import defaults
+
+class BuildBudget():
+    '''
+    CPU threads and memory shared by the compilation stages of many Scenarios. Each
+    stage blocks until enough memory and at least one thread are free, then runs with
+    as many threads as are available up to `stage_threads`.
+
+    Memory use of a stage is estimated as a multiple of the OSMDataset file size, as
+    given by `memory_factors`. `osrm-extract` is by far the most memory hungry stage.
+
+    Parameters
+    ----------
+    threads: int, optional
+        Total number of threads. Defaults to the number of CPUs
+    memory: int, optional
+        Total memory in bytes. Defaults to 80% of the physical memory
+    stage_threads: int, optional
+        Maximum number of threads given to a single stage. Defaults to `threads`
+    memory_factors: dict, optional
+        osrm command: estimated memory use as a multiple of the OSMDataset file size
+    '''
+
+    MEMORY_FACTORS = {"extract": 8, "partition": 3, "customize": 2, "contract": 4}
+
+    def __init__(self, threads=None, memory=None, stage_threads=None, memory_factors=None):
+        self.threads = threads if threads else os.cpu_count()
+        self.memory = memory if memory else int(self._get_physical_memory() * 0.8)
+        self.stage_threads = stage_threads if stage_threads else self.threads
+        self.memory_factors = {**self.MEMORY_FACTORS, **(memory_factors if memory_factors else {})}
+
+        self.free_threads = self.threads
+        self.free_memory = self.memory
+        self.running = 0
+        self.stages = [] ## (scenario name, command, threads, seconds)
+
+        self.condition = threading.Condition()
+
+    def estimate_memory(self, scenario, command):
+        """Return estimated memory use in bytes of an osrm command for a scenario"""
+        osm_size = scenario.osm_dataset.get_path().stat().st_size
+        return int(osm_size * self.memory_factors.get(command, 1))
+
+    @contextmanager
+    def allocate(self, scenario, command, threads=None):
+        '''
+        Context manager reserving threads and memory for a compilation stage, returning
+        the number of threads to run the stage with
+
+        Parameters
+        ----------
+        scenario: Scenario
+            Scenario being compiled
+        command: str
+            osrm command of the stage ("extract", "partition", "customize", "contract")
+        threads: int, optional
+            Exact number of threads requested by the stage. If not specified, as many
+            free threads as possible up to `stage_threads` are allocated
+        '''
+
+        memory = min(self.estimate_memory(scenario, command), self.memory)
+        wanted = min(threads if threads else self.stage_threads, self.threads)
+
+        with self.condition:
+            ## A stage always runs if nothing else is, to never block on an oversized estimate
+            self.condition.wait_for(lambda: self.running == 0 or
+                                    (self.free_memory >= memory and
+                                     self.free_threads >= (wanted if threads else 1)))
+
+            allocated = wanted if threads else max(1, min(wanted, self.free_threads))
+            self.free_threads -= allocated
+            self.free_memory -= memory
+            self.running += 1
+
+        started = time.time()
+
+        try:
+            yield allocated
+        finally:
+            with self.condition:
+                self.free_threads += allocated
+                self.free_memory += memory
+                self.running -= 1
+                self.stages.append((scenario.get_name(), command, allocated, time.time() - started))
+                self.condition.notify_all()
+
+    def _get_physical_memory(self):
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError, AttributeError):
+            return 8 * 1024 ** 3
+
+class BuildScheduler():
+    '''
+    Compile many Scenarios concurrently within a CPU thread and memory budget.
+
+    Scenarios with identical inputs are compiled once, and OverlayScenarios are compiled
+    after their base scenario. Every stage (extract, partition, customize, contract) is
+    allocated its own number of threads, passed to the osrm binaries as `--threads`.
+
+    Example
+    -------
+    >>> scheduler = tb.BuildScheduler(normal, flood, bridge, threads=32)
+    >>> scheduler()
+    >>> scheduler.get_report()
+
+    Parameters
+    ----------
+    *args
+        Arbitrary number of scenarios to be compiled
+    **kwargs
+        Arbitrary keyword arguments passed to BuildBudget (`threads`, `memory`,
+        `stage_threads`, `memory_factors`)
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.budget = BuildBudget(**kwargs)
+        self.scenarios = []
+        self.report = None
+
+        ## Overlay base scenarios must be compiled too
+        for scenario in args:
+            if isinstance(scenario, OverlayScenario) and scenario.get_base() not in self.scenarios:
+                self.scenarios.append(scenario.get_base())
+
+            if scenario not in self.scenarios:
+                self.scenarios.append(scenario)
+
+    def __call__(self):
+        '''
+        Compile all scenarios
+
+        Returns
+        -------
+        dict
+            Scenario name: True if compiled successfully, False otherwise
+        '''
+
+        started = time.time()
+        self.budget.stages = []
+        futures = {}
+        first_builds = {} ## fingerprint: future of first scenario with that fingerprint
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.scenarios))) as executor:
+            for scenario in self.scenarios:
+                fingerprint = scenario.get_fingerprint()
+
+                ## Wait for the first scenario with the same inputs, and the overlay base
+                deps = [first_builds[fingerprint]] if fingerprint in first_builds else []
+
+                if isinstance(scenario, OverlayScenario):
+                    deps.append(futures[scenario.get_base()])
+
+                futures[scenario] = executor.submit(self._build, scenario, deps)
+                first_builds.setdefault(fingerprint, futures[scenario])
+
+        results = {scenario.get_name(): future.result() for scenario, future in futures.items()}
+
+        ## Compare wall clock time against the sum of stage durations, run one after the other
+        wall_seconds = time.time() - started
+        serial_seconds = sum(stage[3] for stage in self.budget.stages)
+
+        self.report = {"scenarios": len(self.scenarios),
+                       "stages": len(self.budget.stages),
+                       "wall_seconds": round(wall_seconds, 2),
+                       "serial_seconds": round(serial_seconds, 2),
+                       "saved_seconds": round(max(0, serial_seconds - wall_seconds), 2)}
+
+        self.log.info("Compiled {} scenarios in {:.1f}s ({:.1f}s of stages run serially, {:.1f}s saved)"
+                      .format(len(self.scenarios), wall_seconds, serial_seconds, self.report["saved_seconds"]))
+
+        return results
+
+    def _build(self, scenario, deps):
+        for dep in deps:
+            dep.result()
+
+        scenario.budget = self.budget
+
+        try:
+            return scenario() is not None
+        finally:
+            scenario.budget = None
+
+    def get_report(self):
+        """Return dict of wall clock and serial stage seconds of the last run"""
+        return self.report
+
+    def get_stages(self):
+        """Return list of (scenario name, command, threads, seconds) of every stage run"""
+        return list(self.budget.stages)
@@ -41,5 +41,7 @@ class Environment():
 
         self.OSMDataset.from_overpass = partial(OSMDataset.from_overpass, **kwargs)
         self.POIDataset.from_overpass = partial(POIDataset.from_overpass, **kwargs)
+        self.POIDataset.from_osm = partial(POIDataset.from_osm, **kwargs)
+        self.POIDataset.from_osm_many = partial(POIDataset.from_osm_many, **kwargs)
 
         self.POIDataset.from_file = partial(POIDataset.from_file, **kwargs)
@@ -1,14 +1,31 @@
 #!/usr/bin/env python3
 
-import overpass
 import hashlib
 import logging
+import numpy as np
 
 from pathlib import Path
 
-from .utils import hash_
+from urllib.parse import urlencode
+
+from .utils import hash_, hash_dict, fingerprint_file, to_geometry, buffer_geometry, download
 from . import defaults
 
+try:
+    from shapely import contains_xy
+except ImportError: ## shapely < 2
+    from shapely.vectorized import contains as contains_xy
+
+## pyosmium is only required to stream the contents of an OSMDataset
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+def _require_osmium():
+    if osmium is None:
+        raise ImportError("pyosmium is required to read OSMDataset contents (pip install osmium)")
+
 class OSMDataset():
     '''
     OSM data file from which a route network will be extracted
@@ -19,12 +36,15 @@ class OSMDataset():
         Path to *.osm{.pbf} dataset
     name: str, optional
         Name of OSMDataset. If not provided, the .osm filename is used.
+    tmp_dir: str, optional
+        Temporary directory to save datasets derived from this one (eg. clipped datasets)
     '''
 
-    def __init__(self, osm_path, name=None, **kwargs):
+    def __init__(self, osm_path, name=None, tmp_dir=defaults.TMP_DIR, **kwargs):
 
         self.log = logging.getLogger(defaults.LOGGER)
         self.path = Path(osm_path)
+        self.tmp_dir = Path(tmp_dir)
 
         ## Check path exists
         if not self.path.is_file():
@@ -41,10 +61,178 @@ class OSMDataset():
         """Return route network path"""
         return self.path
 
+    def get_fingerprint(self):
+        """Return fast content fingerprint of the OSM data file"""
+        return fingerprint_file(self.path)
+
+    def get_way_nodes(self, way_ids):
+        '''
+        Stream the OSM data file and return the node ids of the given ways
+
+        Parameters
+        ----------
+        way_ids : list
+            OSM way ids
+
+        Returns
+        -------
+        dict
+            way id: list of node ids, in way order
+        '''
+
+        _require_osmium()
+
+        way_ids = set(int(way_id) for way_id in way_ids)
+        way_nodes = {}
+
+        class WayHandler(osmium.SimpleHandler):
+            def way(self, way):
+                if way.id in way_ids:
+                    way_nodes[way.id] = [node.ref for node in way.nodes]
+
+        WayHandler().apply_file(str(self.path))
+
+        missing = way_ids - set(way_nodes)
+        if missing:
+            self.log.warning("{}: Ways not found in dataset: {}".format(self.name,
+                                                                       ", ".join(str(w) for w in sorted(missing))))
+
+        return way_nodes
+
+    def clip(self, geometry, buffer=0, name=None, overwrite=False):
+        '''
+        Clip the OSM data file to a bounding box or polygon and save it as a smaller .osm.pbf.
+        Ways with at least one node inside the clip geometry are kept whole, along with
+        relations with at least one kept member.
+
+        Clipped datasets are cached in `tmp_dir` by fingerprint of the source dataset and
+        clip geometry, so they are reused across profiles and runs. Requires pyosmium.
+
+        Parameters
+        ----------
+        geometry : 4-floats tuple / shapely Polygon
+            (minx, miny, maxx, maxy) bounding box or polygon, in WGS84
+        buffer : float, optional
+            Buffer around the clip geometry, in meters
+        name : str, optional
+            Name of the clipped OSMDataset. If not provided, it is built from the dataset name
+        overwrite : bool, optional
+            Overwrite clipped dataset if it already exists on disk
+
+        Returns
+        -------
+        OSMDataset
+        '''
+
+        _require_osmium()
+
+        geometry = buffer_geometry(to_geometry(geometry), buffer)
+
+        clip_hash = hash_dict({"source": self.get_fingerprint(), "geometry": geometry.wkt})
+        out_name = name if name else "{}_clip_{}".format(self.name, clip_hash[:8])
+        out_file = self.tmp_dir / "{}.osm.pbf".format(clip_hash)
+
+        ## Honor overwrite settings
+        if out_file.is_file():
+            if overwrite:
+                self.log.info("Overwriting {}".format(out_file))
+                out_file.unlink()
+            else:
+                self.log.info("Using existing clipped OSMDataset {}".format(out_file))
+                return OSMDataset(out_file, name=out_name, tmp_dir=self.tmp_dir)
+
+        self.log.info("{}: Clipping OSMDataset to {}".format(self.name, out_name))
+
+        ## First pass: ids of nodes inside geometry, ways using them and their members
+        (minx, miny, maxx, maxy) = geometry.bounds
+        node_ids, way_ids, relation_ids, way_node_ids = set(), set(), set(), set()
+
+        class ClipHandler(osmium.SimpleHandler):
+            def __init__(self):
+                super(ClipHandler, self).__init__()
+                self.chunk = []
+
+            def flush(self):
+                if self.chunk:
+                    chunk = np.array(self.chunk)
+                    inside = contains_xy(geometry, chunk[:, 1], chunk[:, 2])
+                    node_ids.update(chunk[inside, 0].astype(np.int64).tolist())
+                    self.chunk = []
+
+            def node(self, node):
+                (lon, lat) = (node.location.lon, node.location.lat)
+
+                ## Cheap bbox test before the vectorized geometry test
+                if minx <= lon <= maxx and miny <= lat <= maxy:
+                    self.chunk.append((node.id, lon, lat))
+
+                    if len(self.chunk) >= 100000:
+                        self.flush()
+
+            def way(self, way):
+                self.flush()
+                refs = [node.ref for node in way.nodes]
+
+                if any(ref in node_ids for ref in refs):
+                    way_ids.add(way.id)
+                    way_node_ids.update(refs)
+
+            def relation(self, relation):
+                for member in relation.members:
+                    if (member.type == "n" and member.ref in node_ids) or \
+                       (member.type == "w" and member.ref in way_ids):
+                        relation_ids.add(relation.id)
+                        break
+
+        handler = ClipHandler()
+        handler.apply_file(str(self.path))
+        handler.flush()
+
+        node_ids.update(way_node_ids)
+
+        ## Second pass: write kept elements to a partial file, then move into place
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        partial_file = self.tmp_dir / "{}.partial.osm.pbf".format(clip_hash)
+
+        if partial_file.is_file():
+            partial_file.unlink()
+
+        writer = osmium.SimpleWriter(str(partial_file))
+
+        class WriteHandler(osmium.SimpleHandler):
+            def node(self, node):
+                if node.id in node_ids:
+                    writer.add_node(node)
+
+            def way(self, way):
+                if way.id in way_ids:
+                    writer.add_way(way)
+
+            def relation(self, relation):
+                if relation.id in relation_ids:
+                    writer.add_relation(relation)
+
+        try:
+            WriteHandler().apply_file(str(self.path))
+        finally:
+            writer.close()
+
+        partial_file.rename(out_file)
+
+        self.log.info("{}: Clipped to {} nodes, {} ways, {} relations".format(out_name, len(node_ids),
+                                                                              len(way_ids), len(relation_ids)))
+
+        return OSMDataset(out_file, name=out_name, tmp_dir=self.tmp_dir)
+
     @classmethod
-    def from_overpass(cls, query, name=None, overwrite=False, tmp_dir=defaults.TMP_DIR, **kwargs):
+    def from_overpass(cls, query, name=None, overwrite=False, tmp_dir=defaults.TMP_DIR,
+                      url=defaults.OVERPASS_URL, chunk_size=1 << 20, retries=3, **kwargs):
         '''
-        Initialize an OSMDataset by downloading result of an overpass query and saving as .osm
+        Initialize an OSMDataset by downloading result of an overpass query and saving as .osm.pbf
+
+        The response is streamed to disk in chunks and resumed after a dropped connection (see
+        `utils.download`), then converted to PBF, which osrm-extract reads much faster than
+        XML. Without pyosmium, the dataset is kept as .osm XML.
 
         Parameters
         ----------
@@ -56,6 +244,12 @@ class OSMDataset():
             Overwrite route network if it already exists on disk
         tmp_dir : str
             Temporary directory to save route network
+        url : str, optional
+            Overpass API interpreter URL
+        chunk_size : int, optional
+            Number of bytes downloaded at once
+        retries : int, optional
+            Number of times a dropped download is resumed
 
         Returns
         -------
@@ -67,28 +261,53 @@ class OSMDataset():
         ## Use md5 hash of query as filename if name not specified
         out_folder = Path(tmp_dir)
         out_name = name if name else hash_(query)
-        out_file = out_folder / "{}.osm".format(out_name)
+        xml_file = out_folder / "{}.osm".format(out_name)
+        out_file = out_folder / "{}.osm.pbf".format(out_name) if osmium is not None else xml_file
+
+        ## Honor overwrite settings. XML datasets saved before pyosmium was installed are reused
+        for existing_file in dict.fromkeys([out_file, xml_file]):
+            if not existing_file.is_file():
+                continue
 
-        ## Honor overwrite settings
-        if out_file.is_file():
             if overwrite:
-                logger.info("Overwriting {}".format(out_file))
-                out_file.unlink()
+                logger.info("Overwriting {}".format(existing_file))
+                existing_file.unlink()
             else:
-                logger.info("Using existing OSMDataset {}".format(out_file))
-                return cls(out_file, name=name, overwrite=overwrite, tmp_dir=tmp_dir)
+                logger.info("Using existing OSMDataset {}".format(existing_file))
+                return cls(existing_file, name=name, overwrite=overwrite, tmp_dir=tmp_dir)
 
         logger.info("Downloading OSMDataset {}".format(name))
 
-        ## Query API
-        oapi = overpass.API()
-        xml = oapi.get("[out:xml];{}".format(query),
-                       verbosity="geom",
-                       responseformat="xml",
-                       build=False)
-
-        ## Save file
+        ## Stream query response to disk
         out_folder.mkdir(parents=True, exist_ok=True)
-        out_file.write_text(xml)
+        download(url, xml_file, data=urlencode({"data": "[out:xml];{}".format(query)}).encode(),
+                 chunk_size=chunk_size, retries=retries)
+
+        if out_file != xml_file:
+            logger.info("Converting {} to PBF".format(xml_file))
+            partial_file = out_folder / "{}.partial.osm.pbf".format(out_name)
+
+            if partial_file.is_file():
+                partial_file.unlink()
+
+            writer = osmium.SimpleWriter(str(partial_file))
+
+            class ConvertHandler(osmium.SimpleHandler):
+                def node(self, node):
+                    writer.add_node(node)
+
+                def way(self, way):
+                    writer.add_way(way)
+
+                def relation(self, relation):
+                    writer.add_relation(relation)
+
+            try:
+                ConvertHandler().apply_file(str(xml_file))
+            finally:
+                writer.close()
+
+            partial_file.rename(out_file)
+            xml_file.unlink()
 
         return cls(out_file, name=name, overwrite=overwrite, tmp_dir=tmp_dir)
@@ -5,6 +5,7 @@ import atexit
 import sys
 import sh
 
+from sh import CommandNotFound
 from . import defaults
 
 class OSRM():
@@ -19,6 +20,9 @@ class OSRM():
         Output stdout from osrm commands.
     """
 
+    ## osrm-* binaries version, shared by all instances
+    _version = None
+
     def __init__(self, verbose=defaults.VERBOSE):
         self.log = logging.getLogger(defaults.LOGGER)
         self.verbose = verbose
@@ -92,6 +96,24 @@ class OSRM():
 
         return proc
 
+    def datastore(self, osrm_file=None, **kwargs):
+        '''
+        Call `osrm-datastore` to load a .osrm file into shared memory. Loading a file under
+        a `dataset_name` which is already in use atomically replaces the dataset, without
+        interrupting `osrm-routed --shared-memory` processes serving it.
+        '''
+
+        defaults = {"_bg": True,
+                    "_out": sys.stdout if self.verbose else None}
+
+        args = [osrm_file] if osrm_file else []
+        proc = self._osrm_datastore(*args, **{**defaults, **kwargs})
+
+        self._log_cmd(proc)
+        self.processes.append(proc)
+
+        return proc
+
     def routed(self, osrm_file, ready_callback, done_callback, verbose=False, **kwargs):
         '''
         Call `osrm-routed` on a .osrm file
@@ -99,7 +121,7 @@ class OSRM():
         Parameters
         ----------
         osrm_file : str
-            Path to *.osrm
+            Path to *.osrm. Set to None when serving from shared memory (`shared_memory=True`)
         ready_callback : function
             Function to be called when osrm-routed is ready for HTTP requests
         done_callback : function
@@ -112,12 +134,12 @@ class OSRM():
 
         ## Parse OSRM output line by line and exec callback when server is running
         def parse_output(line, stdin, process):
-            if line.find("running and waiting for requests"):
+            if "running and waiting for requests" in line:
                 ready_callback(process)
                 return True ## Returning True stops executing this function each line
 
         def parse_output_verbose(line, stdin, process):
-            if line.find("running and waiting for requests"):
+            if "running and waiting for requests" in line:
                 ready_callback(process)
 
             print(line)
@@ -127,16 +149,49 @@ class OSRM():
                     "_out": parse_output_verbose if verbose else parse_output,
                     "_done": done_callback}
 
-        proc = self._osrm_routed(osrm_file, **{**defaults, **kwargs})
+        args = [osrm_file] if osrm_file else []
+        proc = self._osrm_routed(*args, **{**defaults, **kwargs})
 
         self._log_cmd(proc)
         self.processes.append(proc)
 
         return proc
 
+    def routed_detached(self, osrm_file, log_path, **kwargs):
+        '''
+        Call `osrm-routed` on a .osrm file in its own session, with output written to
+        `log_path`. The process is left running when the script exits.
+
+        Parameters
+        ----------
+        osrm_file : str
+            Path to *.osrm. Set to None when serving from shared memory (`shared_memory=True`)
+        log_path : str
+            Path of the file osrm-routed output is written to
+        **kwargs
+            Any additional parameters to be passed to osrm-routed
+        '''
+
+        defaults = {"_bg": True, "_bg_exc": False, "_new_session": True,
+                    "verbosity": "INFO", "ip": "127.0.0.1",
+                    "_out": str(log_path), "_err": str(log_path)}
+
+        args = [osrm_file] if osrm_file else []
+        proc = self._osrm_routed(*args, **{**defaults, **kwargs})
+
+        self._log_cmd(proc)
+
+        return proc
+
     def get_version(self):
         '''Return OSRM binaries version'''
-        return self._osrm_extract("--version")
+        if OSRM._version is None:
+            try:
+                OSRM._version = str(self._osrm_extract("--version")).strip()
+            except Exception:
+                return "unknown"
+
+        return OSRM._version
 
     def _log_cmd(self, proc):
         '''Log command text in a debug log output'''
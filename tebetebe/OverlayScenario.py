@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import shutil
+import csv
+
+from .Scenario import Scenario
+
+class OverlayScenario(Scenario):
+    """
+    OverlayScenario is a variant of an MLD Scenario with segment speed and turn penalty
+    overrides, such as for flooded crossings or road closures.
+
+    The variant shares the `osrm-extract` and `osrm-partition` output of its base Scenario
+    and only re-runs `osrm-customize` with `--segment-speed-file` / `--turn-penalty-file`,
+    so a what-if takes seconds to compile instead of minutes. OverlayScenarios are usually
+    created with `Scenario.derive`.
+
+    Example
+    -------
+    >>> normal = tb.Scenario("./swaziland-latest.osm.pbf", "./walk_normal.lua")
+    >>>
+    >>> ## close a river ford and slow down a bridge approach
+    >>> flood = normal.derive("flood", way_speeds={123456: 0},
+    >>>                       segment_speeds={(6750683291, 6750683292): 1})
+    >>>
+    >>> with flood() as api:
+    >>>     api.simple_route()...
+
+    Parameters
+    ----------
+    base : Scenario
+        Scenario compiled with the MLD algorithm from which the variant is derived
+    name : str, optional
+        Scenario name. If not supplied, it will be built from the base scenario name
+    segment_speeds : dict, optional
+        (from OSM node id, to OSM node id): speed in km/h. Segments are directional;
+        a speed of 0 closes the segment
+    way_speeds : dict, optional
+        OSM way id: speed in km/h, applied to every segment of the way in both directions.
+        Resolving way ids requires pyosmium
+    turn_penalties : dict, optional
+        (from OSM node id, via OSM node id, to OSM node id): penalty in seconds
+    **kwargs
+        Arbitrary keyword arguments passed to Scenario. Compilation and `osrm-routed`
+        args default to those of the base scenario
+    """
+
+    ## Files written by osrm-customize when applying updates. These are copied
+    ## rather than linked from the base scenario so the base stays untouched
+    CUSTOMIZE_FILES = ["cell_metrics", "mldgr", "geometry", "datasource_names",
+                       "turn_weight_penalties", "turn_duration_penalties"]
+
+    def __init__(self, base, name=None, segment_speeds=None, way_speeds=None,
+                 turn_penalties=None, **kwargs):
+
+        if base.algorithm != "MLD":
+            raise ValueError("{}: Only MLD scenarios can be overlaid".format(base.get_name()))
+
+        self.base = base
+        self.segment_speeds = dict(segment_speeds) if segment_speeds else {}
+        self.way_speeds = dict(way_speeds) if way_speeds else {}
+        self.turn_penalties = dict(turn_penalties) if turn_penalties else {}
+
+        base_kwargs = {"tmp_dir": base.tmp_dir,
+                       "overwrite": base.overwrite,
+                       "verbose": base.OSRM.verbose,
+                       "cache_dir": base.cache.cache_dir,
+                       "engine": base.engine_name,
+                       **{"{}_args".format(cmd): dict(args) for cmd, args in base.args.items()}}
+
+        super(OverlayScenario, self).__init__(base.osm_dataset, base.routing_profile,
+                                              name=name if name else "{}_overlay".format(base.get_name()),
+                                              algorithm="MLD", **{**base_kwargs, **kwargs})
+
+    def _compile(self, osrm_path):
+        '''Link the compiled base scenario into `osrm_path` and customize it with the overrides'''
+
+        ## Make sure the base scenario is compiled and cached
+        base_fingerprint = self.base.get_fingerprint()
+
+        if not self.base.cache.has(base_fingerprint):
+            self.base()
+
+        self.base.cache.link(base_fingerprint, osrm_path)
+
+        for ext in self.CUSTOMIZE_FILES:
+            customize_file = osrm_path.parent / "{}.{}".format(osrm_path.name, ext)
+
+            if customize_file.is_file():
+                customize_file.unlink()
+                shutil.copy2(self.base.cache.get_path(base_fingerprint).parent /
+                             "{}.osrm.{}".format(base_fingerprint, ext), customize_file)
+
+        customize_args = {}
+        segment_speeds = self.get_segment_speeds()
+
+        if segment_speeds:
+            speeds_path = osrm_path.parent / "segment_speeds.csv"
+
+            with open(speeds_path, "w", newline="") as f:
+                csv.writer(f).writerows([(n0, n1, speed) for (n0, n1), speed in segment_speeds.items()])
+
+            customize_args["segment_speed_file"] = speeds_path
+
+        if self.turn_penalties:
+            penalties_path = osrm_path.parent / "turn_penalties.csv"
+
+            with open(penalties_path, "w", newline="") as f:
+                csv.writer(f).writerows([(*turn, penalty) for turn, penalty in self.turn_penalties.items()])
+
+            customize_args["turn_penalty_file"] = penalties_path
+
+        self._run_stage("customize", osrm_path, **customize_args)
+
+    def get_segment_speeds(self):
+        '''
+        Return all segment speed overrides as (from OSM node id, to OSM node id): speed in km/h,
+        with `way_speeds` resolved into the segments of each way
+        '''
+
+        segment_speeds = {}
+
+        if self.way_speeds:
+            way_nodes = self.osm_dataset.get_way_nodes(self.way_speeds.keys())
+
+            for way_id, nodes in way_nodes.items():
+                for n0, n1 in zip(nodes[:-1], nodes[1:]):
+                    segment_speeds[(n0, n1)] = self.way_speeds[way_id]
+                    segment_speeds[(n1, n0)] = self.way_speeds[way_id]
+
+        ## Explicit segment speeds take precedence over way speeds
+        return {**segment_speeds, **self.segment_speeds}
+
+    def get_base(self):
+        """Return the base scenario"""
+        return self.base
+
+    def get_inputs(self):
+        """Return dict of all inputs which determine the compiled network"""
+        return {"base": self.base.get_fingerprint(),
+                "segment_speeds": sorted([*segment, speed] for segment, speed in self.segment_speeds.items()),
+                "way_speeds": sorted([way_id, speed] for way_id, speed in self.way_speeds.items()),
+                "turn_penalties": sorted([*turn, penalty] for turn, penalty in self.turn_penalties.items()),
+                "args": {"customize": self._get_command_args("customize")}}
@@ -1,15 +1,72 @@
 #!/usr/bin/env python3
 
 import geojson as gj
+import geopandas
 import overpass
 import logging
+import json
 
-from geopandas import GeoDataFrame
+import numpy as np
+
+from geopandas import GeoDataFrame, GeoSeries
+from pandas import DataFrame
+from itertools import islice
 from pathlib import Path
 
-from .utils import hash_
+from .utils import hash_, hash_dict
 from . import defaults
 
+## pyogrio and pyarrow speed up reading POIDatasets, and pyarrow is required for GeoParquet
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+## pyosmium is only required to extract POIs from an OSMDataset
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+PARQUET_SUFFIXES = (".parquet", ".geoparquet")
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("pyarrow is required to read and write GeoParquet POIDatasets (pip install pyarrow)")
+
+def _require_osmium():
+    if osmium is None:
+        raise ImportError("pyosmium is required to extract POIs from an OSMDataset (pip install osmium)")
+
+def _match_tags(tags, tag_filter):
+    '''Return whether OSM tags match every key: value (str, list of str, or True for any value) of a filter'''
+
+    for (key, value) in tag_filter.items():
+        tag = tags.get(key)
+
+        if tag is None or (value is not True and tag not in (value if isinstance(value, (list, tuple, set)) else [value])):
+            return False
+
+    return True
+
+def _ring_centroid(coords):
+    '''Return the centroid of a closed ring of (x, y) coordinates, or the mean of its vertices if it has no area'''
+
+    (x, y) = (coords[:, 0] - coords[0, 0], coords[:, 1] - coords[0, 1])
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = cross.sum() / 2
+
+    if area == 0:
+        return tuple(coords[:-1].mean(axis=0))
+
+    return (coords[0, 0] + ((x[:-1] + x[1:]) * cross).sum() / (6 * area),
+            coords[0, 1] + ((y[:-1] + y[1:]) * cross).sum() / (6 * area))
+
 class POIDataset(GeoDataFrame):
     '''
     Extension of a GeoDataFrame which stores Points only, to be used as origin, destination,
@@ -33,13 +90,33 @@ class POIDataset(GeoDataFrame):
         """Return POI dataset name"""
         return self._metadata["name"]
 
+    def snap(self, scenario):
+        '''
+        Snap the points to the network of a running scenario, once per scenario network (see
+        `Scenario.snap`)
+
+        Parameters
+        ----------
+        scenario: Scenario / ScenarioPool
+            Running scenario
+
+        Returns
+        -------
+        DataFrame
+            `hint`, snapped `x` and `y` and snapping `distance` in meters of every point
+        '''
+
+        snaps = scenario.snap(list(zip(self.geometry.x, self.geometry.y)))
+
+        return DataFrame({"hint": snaps["hint"],
+                          "x": snaps["location"][:, 0],
+                          "y": snaps["location"][:, 1],
+                          "distance": snaps["distance"]}, index=self.index)
+
     def _filter_points(self, gdf):
         '''Filter out any records in GeoDataFrame that are not Point geometries'''
 
-        gdf_geom_types = gdf.apply(lambda r: r.geometry.type, axis=1)
-        gdf_points = gdf[gdf_geom_types == "Point"]
-
-        return gdf_points
+        return gdf[gdf.geom_type == "Point"]
 
     @classmethod
     def from_overpass(cls, query, name=None, overwrite=False, tmp_dir=defaults.TMP_DIR, **kwargs):
@@ -55,7 +132,8 @@ class POIDataset(GeoDataFrame):
         overwrite : bool
             Overwrite POIDataset if it already exists on disk
         tmp_dir : str
-            Temporary directory to save POIDataset
+            Temporary directory to save POIDataset. POIDatasets are saved as GeoParquet if
+            pyarrow is installed, GeoJSON otherwise
         '''
         
         logger = logging.getLogger(defaults.LOGGER)
@@ -63,16 +141,19 @@ class POIDataset(GeoDataFrame):
         ## Use md5 hash of query as filename if name not specified
         out_folder = Path(tmp_dir)
         out_name = name if name else hash_(query)
-        out_file = out_folder / "{}.geojson".format(out_name)
+        out_file = out_folder / "{}.{}".format(out_name, "parquet" if pq is not None else "geojson")
+
+        ## Honor overwrite settings. GeoJSON datasets saved before pyarrow was installed are reused
+        for existing_file in dict.fromkeys([out_file, out_folder / "{}.geojson".format(out_name)]):
+            if not existing_file.is_file():
+                continue
 
-        ## Honor overwrite settings
-        if out_file.is_file():
             if overwrite:
-                logger.info("Overwriting {}".format(out_file))
-                out_file.unlink()
+                logger.info("Overwriting {}".format(existing_file))
+                existing_file.unlink()
             else:
-                logger.info("Using existing POIDataset {}".format(out_file))
-                return cls.from_file(out_file, name=out_name).set_index("id")
+                logger.info("Using existing POIDataset {}".format(existing_file))
+                return cls.from_file(existing_file, name=out_name).set_index("id")
 
 
         logger.info("Downloading POIDataset {}".format(name))
@@ -107,23 +188,277 @@ class POIDataset(GeoDataFrame):
             features.append(feat)
 
         pois = gj.FeatureCollection(features)
+        dataset = cls.from_features(pois.features, name=out_name, crs={'init': 'epsg:4326'})
 
         ## Cache POIs for next time
         out_folder.mkdir(parents=True, exist_ok=True)
-        out_file.write_text(gj.dumps(pois))
 
-        return cls.from_features(pois.features, name=out_name, crs={'init': 'epsg:4326'}) \
-                  .set_index("id")
+        if out_file.suffix in PARQUET_SUFFIXES:
+            GeoDataFrame(dataset).to_parquet(out_file, write_covering_bbox=True)
+        else:
+            out_file.write_text(gj.dumps(pois))
+
+        return dataset.set_index("id")
 
     @classmethod
-    def from_file(cls, path, name=None, **kwargs):
-        '''Initialize POIDataset from file. If no name is given, the filename will be used'''
+    def from_osm(cls, osm_dataset, tag_filter, name=None, overwrite=False, tmp_dir=defaults.TMP_DIR, **kwargs):
+        '''
+        Initialize POIDataset from the nodes and closed ways of a local OSMDataset matching a tag
+        filter, without any Overpass API request. Closed ways are included as their centroid.
+
+        Extracted POIs are cached in `tmp_dir` by fingerprint of the OSM dataset and tag filter.
+        Requires pyosmium.
+
+        Parameters
+        ----------
+        osm_dataset : OSMDataset
+            OSM dataset to extract POIs from
+        tag_filter : dict
+            Tags the POIs must all have, as key: value, key: list of values or key: True for any
+            value. ex. {"amenity": ["school", "clinic"]}, {"building": True}
+        name : str
+            Name of the POI dataset
+        overwrite : bool
+            Overwrite POIDataset if it already exists on disk
+        tmp_dir : str
+            Temporary directory to save POIDataset
+        '''
+
+        name = name if name else "{}_{}".format(osm_dataset.get_name(), hash_dict(tag_filter)[:8])
+
+        return cls.from_osm_many(osm_dataset, {name: tag_filter}, overwrite=overwrite, tmp_dir=tmp_dir,
+                                 **kwargs)[name]
+
+    @classmethod
+    def from_osm_many(cls, osm_dataset, tag_filters, overwrite=False, tmp_dir=defaults.TMP_DIR, **kwargs):
+        '''
+        Initialize several POIDatasets from a local OSMDataset in a single pass over the file
+        (see `from_osm`)
+
+        Parameters
+        ----------
+        osm_dataset : OSMDataset
+            OSM dataset to extract POIs from
+        tag_filters : dict
+            POI dataset name: tag filter
+        overwrite : bool
+            Overwrite POIDatasets if they already exist on disk
+        tmp_dir : str
+            Temporary directory to save POIDatasets
+
+        Returns
+        -------
+        dict
+            POI dataset name: POIDataset
+        '''
+
+        logger = logging.getLogger(defaults.LOGGER)
+
+        out_folder = Path(tmp_dir)
+        suffix = "parquet" if pq is not None else "geojson"
+        fingerprint = osm_dataset.get_fingerprint()
+        out_files = {name: out_folder / "{}.{}".format(hash_dict({"source": fingerprint, "filter": tag_filter}), suffix)
+                     for (name, tag_filter) in tag_filters.items()}
+
+        datasets = {}
+
+        ## Honor overwrite settings
+        for (name, out_file) in out_files.items():
+            if out_file.is_file():
+                if overwrite:
+                    logger.info("Overwriting {}".format(out_file))
+                    out_file.unlink()
+                else:
+                    logger.info("Using existing POIDataset {}".format(out_file))
+                    datasets[name] = cls(cls._read_file(out_file).set_index("id"), name=name)
+
+        pending = {name: tag_filter for (name, tag_filter) in tag_filters.items() if name not in datasets}
 
-        gdf = GeoDataFrame.from_file(path, **kwargs)
+        if not pending:
+            return datasets
+
+        _require_osmium()
+
+        logger.info("{}: Extracting POIDatasets {}".format(osm_dataset.get_name(), ", ".join(pending)))
+
+        records = {name: [] for name in pending}
+
+        def add_element(element, coords):
+            matched = [name for (name, tag_filter) in pending.items() if _match_tags(element.tags, tag_filter)]
+
+            if matched:
+                properties = {"id": element.id, **{tag.k: tag.v for tag in element.tags}}
+
+                for name in matched:
+                    records[name].append((properties, coords))
+
+        class POIHandler(osmium.SimpleHandler):
+            def node(self, node):
+                if len(node.tags):
+                    add_element(node, (node.location.lon, node.location.lat))
+
+            def way(self, way):
+                if len(way.tags) and way.is_closed():
+                    try:
+                        ring = np.array([(n.lon, n.lat) for n in way.nodes])
+                    except osmium.InvalidLocationError: ## Nodes missing from a clipped dataset
+                        return
+
+                    add_element(way, _ring_centroid(ring))
+
+        POIHandler().apply_file(str(osm_dataset.get_path()), locations=True)
+
+        out_folder.mkdir(parents=True, exist_ok=True)
+
+        for (name, pois) in records.items():
+            gdf = GeoDataFrame([properties for (properties, coords) in pois], crs="EPSG:4326",
+                               geometry=GeoSeries.from_xy([c[0] for (p, c) in pois], [c[1] for (p, c) in pois]))
+
+            if not len(gdf):
+                gdf["id"] = np.array([], dtype=np.int64)
+
+            ## Cache POIs for next time
+            if out_files[name].suffix in PARQUET_SUFFIXES:
+                gdf.to_parquet(out_files[name], write_covering_bbox=True)
+            else:
+                gdf.to_file(out_files[name], driver="GeoJSON")
+
+            logger.info("{}: Extracted {} POIs".format(name, len(gdf)))
+            datasets[name] = cls(gdf.set_index("id"), name=name)
+
+        return {name: datasets[name] for name in tag_filters}
+
+    @classmethod
+    def from_file(cls, path, name=None, columns=None, bbox=None, **kwargs):
+        '''
+        Initialize POIDataset from file. If no name is given, the filename will be used
+
+        GeoParquet files (`.parquet`) are read with pyarrow. Other formats are read with
+        pyogrio if installed (through Arrow if pyarrow is installed too), fiona otherwise.
+
+        Parameters
+        ----------
+        path : str
+            Path of the dataset
+        name : str, optional
+            Name of the POI dataset
+        columns : list of str, optional
+            Only read these attribute columns
+        bbox : 4-floats tuple, optional
+            Only read the features intersecting (xmin, ymin, xmax, ymax)
+        '''
+
+        gdf = cls._read_file(path, columns=columns, bbox=bbox, **kwargs)
         gdf_points = cls._filter_points(cls, gdf)
 
         return cls(gdf_points, name=name if name else Path(path).stem)
 
+    @classmethod
+    def iter_file(cls, path, chunk_size=100000, name=None, columns=None, bbox=None, **kwargs):
+        '''
+        Iterate over a file as POIDatasets of at most `chunk_size` records, for datasets which
+        don't fit in memory (see `from_file`). The file is read once as a stream: GeoParquet
+        files in row batches with pyarrow, other formats in Arrow batches with pyogrio and
+        pyarrow if installed, feature by feature with fiona otherwise
+
+        Parameters
+        ----------
+        path : str
+            Path of the dataset
+        chunk_size : int, optional
+            Number of records per chunk, before filtering out non-Point geometries
+        name : str, optional
+            Name of the POI datasets. If no name is given, the filename will be used
+        columns : list of str, optional
+            Only read these attribute columns
+        bbox : 4-floats tuple, optional
+            Only read the features intersecting (xmin, ymin, xmax, ymax)
+        '''
+
+        path = Path(path)
+        name = name if name else path.stem
+
+        if path.suffix in PARQUET_SUFFIXES:
+            _require_pyarrow()
+
+            parquet = pq.ParquetFile(path)
+            geo = json.loads(parquet.schema_arrow.metadata[b"geo"])
+            geom_col = geo["primary_column"]
+            crs = geo["columns"][geom_col].get("crs", "EPSG:4326")
+
+            batches = parquet.iter_batches(batch_size=chunk_size,
+                                           columns=None if columns is None else [*columns, geom_col])
+
+            for batch in batches:
+                df = batch.to_pandas()
+                gdf = GeoDataFrame(df.drop(columns=geom_col), crs=crs,
+                                   geometry=GeoSeries.from_wkb(df[geom_col].values))
+
+                if bbox is not None:
+                    gdf = gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+
+                yield cls(cls._filter_points(cls, gdf), name=name)
+
+            return
+
+        if pyogrio is not None and pq is not None:
+            with pyogrio.open_arrow(path, columns=columns, bbox=bbox, batch_size=chunk_size,
+                                    use_pyarrow=True, **kwargs) as (meta, reader):
+                geom_col = meta["geometry_name"] or "wkb_geometry"
+
+                for batch in reader:
+                    df = batch.to_pandas()
+                    gdf = GeoDataFrame(df.drop(columns=geom_col), crs=meta["crs"],
+                                       geometry=GeoSeries.from_wkb(df[geom_col].values))
+
+                    yield cls(cls._filter_points(cls, gdf), name=name)
+
+            return
+
+        import fiona
+
+        with fiona.open(path, **kwargs) as source:
+            features = source.filter(bbox=bbox) if bbox is not None else iter(source)
+
+            while True:
+                chunk = list(islice(features, chunk_size))
+
+                if not chunk:
+                    return
+
+                gdf = GeoDataFrame.from_features(chunk, crs=source.crs)
+                gdf = gdf if columns is None else gdf[[*columns, gdf.geometry.name]]
+
+                yield cls(cls._filter_points(cls, gdf), name=name)
+
+    @staticmethod
+    def _read_file(path, columns=None, bbox=None, **kwargs):
+        '''Read a GeoDataFrame from a GeoParquet file, or any file supported by pyogrio/fiona'''
+
+        path = Path(path)
+
+        if path.suffix in PARQUET_SUFFIXES:
+            _require_pyarrow()
+
+            geo = json.loads(pq.read_schema(path).metadata[b"geo"])
+            geom_col = geo["primary_column"]
+            columns = None if columns is None else [*columns, geom_col]
+
+            ## Only files written with a bbox covering column can be filtered while reading
+            if bbox is not None and "covering" in geo["columns"][geom_col]:
+                return geopandas.read_parquet(path, columns=columns, bbox=bbox, **kwargs)
+
+            gdf = geopandas.read_parquet(path, columns=columns, **kwargs)
+            return gdf if bbox is None else gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+
+        elif pyogrio is not None:
+            return geopandas.read_file(path, engine="pyogrio", columns=columns, bbox=bbox,
+                                       use_arrow=pq is not None, **kwargs)
+
+        else:
+            gdf = GeoDataFrame.from_file(path, bbox=bbox, **kwargs)
+            return gdf if columns is None else gdf[[*columns, gdf.geometry.name]]
+
     @classmethod
     def from_features(cls, features, name=None, **kwargs):
         '''Initialize POIDataset from GeoJSON features'''
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import threading
+import sqlite3
+import logging
+import json
+import time
+import io
+
+import numpy as np
+
+from pathlib import Path
+
+from . import defaults
+from . import utils
+
+class ResultCache():
+    '''
+    Persistent on-disk cache of routing results (`table` tiles, routes), stored in SQLite.
+
+    Results are keyed by the fingerprint of the network which computed them, a hash of the
+    request coordinates and the request options (see `get_key`), so a result is reused across
+    runs and analyses for as long as the network is unchanged, regardless of the Scenario name.
+    When the cache grows over `max_size`, the least recently used results are evicted.
+
+    Example
+    -------
+    >>> cache = tb.ResultCache(max_size=2 * 1024 ** 3)
+    >>> comparison = RouteComparison(homesteads, schools, result_cache=cache)
+    >>> comparison.get_difference(normal, flood) ## reruns skip cached table tiles
+    >>> cache.get_stats()
+
+    Parameters
+    ----------
+    path: str, optional
+        Path of the SQLite database
+    max_size: int, optional
+        Maximum size in bytes of the cached results. None for no limit
+    '''
+
+    def __init__(self, path=defaults.RESULT_CACHE, max_size=1024 ** 3):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.path = Path(path)
+        self.max_size = max_size
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+                               key TEXT PRIMARY KEY,
+                               value BLOB NOT NULL,
+                               size INTEGER NOT NULL,
+                               accessed REAL NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+        self.size = self._get_size()
+        self.stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @staticmethod
+    def get_key(fingerprint, service, coords, **options):
+        '''
+        Return the cache key of a request
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the network serving the request (see `Scenario.get_network_fingerprint`)
+        service: str
+            osrm-routed service ("table", "route", ...)
+        coords: list of 2-floats tuple
+            Request coordinates as (x, y)
+        **options
+            Any request options affecting the result
+        '''
+
+        coords_hash = utils.hash_bytes(np.asarray(coords, dtype=np.float64).tobytes())
+
+        return utils.hash_dict({"fingerprint": fingerprint, "service": service,
+                                "coords": coords_hash, "options": options})
+
+    def get(self, key):
+        """Return a cached result, or None if it is not cached"""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            self.stats["hits"] += 1
+            self.db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+
+        return self._loads(row[0])
+
+    def put(self, key, value):
+        '''
+        Cache a result
+
+        Parameters
+        ----------
+        key: str
+            Cache key (see `get_key`)
+        value: np.ndarray / dict
+            Array, or JSON-serializable result
+        '''
+
+        data = self._dumps(value)
+
+        with self.lock:
+            ## Replaced results no longer count towards the size
+            old = self.db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+
+            self.db.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                            (key, data, len(data), time.time()))
+            self.stats["puts"] += 1
+            self.size += len(data) - (old[0] if old else 0)
+
+            if self.max_size is not None and self.size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """Remove all cached results"""
+        with self.lock:
+            self.db.execute("DELETE FROM results")
+            self.size = 0
+
+    def get_stats(self):
+        """Return dict of hits, misses, puts, evictions, hit rate and size in bytes"""
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+
+            return {**self.stats,
+                    "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                    "size": self.size}
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.db.close()
+
+    ##
+    ## Utils
+
+    def _get_size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _evict(self):
+        '''Evict least recently used results down to 90% of `max_size`'''
+
+        ## Other processes may have added or evicted results meanwhile
+        self.size = self._get_size()
+        excess = self.size - int(self.max_size * 0.9)
+
+        if excess <= 0:
+            return
+
+        evicted = []
+
+        for (key, size) in self.db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            evicted.append((key,))
+            excess -= size
+
+            if excess <= 0:
+                break
+
+        self.db.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.stats["evictions"] += len(evicted)
+        self.size = self._get_size()
+
+        self.log.debug("Evicted {} results from {}".format(len(evicted), self.path))
+
+    def _dumps(self, value):
+        if isinstance(value, np.ndarray):
+            buffer = io.BytesIO()
+            np.save(buffer, value, allow_pickle=False)
+            return b"N" + buffer.getvalue()
+        else:
+            return b"J" + json.dumps(value).encode()
+
+    def _loads(self, data):
+        data = bytes(data)
+
+        if data[:1] == b"N":
+            return np.load(io.BytesIO(data[1:]), allow_pickle=False)
+        else:
+            return json.loads(data[1:].decode())
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import hashlib
 import logging
+import threading
+import string
+import shutil
+import os
 
 from pathlib import Path
 from . import defaults
@@ -14,6 +19,9 @@ class RoutingProfile():
     Check out the osrm-backend wiki for more information!
     https://github.com/Project-OSRM/osrm-backend/wiki/Profiles
 
+    A profile can also be a template with `${param}` placeholders (see `string.Template`),
+    rendered into variants with `render`, ex. `local walking_speed = ${walking_speed}`
+
     Parameters
     ----------
     lua_path: str
@@ -47,3 +55,73 @@ class RoutingProfile():
     def get_path(self):
         """Return path of routing profile"""
         return self.path
+
+    def get_fingerprint(self):
+        """
+        Return md5 hash of the profile script and every .lua script under its `lib/`
+        directory, which OSRM profiles may `require`
+        """
+
+        md5 = hashlib.md5(self.path.read_bytes())
+
+        for lib_path in sorted((self.path.parent / "lib").glob("**/*.lua")):
+            md5.update(lib_path.relative_to(self.path.parent).as_posix().encode())
+            md5.update(lib_path.read_bytes())
+
+        return md5.hexdigest()
+
+    def render(self, name=None, tmp_dir=defaults.TMP_DIR, **params):
+        '''
+        Render a template profile with parameter values, and return the rendered profile
+
+        Values are written as Lua literals: booleans as `true`/`false`, None as `nil` and
+        anything else as is (quote strings in the template). Renders are saved in `tmp_dir`
+        by hash of their contents, next to a link to the template's `lib/` directory, so that
+        identical renders share a file and a fingerprint, and a compiled build.
+
+        Parameters
+        ----------
+        name: str, optional
+            Name of the rendered profile. Defaults to the template name and a hash of the render
+        tmp_dir: str, optional
+            Temporary directory to save the rendered profile
+        **params
+            Value of every `${param}` of the template
+
+        Returns
+        -------
+        RoutingProfile
+        '''
+
+        def to_lua(value):
+            if isinstance(value, bool):
+                return "true" if value else "false"
+            return "nil" if value is None else str(value)
+
+        try:
+            lua = string.Template(self.path.read_text()).substitute({k: to_lua(v) for k, v in params.items()})
+        except KeyError as exc:
+            raise ValueError("{}: Missing profile parameter {}".format(self.name, exc)) from exc
+
+        render_hash = hashlib.md5(lua.encode()).hexdigest()
+        render_dir = Path(tmp_dir) / "profiles" / render_hash
+        render_path = render_dir / self.path.name
+
+        if not render_path.is_file():
+            render_dir.mkdir(parents=True, exist_ok=True)
+            lib_dir = self.path.parent.resolve() / "lib"
+
+            if lib_dir.is_dir() and not (render_dir / "lib").exists():
+                try:
+                    os.symlink(str(lib_dir), str(render_dir / "lib"), target_is_directory=True)
+                except FileExistsError:
+                    pass
+                except OSError: ## No symlink support
+                    shutil.copytree(str(lib_dir), str(render_dir / "lib"), dirs_exist_ok=True)
+
+            ## Write to a partial file first, as another thread may render the same profile
+            partial_path = render_dir / "{}.{}.{}.partial".format(self.path.name, os.getpid(), threading.get_ident())
+            partial_path.write_text(lua)
+            os.replace(str(partial_path), str(render_path))
+
+        return RoutingProfile(render_path, name=name if name else "{}_{}".format(self.name, render_hash[:8]))
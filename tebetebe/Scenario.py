@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
 import subprocess
+import threading
+import asyncio
 import logging
+import json
 import shutil
 import osrm
 import time
@@ -11,10 +14,16 @@ import sh
 from contextlib import AbstractContextManager
 from urllib.error import HTTPError
 from sh import CommandNotFound
-from functools import partial
+from geopandas import GeoDataFrame
+from shapely.geometry.base import BaseGeometry
 from pathlib import Path
 
 from .RoutingProfile import RoutingProfile
+from .ServerRegistry import ServerRegistry
+from .AsyncClient import AsyncClient
+from .BuildCache import BuildCache
+from .SnapCache import SnapCache
+from .engines import ENGINES, HTTPEngine
 from .OSMDataset import OSMDataset
 from .OSRM import OSRM
 from . import defaults
@@ -31,7 +40,8 @@ class Scenario():
     to query that API.
 
     The HTTP API methods (`match`, `nearest`, `simple_route`, `table`, `trip`) are provided by
-    the `python-osrm` module (https://github.com/ustroetz/python-osrm)
+    the `python-osrm` module (https://github.com/ustroetz/python-osrm). Alternatively, simple
+    routes can be computed in-process through the libosrm bindings (see `engine`)
 
     Example
     -------
@@ -58,8 +68,40 @@ class Scenario():
     tmp_dir : str, optional
         Temporary directory to store files generated by osrm binaries
     overwrite: bool, optional
-        Overwrite scenario if .osrm* files already exist. Otherwise, the existing .osrm* files
-        will be used.
+        Recompile scenario even if an up-to-date build already exists. Otherwise, an existing
+        build compiled from identical inputs will be used.
+    cache_dir : str, optional
+        Directory of the build cache shared between scenarios. Builds are keyed by a fingerprint
+        of the OSMDataset, RoutingProfile (and its `lib/*.lua` includes), algorithm, compilation
+        args and OSRM version, and are reused across scenario names and Environments.
+    shared_memory : bool, optional
+        Serve the scenario from shared memory: the compiled network is loaded once with
+        `osrm-datastore` under the scenario name, and `osrm-routed --shared-memory` serves it.
+        Several scenarios can be served side by side, and a dataset can be hot-swapped to a
+        freshly compiled network with `swap`. Shared memory is released once the last scenario
+        (or ScenarioPool) of the process serving it exits, unless a persistent server started by
+        the process still serves a dataset.
+    persistent : bool / ServerRegistry, optional
+        Attach to a long-lived `osrm-routed` server started by any Python process for the same
+        scenario build, or start one and leave it running on exit. Pass a ServerRegistry to
+        configure idle-timeout and memory cap eviction
+    extent : POIDataset / list / RouteComparison / 4-floats tuple / shapely Polygon, optional
+        Limit the OSMDataset to an extent before compilation, so only the part of the network
+        reachable by an analysis is compiled. Either POIDataset(s) whose points define the
+        extent, a RouteComparison (its origins and dests), a (minx, miny, maxx, maxy) bounding
+        box or a polygon
+    extent_method : str, optional
+        Extent of POIDatasets and analyses, either "hull" (convex hull) or "bbox"
+    extent_buffer : float, optional
+        Detour buffer around the extent, in meters. Roads leading to points on the edge of the
+        extent are only kept within the buffer. Extents without area (ex. a single point) are
+        buffered by at least `defaults.EXTENT_BUFFER`
+    engine : str, optional
+        Query engine, either "http" to query the `osrm-routed` HTTP API, or "libosrm" to also
+        load the network in-process with the `pyosrm` libosrm bindings and skip the HTTP
+        round-trip of `simple_route` calls with default options. Other routes and services
+        are still answered by `osrm-routed` (see `LibOSRMEngine`). Unless `shared_memory` is
+        used, the network is loaded both by `osrm-routed` and in-process
     verbose: bool, optional
         Print output of OSRM compilation
     **kwargs
@@ -68,17 +110,43 @@ class Scenario():
         of key:values to be passed
     """
 
+    ## Shared memory datasets loaded by this process, shared by all Scenarios
+    _datasets = {} ## dataset name: fingerprint of the network loaded under that name
+    _dataset_users = {} ## dataset name: number of entered scenarios and pools serving it
+    _pinned = {} ## dataset name: (ServerRegistry, server key) of the persistent server serving it
+    _datasets_lock = threading.RLock()
+
     def __init__(self, osm_dataset, routing_profile,
                  name=None, algorithm="MLD", 
                  tmp_dir=defaults.TMP_DIR,
                  overwrite=defaults.OVERWRITE,
                  verbose=defaults.VERBOSE,
+                 cache_dir=defaults.CACHE_DIR,
+                 shared_memory=False,
+                 persistent=False,
+                 extent=None, extent_method="hull", extent_buffer=defaults.EXTENT_BUFFER,
+                 engine="http",
                  **kwargs):
 
         self.log = logging.getLogger(defaults.LOGGER)
         self.algorithm = algorithm.upper()
         self.tmp_dir = Path(tmp_dir)
         self.overwrite = overwrite
+        self.cache = BuildCache(cache_dir)
+        self.budget = None ## Set by BuildScheduler
+        self.shared_memory = shared_memory
+        self.registry = persistent if isinstance(persistent, ServerRegistry) \
+            else ServerRegistry() if persistent else None
+        self.server = None ## Registry entry of the persistent server
+        self.dataset_attached = False ## Whether entering the scenario counted a shared memory dataset user
+        self.engine = None ## Query engine, set when entering the scenario
+        self.async_client = None ## Connection pool of `aroute`, bound to an event loop
+        self.snap_cache = SnapCache()
+
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine {}, use one of {}".format(engine, list(ENGINES)))
+
+        self.engine_name = engine
 
         ## Handle if params are passed as string
         if isinstance(osm_dataset, str):
@@ -89,6 +157,7 @@ class Scenario():
 
         self.osm_dataset = osm_dataset
         self.routing_profile = routing_profile
+        self.extent = self._get_extent(extent, extent_method, extent_buffer)
 
         ## Initialize / check OSRM Binaries
         self.OSRM = OSRM(verbose=verbose)
@@ -98,6 +167,7 @@ class Scenario():
                                                      self.routing_profile.get_name())
         self.path = self.tmp_dir / self.name / "{}.osrm".format(self.name)
         self.path.parent.mkdir(parents=True, exist_ok=True) # Make sure output_dir exists
+        self.manifest_path = self.path.parent / "{}.manifest.json".format(self.name)
 
         ## Add osrm executable args if they are passed
         self.args = {}
@@ -114,127 +184,424 @@ class Scenario():
         Compile OSMDataset and RoutingProfile into an OSRM routable network (.osrm file)
         '''
 
-        ## Honor overwrite settings
-        if self.path.is_file():
+        try:
+            fingerprint = self.get_fingerprint()
+
+            ## Honor overwrite settings
             if self.overwrite:
                 self.log.info("{}: Overwriting scenario".format(self.name))
+                self.cache.remove(fingerprint)
 
-                ## Remove all .osrm* files
-                for osrm_file in self.path.parent.glob("{}.osrm*".format(self.name)):
-                    osrm_file.unlink()
-            else:
+            elif self.is_compiled(fingerprint):
                 self.log.info("{}: Using existing scenario".format(self.name))
                 return self
 
+            if self.cache.has(fingerprint):
+                self.log.info("{}: Using cached build {}".format(self.name, fingerprint[:8]))
+            else:
+                self.log.info("{}: Compiling scenario ({})".format(self.name, self.algorithm))
+
+                if self.routing_profile.is_default():
+                    self.log.warning("{}: Default {} profile may not be accurate for your use case".format(self.name,
+                                                                                                           self.routing_profile.get_name()))
+
+                self.cache.build(fingerprint, self.get_inputs(), self._compile)
+
+            ## Remove all previous .osrm* files and link the cached build in their place
+            for osrm_file in self.path.parent.glob("{}.osrm*".format(self.name)):
+                osrm_file.unlink()
+
+            self.cache.link(fingerprint, self.path)
+            shutil.copyfile(self.cache.get_path(fingerprint).parent / BuildCache.MANIFEST,
+                            self.manifest_path)
+
+            return self
+
+        except Exception as exc:
+            ## TODO custom handle more common exception
+            self.log.error(exc)
+
+    def _compile(self, osrm_path):
+        '''Run the OSRM binaries to compile the scenario into `osrm_path`'''
+
+        ## Clip OSMDataset to the scenario extent
+        osm_dataset = self.osm_dataset if self.extent is None else self.osm_dataset.clip(self.extent)
+
+        ## osrm-extract generates osrm file in same folder as OSMDataset, so
+        ## link the OSMDataset next to osrm_path under the same name
+        network_path = osm_dataset.get_path().resolve()
+        network_ext = "".join(network_path.suffixes) or ".osm"
+        network_link = osrm_path.parent / "{}{}".format(osrm_path.stem, network_ext)
+
+        network_link.symlink_to(network_path)
+
         try:
-            self.log.info("{}: Compiling scenario ({})".format(self.name, self.algorithm))
+            self._run_stage("extract", network_link, self.routing_profile.get_path())
+        finally:
+            network_link.unlink()
 
-            if self.routing_profile.is_default():
-                self.log.warning("{}: Default {} profile may not be accurate for your use case".format(self.name,
-                                                                                                       self.routing_profile.get_name()))
+        ## Run different binaries depending on algorithm used
+        if self.algorithm == "MLD":
+            self._run_stage("partition", osrm_path)
+            self._run_stage("customize", osrm_path)
 
-            ## Run osrm-extract
-            extr = self.OSRM.extract(self.osm_dataset.get_path(),
-                                     self.routing_profile.get_path(),
-                                     **self._get_command_args("extract"))
-            extr.wait() ## synchronous execution
+        elif self.algorithm == "CH":
+            self._run_stage("contract", osrm_path)
 
-            ## osrm-extract generates osrm file in same folder as OSMDataset
-            ## so rename and move all files to self.path
-            network_path = self.osm_dataset.get_path()
+    def _run_stage(self, command, *args, **kwargs):
+        '''
+        Run an osrm-* compilation command synchronously. If the Scenario is built by a
+        BuildScheduler, the command waits for and runs within its share of the budget.
+        '''
 
-            for src_path in network_path.parent.glob("{}.osrm*".format(network_path.stem.split(".")[0])):
-                dst_file = src_path.name.replace(src_path.stem.split(".")[0], self.name)
-                dst_path = self.path.parent / dst_file
+        cmd_args = {**self._get_command_args(command), **kwargs}
+        run = getattr(self.OSRM, command)
 
-                shutil.move(src_path, dst_path)
+        if self.budget is None:
+            run(*args, **cmd_args).wait()
+            return
 
-            ## Run different binaries depending on algorithm used
-            if self.algorithm == "MLD":
-                part = self.OSRM.partition(self.path, **self._get_command_args("partition"))
-                part.wait()
+        with self.budget.allocate(self, command, threads=cmd_args.get("threads")) as threads:
+            run(*args, **{**cmd_args, "threads": threads}).wait()
 
-                cust = self.OSRM.customize(self.path, **self._get_command_args("customize"))
-                cust.wait()
+    def _get_extent(self, extent, method, buffer):
+        '''Return buffered extent geometry from an `extent` parameter'''
 
-            elif self.algorithm == "CH":
-              cont = self.OSRM.contract(self.path, **self._get_command_args("contract"))
-              cont.wait()
+        from .analysis.RouteComparison import RouteComparison
 
-            return self
+        if extent is None:
+            return None
 
-        except Exception as exc:
-            ## TODO custom handle more common exception
-            self.log.error(exc)
+        if isinstance(extent, RouteComparison):
+            extent = extent.get_extent(method=method)
+        elif isinstance(extent, GeoDataFrame):
+            extent = utils.get_extent(extent, method=method)
+        elif isinstance(extent, list) and extent and all(isinstance(e, GeoDataFrame) for e in extent):
+            extent = utils.get_extent(*extent, method=method)
+        elif isinstance(extent, (tuple, list)) and len(extent) == 4:
+            extent = utils.to_geometry(tuple(extent))
+        elif not isinstance(extent, BaseGeometry):
+            raise TypeError("Unsupported extent {}, use POIDataset(s), a RouteComparison, a bounding box "
+                            "or a polygon".format(type(extent).__name__))
+
+        ## Hulls of a single point or of collinear points have no area to clip the network to
+        if extent.area == 0:
+            buffer = max(buffer or 0, defaults.EXTENT_BUFFER)
+
+        return utils.buffer_geometry(extent, buffer)
+
+    def derive(self, name, segment_speeds=None, way_speeds=None, turn_penalties=None, **kwargs):
+        '''
+        Derive a variant of this (MLD) scenario with segment speed and turn penalty overrides,
+        which shares this scenario's extract and partition and only re-runs `osrm-customize`
+
+        Parameters
+        ----------
+        name : str
+            Name of the derived scenario
+        segment_speeds : dict, optional
+            (from OSM node id, to OSM node id): speed in km/h. A speed of 0 closes the segment
+        way_speeds : dict, optional
+            OSM way id: speed in km/h, applied to all segments of the way in both directions
+        turn_penalties : dict, optional
+            (from OSM node id, via OSM node id, to OSM node id): penalty in seconds
+
+        Returns
+        -------
+        OverlayScenario
+        '''
+
+        from .OverlayScenario import OverlayScenario
+
+        return OverlayScenario(self, name=name, segment_speeds=segment_speeds, way_speeds=way_speeds,
+                               turn_penalties=turn_penalties, **kwargs)
 
     ##
     ## Context Manager for running Scenario HTTP server (osrm-routed)
     ##
 
     def __enter__(self):
-        ## Compile the Scenario if it hasn't yet
-        if not self.path.is_file():
+        ## Compile the Scenario if it hasn't yet, or if its inputs changed
+        if not self.is_compiled():
             self()
 
-        ## Point the osrm http api to correct port
-        port = utils.find_open_port()
-        self._set_config(port)
+        self._set_command_args("routed", {"algorithm": self.algorithm})
+
+        ## The dataset name only matters in shared memory, so servers are shared across names otherwise
+        if self.shared_memory:
+            self._set_command_args("routed", {"shared_memory": True, "dataset_name": self.name})
 
-        self._set_command_args("routed", {
-            "port": port,
-            "algorithm": self.algorithm,
-            "dataset_name": self.name
-        })
+        ## Attach to a persistent server started by another process
+        if self.registry is not None:
+            self.server = self.registry.attach(self.get_server_key())
+
+            if self.server is not None:
+                self.log.info("{}: Attached to server on port {}".format(self.name, self.server["port"]))
+                self._set_config(self.server["port"])
+                return self
 
-        self.ready = False
+        ## Load the network into shared memory, unless it already is
+        if self.shared_memory:
+            self._attach_dataset()
+            self.dataset_attached = True
 
         ## Start up OSRM HTTP server with OSRM-routed
         try:
+            self.log.info("{}: Initializing scenario".format(self.name))
+
+            if self.registry is not None:
+                self.server = self._start_persistent()
+                port = self.server["port"]
+            else:
+                (self.process, port) = self._start_routed()
+
+            ## Point the osrm http api to correct port
+            self._set_config(port)
+
+            self.log.info("{}: Ready for requests".format(self.name))
+
+        except Exception as exc:
+            self.log.error(exc)
+
+        return self
+
+    def _start_routed(self, attempts=5, **kwargs):
+        '''
+        Start an `osrm-routed` process on a reserved port and wait until it is ready for
+        requests. If it exits before then (ex. the port was taken by another program in the
+        meantime), it is restarted on another port. **kwargs override the routed args.
+
+        Returns
+        -------
+        (process, port)
+        '''
+
+        routed_args = {**self._get_command_args("routed"), **kwargs}
+
+        for attempt in range(attempts):
+            port = utils.reserve_port()
+            ready = threading.Event()
+            exited = threading.Event()
+
             ## Callback to execute when OSRM process is ready to receive http requests
-            def ready_callback(process):
-                self.ready = True
+            def ready_callback(process, ready=ready):
+                ready.set()
 
             ## Callback when command exits
-            def done_callback(cmd, success, exit_code):
+            def done_callback(cmd, success, exit_code, ready=ready, exited=exited, port=port):
+                exited.set()
+                utils.release_port(port)
+
                 ## -9 = SIGKILL = it was (probably) killed by this script. aka, this is normal.
-                if exit_code != -9:
+                if exit_code != -9 and ready.is_set():
                     self.log.error("{}: Scenario process exited with exit code {}".format(self.name, exit_code))
                     self.log.error("{}: Command: {}".format(self.name, cmd))
 
+            process = self.OSRM.routed(None if routed_args.get("shared_memory") else self.path,
+                                       ready_callback,
+                                       done_callback,
+                                       **{**routed_args, "port": port})
 
-            self.log.info("{}: Initializing scenario".format(self.name))
-            self.process = self.OSRM.routed(self.path,
-                                            ready_callback,
-                                            done_callback,
-                                            **self._get_command_args("routed"))
+            ## Wait until OSRM-routed is ready, or has exited
+            while not ready.wait(0.01):
+                if exited.is_set():
+                    break
 
-        except Exception as exc:
-            self.log.error(exc)
+            if ready.is_set():
+                return (process, port)
+
+            self.log.warning("{}: osrm-routed exited before being ready on port {}".format(self.name, port))
+
+        raise RuntimeError("{}: osrm-routed failed to start after {} attempts".format(self.name, attempts))
+
+    def _start_persistent(self, attempts=5):
+        '''
+        Start a detached `osrm-routed` process, wait until it accepts connections and add it
+        to the server registry
+
+        Returns
+        -------
+        dict
+            Registry entry of the server
+        '''
 
-        ## Wait until OSRM-routed is ready before returning the api
-        ## TODO better way to do this?
-        while not self.ready:
-            time.sleep(1)
+        key = self.get_server_key()
+        routed_args = self._get_command_args("routed")
 
-        self.log.info("{}: Ready for requests".format(self.name))
+        for attempt in range(attempts):
+            port = utils.reserve_port()
+
+            try:
+                process = self.OSRM.routed_detached(None if routed_args.get("shared_memory") else self.path,
+                                                    self.registry.get_log_path(key),
+                                                    **{**routed_args, "port": port})
+                server = {"name": self.name, "pid": process.pid, "port": port}
+
+                while process.process.is_alive()[0]:
+                    if self.registry.is_running(server):
+                        self.registry.register(key, self.name, process.pid, port)
+                        return self.registry.attach(key)
+
+                    time.sleep(0.01)
+
+            finally:
+                utils.release_port(port)
+
+            self.log.warning("{}: osrm-routed exited before being ready on port {}".format(self.name, port))
+
+        raise RuntimeError("{}: osrm-routed failed to start after {} attempts, see {}".format(
+            self.name, attempts, self.registry.get_log_path(key)))
+
+    def load(self, scenario=None, **kwargs):
+        '''
+        Load the compiled network into shared memory with `osrm-datastore`, under the scenario
+        name. If a dataset with the same name is already loaded, it is atomically replaced:
+        `osrm-routed` processes serving it switch to the new network without dropping
+        in-flight requests.
+
+        Parameters
+        ----------
+        scenario : Scenario, optional
+            Scenario whose network is loaded under this scenario's name. Defaults to this scenario
+        **kwargs
+            Any additional parameters to be passed to osrm-datastore (ex. `only_metric=True`)
+        '''
+
+        source = scenario if scenario else self
+
+        if not source.is_compiled():
+            source()
+
+        self.log.info("{}: Loading {} into shared memory".format(self.name, source.get_name()))
+
+        store = self.OSRM.datastore(source.get_path(), dataset_name=self.name,
+                                    **{**self._get_command_args("datastore"), **kwargs})
+        store.wait()
+
+        with Scenario._datasets_lock:
+            Scenario._datasets[self.name] = source.get_fingerprint()
 
         return self
 
+    @property
+    def loaded(self):
+        """Fingerprint of the network loaded in shared memory under the scenario name, None if not loaded"""
+        return Scenario._datasets.get(self.name)
+
+    def _attach_dataset(self):
+        '''Count a user of the scenario's shared memory dataset, and load it unless it already is'''
+
+        with Scenario._datasets_lock:
+            Scenario._dataset_users[self.name] = Scenario._dataset_users.get(self.name, 0) + 1
+
+        if self.loaded != self.get_fingerprint():
+            self.load()
+
+    def _detach_dataset(self, pin=None):
+        '''
+        Stop counting a user of the scenario's shared memory dataset. Once no scenario of the
+        process serves a dataset, shared memory is released with `osrm-datastore --spring-clean`.
+        osrm-datastore can't unload a single dataset, so this releases every dataset it loaded,
+        and waits for as long as a persistent server started by the process serves a dataset.
+
+        Parameters
+        ----------
+        pin : (ServerRegistry, str), optional
+            Registry and key of a persistent server left running on the dataset
+        '''
+
+        with Scenario._datasets_lock:
+            Scenario._dataset_users[self.name] -= 1
+
+            if pin is not None:
+                Scenario._pinned[self.name] = pin
+
+            if any(Scenario._dataset_users.values()):
+                return
+
+            ## Drop pins of persistent servers which have been stopped since
+            for (name, (registry, key)) in list(Scenario._pinned.items()):
+                if key not in registry.get_servers():
+                    del Scenario._pinned[name]
+
+            if Scenario._pinned:
+                self.log.info("{}: Keeping shared memory for persistent servers of {}".format(
+                    self.name, ", ".join(Scenario._pinned)))
+                return
+
+            Scenario._dataset_users.clear()
+            Scenario._datasets.clear()
+
+            self.log.info("{}: Releasing shared memory".format(self.name))
+
+            ## --spring-clean asks for confirmation on stdin
+            self.OSRM.datastore(spring_clean=True, _in="Y\n").wait()
+
+    def swap(self, scenario, **kwargs):
+        '''
+        Hot-swap the network served from shared memory to the network of another scenario
+        (ex. a recompiled or derived version of this scenario). Only available with
+        `shared_memory=True`.
+
+        Parameters
+        ----------
+        scenario : Scenario
+            Scenario to be served under this scenario's name
+        **kwargs
+            Any additional parameters to be passed to osrm-datastore
+        '''
+
+        if not self.shared_memory:
+            raise ValueError("{}: Hot-swapping requires shared_memory=True".format(self.name))
+
+        if scenario.algorithm != self.algorithm:
+            raise ValueError("{}: Cannot swap {} network for {} network".format(self.name, self.algorithm,
+                                                                               scenario.algorithm))
+
+        return self.load(scenario, **kwargs)
+
     def __exit__(self, exc_type, exc_value, traceback):
         ## TODO handle common exceptions
+        suppress = False
+
         if exc_type:
             if exc_type is HTTPError: ## Log but not exit on HTTP Errors
                 self.log.error(exc_value)
-                return True
+                suppress = True
             else:
                 self.log.error("{} {} {}".format(exc_type, exc_value, traceback))
 
+        if self.engine is not None:
+            self.engine.close()
+
+        if self.async_client is not None:
+            self._close_aclient()
+
+        ## Leave persistent servers, and the shared memory they serve, running for the next process
+        if self.server is not None:
+            key = self.get_server_key()
+            self.registry.detach(key)
+            self.server = None
+
+            if self.dataset_attached:
+                self.dataset_attached = False
+                self._detach_dataset(pin=(self.registry, key))
+
+            return suppress
+
         ## Kill the OSRM process
         try:
             self.process.kill()
+            self.process.wait()
         except:
             pass
 
+        if self.dataset_attached:
+            self.dataset_attached = False
+            self._detach_dataset()
+
+        return suppress
+
     ##
     ## osrm-routed HTTP API
 
@@ -244,15 +611,113 @@ class Scenario():
     table = osrm.table
     trip = osrm.trip
 
+    def aclient(self, **kwargs):
+        '''
+        Return an asyncio client of the scenario HTTP API, with keep-alive connection
+        pooling, bounded concurrency and retries (see `AsyncClient`). Requires aiohttp.
+
+        Parameters
+        ----------
+        **kwargs
+            Any additional parameters to be passed to AsyncClient (ex. `concurrency`, `retries`)
+        '''
+
+        if getattr(self, "config", None) is None:
+            raise RuntimeError("{}: The asyncio client requires a running HTTP server".format(self.name))
+
+        return AsyncClient(self.config, **kwargs)
+
+    async def aroute(self, *args, **kwargs):
+        '''
+        Query `route` service asynchronously, with the same parameters as `simple_route`. All
+        calls in an event loop share a pool of keep-alive connections, closed on exit
+        '''
+
+        if self.async_client is None or self.async_client.loop is not asyncio.get_running_loop():
+            self.async_client = self.aclient()
+            await self.async_client.open()
+
+        return await self.async_client.route(*args, **kwargs)
+
+    def _close_aclient(self):
+        '''Close the connection pool of `aroute` in its event loop'''
+
+        (client, self.async_client) = (self.async_client, None)
+
+        if client.loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), client.loop)
+        elif not client.loop.is_closed():
+            client.loop.run_until_complete(client.close())
+
+        ## Loops which have shut down closed their pool already (see `AsyncClient.open`)
+
+    async def aroute_many(self, pairs, concurrency=64, **kwargs):
+        '''
+        Query `route` service for many (origin, destination) pairs concurrently over a pool
+        of keep-alive connections (see `AsyncClient.route_many`)
+
+        Parameters
+        ----------
+        pairs : iterable of (2-floats tuple, 2-floats tuple)
+            (origin, destination) coordinates as (x, y)
+        concurrency : int, optional
+            Maximum number of requests in flight
+        **kwargs
+            Any additional parameters to be passed to `simple_route`
+
+        Returns
+        -------
+        list
+            Route result (or exception) of every pair, in the order of `pairs`
+        '''
+
+        async with self.aclient(concurrency=concurrency) as client:
+            return await client.route_many(pairs, **kwargs)
+
+    @staticmethod
+    def _get_config(port):
+        """Return HTTP API configuration given the HTTP server port"""
+        return osrm.RequestConfig("127.0.0.1:{}/v1/skobuffs".format(port))
+
     def _set_config(self, port):
-        """Set up HTTP API configuration given the HTTP server port"""
-        self.config = osrm.RequestConfig("127.0.0.1:{}/v1/skobuffs".format(port))
+        """Set up HTTP API configuration given the HTTP server port, and the query engine on top of it"""
+        engine = HTTPEngine(port)
+
+        if self.engine_name != "http":
+            self.log.info("{}: Loading {} engine".format(self.name, self.engine_name))
+            engine = ENGINES[self.engine_name](self.path, engine, algorithm=self.algorithm,
+                                               shared_memory=self.shared_memory)
+
+        self._set_engine(engine)
+
+    def _set_engine(self, engine):
+        """Route the query methods to a query engine"""
+        self.engine = engine
+        self.config = engine.config
 
-        self.simple_route = partial(osrm.simple_route, url_config=self.config)
-        self.nearest = partial(osrm.nearest, url_config=self.config)
-        self.match = partial(osrm.match, url_config=self.config)
-        self.table = partial(osrm.table, url_config=self.config)
-        self.trip = partial(osrm.trip, url_config=self.config)
+        self.simple_route = engine.simple_route
+        self.nearest = engine.nearest
+        self.match = engine.match
+        self.table = engine.table
+        self.trip = engine.trip
+        self.request = engine.request
+
+    def snap(self, coords):
+        '''
+        Snap coordinates to the network once, and return their OSRM hints to skip snapping on
+        later requests (see `SnapCache`)
+
+        Parameters
+        ----------
+        coords : list of 2-floats tuple
+            Coordinates as (x, y)
+
+        Returns
+        -------
+        dict
+            Arrays of `hint`, snapped `location` and snapping `distance`, in the order of `coords`
+        '''
+        return self.snap_cache.snap(self, coords)
 
     ##
     ## Other
@@ -272,9 +737,53 @@ class Scenario():
         """Return the Scenario path"""
         return self.path
 
+    def get_max_table_size(self):
+        """Return the maximum number of sources and of destinations of a `table` request"""
+        return int(self._get_command_args("routed").get("max_table_size", defaults.MAX_TABLE_SIZE))
+
+    def get_inputs(self):
+        """Return dict of all inputs which determine the compiled network"""
+        return {"osm_dataset": self.osm_dataset.get_fingerprint(),
+                "routing_profile": self.routing_profile.get_fingerprint(),
+                "extent": utils.hash_(self.extent.wkt) if self.extent is not None else None,
+                "algorithm": self.algorithm,
+                "args": {cmd: self._get_command_args(cmd)
+                         for cmd in ["extract", "partition", "customize", "contract"]},
+                "osrm_version": self.OSRM.get_version()}
+
+    def get_fingerprint(self):
+        """Return fingerprint of the Scenario inputs, used as build cache key"""
+        return utils.hash_dict(self.get_inputs())
+
+    def get_network_fingerprint(self):
+        """Return fingerprint of the network being served, which differs from the Scenario's after a `swap`"""
+        return self.loaded if self.shared_memory and self.loaded else self.get_fingerprint()
+
+    def get_manifest(self):
+        """Return manifest of the compiled Scenario, or None if it has not been compiled"""
+        if not self.manifest_path.is_file():
+            return None
+
+        return json.loads(self.manifest_path.read_text())
+
+    def is_compiled(self, fingerprint=None):
+        """True if Scenario has been compiled from its current inputs, False otherwise"""
+        manifest = self.get_manifest()
+        fingerprint = fingerprint if fingerprint else self.get_fingerprint()
+
+        return self.path.is_file() and manifest is not None \
+            and manifest["fingerprint"] == fingerprint
+
+    def get_server_key(self):
+        """Return key of the Scenario server in the ServerRegistry"""
+        routed_args = {k: v for k, v in self._get_command_args("routed").items() if k != "port"}
+        return utils.hash_dict({"fingerprint": self.get_fingerprint(), "routed": routed_args})
+
     def is_alive(self):
         """True if Scenario process is running, False otherwise"""
-        if hasattr(self, "process") and hasattr(self.process, "process"):
+        if self.server is not None:
+            return self.registry.is_running(self.server)
+        elif hasattr(self, "process") and hasattr(self.process, "process"):
             return self.process.process.is_alive()[0]
         else:
             return False
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import threading
+import logging
+import osrm
+
+from urllib.error import HTTPError
+
+from . import defaults
+from . import utils
+
+class ScenarioPool():
+    """
+    ScenarioPool serves a Scenario with several `osrm-routed` workers and balances the
+    HTTP API calls between them, sending each request to the worker with the least
+    outstanding requests. This is useful to run many requests concurrently, such as
+    from multiple threads.
+
+    By default, the network is loaded once in shared memory with `osrm-datastore` and
+    all workers serve it from there (see `Scenario` `shared_memory`). Shared memory is
+    released on exit, unless another scenario of the process still serves it.
+
+    Example
+    -------
+    >>> with ScenarioPool(scenario, workers=4) as api:
+    >>>     api.simple_route()... ## query one of the workers
+
+    Parameters
+    ----------
+    scenario : Scenario
+        Scenario to be served
+    workers : int, optional
+        Number of `osrm-routed` processes
+    shared_memory : bool, optional
+        Serve the network from shared memory, instead of loading it in every worker
+    """
+
+    def __init__(self, scenario, workers=2, shared_memory=True):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.scenario = scenario
+        self.n_workers = workers
+        self.shared_memory = shared_memory
+
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        scenario = self.scenario
+
+        ## Compile the Scenario if it hasn't yet, or if its inputs changed
+        if not scenario.is_compiled():
+            scenario()
+
+        scenario._set_command_args("routed", {"algorithm": scenario.algorithm})
+
+        if self.shared_memory:
+            scenario._set_command_args("routed", {"dataset_name": scenario.get_name()})
+            scenario._attach_dataset()
+
+        self.log.info("{}: Initializing {} workers".format(scenario.get_name(), self.n_workers))
+
+        for i in range(self.n_workers):
+            (process, port) = scenario._start_routed(shared_memory=self.shared_memory)
+
+            self.workers.append({"process": process,
+                                 "port": port,
+                                 "config": scenario._get_config(port),
+                                 "outstanding": 0,
+                                 "requests": 0})
+
+        self.log.info("{}: Ready for requests".format(scenario.get_name()))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        suppress = False
+
+        if exc_type:
+            if exc_type is HTTPError: ## Log but not exit on HTTP Errors
+                self.log.error(exc_value)
+                suppress = True
+            else:
+                self.log.error("{} {} {}".format(exc_type, exc_value, traceback))
+
+        ## Kill the OSRM processes
+        for worker in self.workers:
+            try:
+                worker["process"].kill()
+                worker["process"].wait()
+            except:
+                pass
+
+        self.workers = []
+
+        ## Release shared memory once no other scenario of the process serves it
+        if self.shared_memory:
+            self.scenario._detach_dataset()
+
+        return suppress
+
+    ##
+    ## Load balancing
+
+    def _acquire(self):
+        """Return the worker with the least outstanding requests and count a new request on it"""
+        with self.lock:
+            worker = min(self.workers, key=lambda w: w["outstanding"])
+            worker["outstanding"] += 1
+            worker["requests"] += 1
+
+        return worker
+
+    def _release(self, worker):
+        with self.lock:
+            worker["outstanding"] -= 1
+
+    def _request(self, func, *args, **kwargs):
+        worker = self._acquire()
+
+        try:
+            return func(*args, url_config=worker["config"], **kwargs)
+        finally:
+            self._release(worker)
+
+    ##
+    ## osrm-routed HTTP API
+
+    def simple_route(self, *args, **kwargs):
+        """Query `route` service of the least busy worker (see `osrm.simple_route`)"""
+        return self._request(osrm.simple_route, *args, **kwargs)
+
+    def nearest(self, *args, **kwargs):
+        """Query `nearest` service of the least busy worker (see `osrm.nearest`)"""
+        return self._request(osrm.nearest, *args, **kwargs)
+
+    def match(self, *args, **kwargs):
+        """Query `match` service of the least busy worker (see `osrm.match`)"""
+        return self._request(osrm.match, *args, **kwargs)
+
+    def table(self, *args, **kwargs):
+        """Query `table` service of the least busy worker (see `osrm.table`)"""
+        return self._request(osrm.table, *args, **kwargs)
+
+    def trip(self, *args, **kwargs):
+        """Query `trip` service of the least busy worker (see `osrm.trip`)"""
+        return self._request(osrm.trip, *args, **kwargs)
+
+    def request(self, service, coords, **params):
+        """Query any service of the least busy worker (see `utils.request`)"""
+        return self._request(utils.request, service, coords, **params)
+
+    def snap(self, coords):
+        """Snap coordinates to the network once, sharing the Scenario's SnapCache (see `Scenario.snap`)"""
+        return self.scenario.snap_cache.snap(self, coords)
+
+    @property
+    def config(self):
+        """HTTP API configuration of the least busy worker"""
+        with self.lock:
+            return min(self.workers, key=lambda w: w["outstanding"])["config"]
+
+    ##
+    ## Other
+
+    def get_name(self):
+        """Return the Scenario name"""
+        return self.scenario.get_name()
+
+    def get_fingerprint(self):
+        """Return the Scenario fingerprint"""
+        return self.scenario.get_fingerprint()
+
+    def get_network_fingerprint(self):
+        """Return fingerprint of the network being served"""
+        return self.scenario.get_network_fingerprint()
+
+    def get_max_table_size(self):
+        """Return the maximum number of sources and of destinations of a `table` request"""
+        return self.scenario.get_max_table_size()
+
+    def get_stats(self):
+        """Return list of port, outstanding and total requests of every worker"""
+        with self.lock:
+            return [{k: w[k] for k in ["port", "outstanding", "requests"]} for w in self.workers]
+
+    def is_alive(self):
+        """True if all worker processes are running, False otherwise"""
+        return len(self.workers) > 0 and \
+            all(w["process"].process.is_alive()[0] for w in self.workers)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+import subprocess
+import logging
+import signal
+import fcntl
+import json
+import time
+import os
+
+from contextlib import contextmanager
+from urllib.request import urlopen
+from urllib.error import URLError, HTTPError
+from pathlib import Path
+
+from . import defaults
+
+class ServerRegistry():
+    '''
+    Registry of long-lived `osrm-routed` servers shared between Python processes.
+
+    Servers are keyed by the fingerprint of the scenario build and routed args. A
+    Scenario entered with `persistent=True` attaches to a running server with the same
+    key instead of starting its own, and leaves it running on exit for the next process.
+
+    Idle servers and servers over the memory cap are evicted lazily, every time the
+    registry is accessed. A server is idle from the last time a Scenario entered or
+    exited it, and is never evicted while a live process is attached to it. Servers are
+    only told apart from a later process reusing their pid (by its start time) when they
+    are attached to or stopped, so that accessing the registry stays cheap.
+
+    Parameters
+    ----------
+    registry_dir: str, optional
+        Directory of the registry file and server logs
+    idle_timeout: float, optional
+        Seconds after which an idle server is stopped. None to never stop idle servers
+    max_memory: int, optional
+        Maximum resident memory in bytes of all registered servers. When exceeded, the
+        least recently used servers are stopped. None for no limit
+    '''
+
+    def __init__(self, registry_dir=defaults.REGISTRY_DIR, idle_timeout=3600, max_memory=None):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.registry_dir = Path(registry_dir)
+        self.registry_path = self.registry_dir / "registry.json"
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+
+        self.registry_dir.mkdir(parents=True, exist_ok=True)
+
+    def attach(self, key):
+        '''
+        Return the registry entry of a running server, or None if there is none
+
+        Parameters
+        ----------
+        key: str
+            Server key (see `Scenario.get_server_key`)
+        '''
+
+        with self._open() as servers:
+            server = servers.get(key)
+
+            if server is None:
+                return None
+
+            if not self.is_running(server):
+                del servers[key]
+                return None
+
+            server["last_used"] = time.time()
+            server["attached"] = server.get("attached", []) + [os.getpid()]
+
+            return dict(server)
+
+    def detach(self, key):
+        """Mark a server as no longer used by this process, and as used now"""
+        with self._open() as servers:
+            if key in servers:
+                attached = servers[key].get("attached", [])
+
+                if os.getpid() in attached:
+                    attached.remove(os.getpid())
+
+                servers[key]["last_used"] = time.time()
+
+    def register(self, key, name, pid, port):
+        '''
+        Register a running server
+
+        Parameters
+        ----------
+        key: str
+            Server key (see `Scenario.get_server_key`)
+        name: str
+            Scenario name
+        pid: int
+            osrm-routed process id
+        port: int
+            osrm-routed port
+        '''
+
+        with self._open() as servers:
+            servers[key] = {"name": name, "pid": pid, "port": port,
+                            "pid_started": self._get_started(pid), "attached": [],
+                            "started": time.time(), "last_used": time.time()}
+
+    def touch(self, key):
+        """Mark a server as used now"""
+        with self._open() as servers:
+            if key in servers:
+                servers[key]["last_used"] = time.time()
+
+    def stop(self, key):
+        """Stop a registered server"""
+        with self._open() as servers:
+            if key in servers:
+                self._stop(servers.pop(key))
+
+    def stop_all(self):
+        """Stop all registered servers"""
+        with self._open() as servers:
+            for key in list(servers):
+                self._stop(servers.pop(key))
+
+    def get_servers(self):
+        """Return dict of key: entry of all running servers"""
+        with self._open() as servers:
+            return {key: dict(server) for key, server in servers.items()}
+
+    def get_log_path(self, key):
+        """Return path of the output log of a server"""
+        return self.registry_dir / "{}.log".format(key)
+
+    def is_running(self, server):
+        """True if server process is alive and answering HTTP requests"""
+        if not self._is_alive(server):
+            return False
+
+        ## osrm-routed accepts connections before its dataset is loaded, so probe the HTTP API
+        try:
+            urlopen("http://127.0.0.1:{}/nearest/v1/skobuffs/0,0".format(server["port"]), timeout=1).close()
+            return True
+        except HTTPError: ## Any HTTP response (ex. NoSegment) means the server is ready
+            return True
+        except (URLError, OSError):
+            return False
+
+    ##
+    ## Utils
+
+    @contextmanager
+    def _open(self):
+        '''Context manager to read and write the registry under an exclusive file lock'''
+
+        with open(self.registry_dir / "registry.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                servers = json.loads(self.registry_path.read_text()) if self.registry_path.is_file() else {}
+
+                self._evict(servers)
+
+                yield servers
+
+                tmp_path = self.registry_path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(servers, indent=2))
+                tmp_path.replace(self.registry_path)
+
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _evict(self, servers):
+        '''Remove dead servers, then stop idle servers and least recently used ones over the memory cap'''
+
+        for key in list(servers):
+            server = servers[key]
+            server["attached"] = [pid for pid in server.get("attached", []) if self._pid_exists(pid)]
+
+            ## A reused pid is only detected on attach and stop (see `_is_alive`)
+            if not self._pid_exists(server["pid"]):
+                del servers[key]
+
+            elif server["attached"]:
+                continue
+
+            elif self.idle_timeout is not None and time.time() - server["last_used"] > self.idle_timeout:
+                self.log.info("{}: Stopping idle server".format(server["name"]))
+                self._stop(servers.pop(key))
+
+        if self.max_memory is None:
+            return
+
+        memory = {key: self._get_memory(server["pid"]) for key, server in servers.items()}
+
+        for key in sorted(servers, key=lambda k: servers[k]["last_used"]):
+            if sum(memory.values()) <= self.max_memory:
+                break
+
+            if servers[key]["attached"]:
+                continue
+
+            self.log.info("{}: Stopping server over registry memory cap".format(servers[key]["name"]))
+            self._stop(servers.pop(key))
+            del memory[key]
+
+    def _stop(self, server):
+        ## Never signal another process which reused the server pid
+        if not self._is_alive(server):
+            return
+
+        try:
+            os.kill(server["pid"], signal.SIGTERM)
+        except OSError:
+            pass
+
+    def _is_alive(self, server):
+        """True if the server process is alive, and is the process that was registered"""
+        if not self._pid_exists(server["pid"]):
+            return False
+
+        return "pid_started" not in server or self._get_started(server["pid"]) == server["pid_started"]
+
+    def _pid_exists(self, pid):
+        try:
+            os.kill(pid, 0)
+            return True
+        except PermissionError: ## Alive, but owned by another user
+            return True
+        except OSError:
+            return False
+
+    def _get_started(self, pid):
+        """Return start time of a process, to tell it apart from a later process with the same pid"""
+        ## Start time in clock ticks since boot from procfs, without spawning ps on Linux
+        try:
+            stat = Path("/proc/{}/stat".format(pid)).read_text()
+            return stat[stat.rindex(")") + 2:].split()[19]
+        except FileNotFoundError:
+            if Path("/proc/self/stat").is_file(): ## procfs, but no such process
+                return None
+        except (OSError, ValueError, IndexError):
+            pass
+
+        try:
+            return subprocess.check_output(["ps", "-o", "lstart=", "-p", str(pid)]).decode().strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def _get_memory(self, pid):
+        """Return resident memory of a process in bytes"""
+        try:
+            pages = int(Path("/proc/{}/statm".format(pid)).read_text().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE")
+        except FileNotFoundError:
+            if Path("/proc/self/statm").is_file():
+                return 0
+        except (OSError, ValueError, IndexError):
+            pass
+
+        try:
+            return int(subprocess.check_output(["ps", "-o", "rss=", "-p", str(pid)])) * 1024
+        except (subprocess.CalledProcessError, ValueError, OSError):
+            return 0
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import threading
+import logging
+
+from . import defaults
+
+class SnapCache():
+    '''
+    Cache of the network locations that coordinates snap to, per served network.
+
+    osrm-routed snaps every coordinate of every request to the network. Once a coordinate is
+    snapped, its OSRM hint can be passed along with it on later requests (`hints` parameter)
+    so that routed skips the snapping. Hints are only valid for the network they were computed
+    on, so they are keyed by the network fingerprint.
+
+    Coordinates are snapped in chunks with one-to-many `table` requests, whose `sources`
+    waypoints carry the same hint, location and distance as a `nearest` request, with one
+    request per chunk instead of one per coordinate.
+
+    Every Scenario has a SnapCache (see `Scenario.snap`), shared with the ScenarioPools
+    serving it.
+
+    Parameters
+    ----------
+    result_cache: ResultCache, optional
+        Persistent cache of snapped chunks, to reuse hints across runs
+    workers: int, optional
+        Number of chunks snapped concurrently
+    '''
+
+    def __init__(self, result_cache=None, workers=4):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.result_cache = result_cache
+        self.workers = workers
+
+        self.snaps = {} ## network fingerprint: {(x, y): (hint, x, y, distance)}
+        self.lock = threading.Lock()
+
+    def snap(self, api, coords, chunk_size=None):
+        '''
+        Snap coordinates to the network served by a running scenario, reusing previous snaps
+
+        Parameters
+        ----------
+        api: Scenario / ScenarioPool
+            Running scenario
+        coords: list of 2-floats tuple
+            Coordinates as (x, y)
+        chunk_size: int, optional
+            Number of coordinates per request. Defaults to the scenario's `max_table_size`
+
+        Returns
+        -------
+        dict
+            Arrays of `hint`, snapped `location` (x, y) and snapping `distance` in meters, in
+            the order of `coords`
+        '''
+
+        coords = [(float(x), float(y)) for (x, y) in coords]
+        fingerprint = api.get_network_fingerprint()
+        chunk_size = chunk_size if chunk_size else api.get_max_table_size()
+
+        with self.lock:
+            known = self.snaps.setdefault(fingerprint, {})
+            missing = list(dict.fromkeys(c for c in coords if c not in known))
+
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+        def snap_chunk(chunk):
+            key = None if self.result_cache is None else \
+                self.result_cache.get_key(fingerprint, "snap", chunk)
+            waypoints = None if key is None else self.result_cache.get(key)
+
+            if waypoints is None:
+                response = api.request("table", chunk, sources=range(len(chunk)), destinations=[0],
+                                       annotations="duration")
+                waypoints = [[wp["hint"], *wp["location"], wp["distance"]] for wp in response["sources"]]
+
+                if key is not None:
+                    self.result_cache.put(key, waypoints)
+
+            with self.lock:
+                known.update(zip(chunk, map(tuple, waypoints)))
+
+        if chunks:
+            self.log.info("{}: Snapping {} coordinates".format(api.get_name(), len(missing)))
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(snap_chunk, chunks))
+
+        snaps = [known[c] for c in coords]
+
+        return {"hint": np.array([s[0] for s in snaps] + [None], dtype=object)[:-1],
+                "location": np.array([s[1:3] for s in snaps], dtype=float).reshape(-1, 2),
+                "distance": np.array([s[3] for s in snaps], dtype=float)}
+
+    def clear(self):
+        """Remove all snaps"""
+        with self.lock:
+            self.snaps = {}
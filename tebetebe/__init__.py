@@ -5,7 +5,16 @@ from .Environment import Environment
 from .OSMDataset import OSMDataset
 from .POIDataset import POIDataset
 from .Scenario import Scenario
+from .OverlayScenario import OverlayScenario
+from .ScenarioPool import ScenarioPool
+from .AsyncClient import AsyncClient
+from .ServerRegistry import ServerRegistry
+from .BuildCache import BuildCache
+from .ResultCache import ResultCache
+from .SnapCache import SnapCache
+from .BuildScheduler import BuildScheduler, BuildBudget
 
+from . import engines
 from . import defaults
 
 ##
@@ -1,10 +1,26 @@
-from osrm import AccessIsochrone as OSRMAccessIsochrone
-from shapely.geometry import MultiPolygon
+from osrm import AccessIsochrone as OSRMAccessIsochrone, Point as OSRMPoint
+from shapely.geometry import MultiPolygon, Point
+from geopandas import GeoDataFrame
+
+from .TiledTable import TiledTable
+from .. import defaults
+
+import numpy as np
+import logging
+import math
 
 class AccessIsochrone(OSRMAccessIsochrone):
     """
     Compute an access isochrone from an origin point with a given `ScenarioAPI`
 
+    By default, durations are computed to a uniform grid of `points_grid` points. With a
+    `resolution`, the grid is refined adaptively instead: durations are first computed to a
+    coarse grid of `points_grid` points, then every cell whose corner durations straddle one
+    of the contour `levels` is split in four, until cells are `resolution` degrees wide. Cells
+    away from any contour boundary are never refined, so the contours are as precise as a
+    uniform grid at `resolution` with a fraction of the routed queries. As with the uniform
+    grid, grid points are moved to the network locations they snap to (see `Scenario.snap`).
+
     Parameters
     ----------
     scenario : Scenario
@@ -15,11 +31,114 @@ class AccessIsochrone(OSRMAccessIsochrone):
         The number of points of the underlying grid to use.
     size : float
         Search radius (in wgs84 degrees)
+    resolution : float, optional
+        Target grid resolution (in wgs84 degrees) of adaptive refinement
+    levels : int / list of float, optional
+        Contour levels (in minutes) to refine the grid around, or number of levels as passed
+        to `render_contour`
+    workers : int, optional
+        Number of concurrent requests of adaptive refinement
     """
-    def __init__(self, scenario, point_origin, points_grid=500, size=0.4):
+    def __init__(self, scenario, point_origin, points_grid=500, size=0.4, resolution=None,
+                 levels=5, workers=4):
+
+        self.log = logging.getLogger(defaults.LOGGER)
+
+        if resolution is None:
+            super(AccessIsochrone, self).__init__(point_origin, points_grid, size,
+                                                  url_config = scenario.config)
+        else:
+            self._refine(scenario, point_origin, points_grid, size, resolution, levels, workers)
+
+    def _refine(self, scenario, point_origin, points_grid, size, resolution, levels, workers):
+        """Compute durations to an adaptively refined grid (see class docstring)"""
+
+        table = TiledTable(scenario, workers=workers)
+
+        ## Grid nodes are (col, row) integers in units of the finest cells; coarse cells are
+        ## `step` finest cells wide and are halved until `step` is 1
+        n_cells = max(1, int(points_grid ** 0.5) - 1)
+        depth = max(0, math.ceil(math.log2(2 * size / n_cells / resolution)))
+        step = 2 ** depth
+        unit = 2 * size / (n_cells * step)
+        (xmin, ymin) = (point_origin[0] - size, point_origin[1] - size)
+
+        times = {}
+        corners = np.array([(0, 0), (1, 0), (0, 1), (1, 1)])
+        cells = np.array([(i, j) for i in range(0, n_cells * step, step)
+                                 for j in range(0, n_cells * step, step)], dtype=np.int64)
+
+        while True:
+            nodes = np.unique((cells[:, None, :] + corners * step).reshape(-1, 2), axis=0)
+            nodes = [tuple(n) for n in nodes.tolist() if tuple(n) not in times]
+
+            if nodes:
+                coords = [(xmin + i * unit, ymin + j * unit) for (i, j) in nodes]
+                durations = table([tuple(point_origin)], coords)["duration"][0]
+                times.update(zip(nodes, (durations / 60.0).round(2)))
+
+            if isinstance(levels, int):
+                ## Same levels as `render_contour(levels)` on the coarse grid
+                finite = [t for t in times.values() if not np.isnan(t)]
+
+                if finite:
+                    max_time = max(finite)
+                    interval = max(1, int(round(max_time / levels)))
+                    levels = list(range(interval, int(max_time + 1) + interval, interval))[:levels]
+                else: ## Nothing to refine, the grid is left empty
+                    self.log.warning("{}: No grid point can be reached from {}".format(
+                        scenario.get_name(), tuple(point_origin)))
+                    levels = []
+
+            if step == 1:
+                break
+
+            ## Refine cells whose finite corner durations straddle a level
+            cell_times = np.array([[times[(i + di * step, j + dj * step)] for (di, dj) in corners]
+                                   for (i, j) in cells.tolist()]).reshape(-1, 4)
+            (low, high) = (np.fmin.reduce(cell_times, axis=1), np.fmax.reduce(cell_times, axis=1))
+            straddle = np.zeros(len(cells), dtype=bool)
+
+            for level in levels:
+                straddle |= (low < level) & (high >= level)
+
+            step //= 2
+            cells = (cells[straddle][:, None, :] + corners * step).reshape(-1, 2)
+
+        nodes = list(times.keys())
+        self.times = np.array([times[n] for n in nodes])
+
+        ## Keep reachable grid points, moved to their snapped location like the uniform grid
+        reached = [(time, (xmin + i * unit, ymin + j * unit)) for (time, (i, j)) in zip(self.times, nodes)
+                   if time and not np.isnan(time)]
+        values = [time for (time, coord) in reached]
+        snapped = scenario.snap([coord for (time, coord) in reached])["location"] if reached else []
+
+        self.grid = GeoDataFrame(geometry=[Point(c) for c in snapped], data=values, columns=['time'])
+
+        center = scenario.nearest(tuple(point_origin))["waypoints"][0]["location"]
+        self.center_point = OSRMPoint(latitude=center[1], longitude=center[0])
+
+        self.log.info("{}: Refined isochrone grid with {} queries ({} for a uniform grid)".format(
+            scenario.get_name(), len(nodes), (n_cells * 2 ** depth + 1) ** 2))
+
+    @staticmethod
+    def get_extent(point_origin, size=0.4, method="bbox"):
+        """
+        Get extent of an access isochrone search radius before it is computed, to limit a
+        Scenario's OSMDataset (see `Scenario` `extent`)
 
-        super(AccessIsochrone, self).__init__(point_origin, points_grid, size,
-                                              url_config = scenario.config)
+        Parameters
+        ----------
+        point_origin : 2-floats tuple
+            The coordinates of the center point to use as (x, y).
+        size : float
+            Search radius (in wgs84 degrees)
+        method : str, optional
+            Either "hull" (search radius circle) or "bbox" (bounding box of the circle)
+        """
+        extent = Point(point_origin).buffer(size)
+        return extent if method == "hull" else extent.envelope
 
     def get_center(self):
         """Return center point used in isochrone calculations"""
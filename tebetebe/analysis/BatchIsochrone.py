@@ -0,0 +1,216 @@
+from .TiledTable import TiledTable
+from .. import defaults
+from .. import utils
+
+from shapely.geometry import MultiPolygon, box
+from shapely.ops import unary_union
+from geopandas import GeoDataFrame
+from pathlib import Path
+
+import numpy as np
+import logging
+import json
+
+class BatchIsochrone():
+    """
+    Compute access isochrones of many origins (ex. schools, clinics) on one shared grid
+
+    Every origin is routed to the centers of the same raster grid, covering the origins
+    buffered by `size` degrees, with `resolution` degrees cells. The origins x grid durations
+    table is computed in tiles (see `TiledTable`), a chunk of `tile_size` origins at a time, so
+    only one chunk is held in memory. On the HTTP API, the grid is snapped to the network once
+    and its hints are reused by every chunk.
+
+    Durations (in minutes) are written to memory-mapped `.npy` rasters in `path`:
+
+    - `durations.npy`: (origins, rows, cols) duration from every origin
+    - `surface.npy`: (rows, cols) minimum duration from any origin
+    - `nearest.npy`: (rows, cols) position of the nearest origin, -1 if unreachable
+    - `grid.json`: grid transform and origin ids
+
+    Rows are north to south, like most raster formats. Unreachable cells are NaN.
+
+    Example
+    -------
+    >>> with scenario() as api:
+    >>>     isochrones = BatchIsochrone(api, clinics, resolution=0.005)
+    >>>     isochrones()
+    >>>     coverage = isochrones.render_coverage([15, 30, 60])
+
+    Parameters
+    ----------
+    scenario: Scenario / ScenarioPool
+        Running scenario on which the isochrones will be calculated
+    origins: POIDataset / list of 2-floats tuple
+        Origin points, or coordinates as (x, y)
+    size: float, optional
+        Buffer (in wgs84 degrees) of the origins bounding box covered by the grid
+    resolution: float, optional
+        Grid cell size (in wgs84 degrees)
+    path: str, optional
+        Output folder of the rasters. Defaults to a folder in `defaults.TMP_DIR`
+    tile_size: int, optional
+        Number of origins and grid points per table request (see `TiledTable`)
+    workers: int, optional
+        Number of concurrent requests
+    cache: ResultCache, optional
+        Persistent cache of computed table tiles
+    """
+
+    def __init__(self, scenario, origins, size=0.2, resolution=0.01, path=None, tile_size=None,
+                 workers=4, cache=None):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.scenario = scenario
+        self.size = size
+        self.resolution = resolution
+        self.workers = workers
+        self.cache = cache
+
+        if hasattr(origins, "geometry"):
+            self.origin_ids = origins.index.tolist()
+            self.origins = list(zip(origins.geometry.x, origins.geometry.y))
+        else:
+            self.origin_ids = list(range(len(origins)))
+            self.origins = [tuple(o) for o in origins]
+
+        self.tile_size = tile_size if tile_size else scenario.get_max_table_size()
+
+        ## Grid snapped to the resolution, covering the buffered origins bounding box
+        coords = np.array(self.origins, dtype=float).reshape(-1, 2)
+        (self.xmin, self.ymin) = np.floor((coords.min(axis=0) - size) / resolution) * resolution
+        (xmax, ymax) = np.ceil((coords.max(axis=0) + size) / resolution) * resolution
+
+        self.shape = (int(round((ymax - self.ymin) / resolution)), int(round((xmax - self.xmin) / resolution)))
+        self.ymax = self.ymin + self.shape[0] * resolution
+
+        self.path = Path(path) if path else defaults.TMP_DIR / "isochrones_{}".format(
+            utils.hash_(json.dumps([scenario.get_name(), self.origins, size, resolution])))
+
+        self.durations = self.surface = self.nearest = None
+
+    def __call__(self):
+        """
+        Compute the durations from every origin to the grid, and the minimum duration surface
+
+        Returns
+        -------
+        np.memmap
+            (rows, cols) minimum duration (in minutes) from any origin
+        """
+
+        name = self.scenario.get_name()
+        (n_rows, n_cols) = self.shape
+        grid = self.get_grid_coords()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        open_memmap = np.lib.format.open_memmap
+
+        self.durations = open_memmap(self.path / "durations.npy", mode="w+", dtype=np.float32,
+                                     shape=(len(self.origins), n_rows, n_cols))
+        self.surface = open_memmap(self.path / "surface.npy", mode="w+", dtype=np.float32, shape=self.shape)
+        self.nearest = open_memmap(self.path / "nearest.npy", mode="w+", dtype=np.int32, shape=self.shape)
+
+        self.surface[:] = np.nan
+        self.nearest[:] = -1
+
+        self.log.info("{}: Computing isochrones of {} origins on a {}x{} grid".format(
+            name, len(self.origins), n_rows, n_cols))
+
+        ## Snap hints need the HTTP API
+        table = TiledTable(self.scenario, tile_size=self.tile_size, workers=self.workers, cache=self.cache,
+                           hints=self.scenario.config is not None)
+
+        for start in range(0, len(self.origins), self.tile_size):
+            chunk = self.origins[start:start + self.tile_size]
+            durations = (table(chunk, grid)["duration"] / 60.0).reshape(-1, n_rows, n_cols)
+            self.durations[start:start + len(chunk)] = durations
+
+            chunk_min = np.fmin.reduce(durations, axis=0)
+            closer = chunk_min < np.where(np.isnan(self.surface), np.inf, self.surface)
+
+            self.nearest[closer] = start + np.nanargmin(np.where(np.isnan(durations), np.inf, durations),
+                                                        axis=0)[closer]
+            self.surface[closer] = chunk_min[closer]
+
+        for raster in (self.durations, self.surface, self.nearest):
+            raster.flush()
+
+        (self.path / "grid.json").write_text(json.dumps({"name": name,
+                                                         "xmin": self.xmin,
+                                                         "ymax": self.ymax,
+                                                         "resolution": self.resolution,
+                                                         "shape": self.shape,
+                                                         "crs": "EPSG:4326",
+                                                         "origin_ids": self.origin_ids}))
+
+        return self.surface
+
+    def get_grid_coords(self):
+        """Return list of (x, y) coordinates of the grid cell centers, row by row from the north"""
+
+        x = self.xmin + (np.arange(self.shape[1]) + 0.5) * self.resolution
+        y = self.ymax - (np.arange(self.shape[0]) + 0.5) * self.resolution
+
+        (xx, yy) = np.meshgrid(x, y)
+
+        return list(zip(xx.ravel().tolist(), yy.ravel().tolist()))
+
+    def get_durations(self):
+        """Return (origins, rows, cols) memory-mapped durations raster, in minutes"""
+        return self.durations
+
+    def get_surface(self):
+        """Return (rows, cols) memory-mapped minimum duration raster, in minutes"""
+        return self.surface
+
+    def get_nearest(self):
+        """Return (rows, cols) memory-mapped raster of the position of the nearest origin"""
+        return self.nearest
+
+    def render_contours(self, levels):
+        """
+        Return GeoDataFrame of `origin_id`, `duration` and MultiPolygon isochrone of every
+        origin and level, made of the grid cells reached within the level
+
+        Parameters
+        ----------
+        levels: list of float
+            Durations (in minutes) of the isochrones
+        """
+
+        records = [(origin_id, level, self._render_cells(self.durations[idx] <= level))
+                   for (idx, origin_id) in enumerate(self.origin_ids) for level in levels]
+
+        return GeoDataFrame(records, columns=["origin_id", "duration", "geometry"], geometry="geometry",
+                            crs="EPSG:4326")
+
+    def render_coverage(self, levels):
+        """
+        Return GeoDataFrame of `duration` and MultiPolygon of the grid cells reached from any
+        origin within every level
+
+        Parameters
+        ----------
+        levels: list of float
+            Durations (in minutes) of the isochrones
+        """
+
+        records = [(level, self._render_cells(self.surface <= level)) for level in levels]
+
+        return GeoDataFrame(records, columns=["duration", "geometry"], geometry="geometry", crs="EPSG:4326")
+
+    def _render_cells(self, mask):
+        '''Return MultiPolygon union of the grid cells of a (rows, cols) boolean mask'''
+
+        (rows, cols) = np.nonzero(mask)
+
+        ## Edges computed the same way for neighbouring cells, so the union leaves no slivers
+        x = (self.xmin + np.arange(self.shape[1] + 1) * self.resolution).tolist()
+        y = (self.ymax - np.arange(self.shape[0] + 1) * self.resolution).tolist()
+
+        cells = unary_union([box(x[c], y[r + 1], x[c + 1], y[r]) for (r, c) in zip(rows.tolist(), cols.tolist())])
+
+        if cells.is_empty:
+            return MultiPolygon()
+
+        return MultiPolygon([cells]) if cells.geom_type == "Polygon" else cells
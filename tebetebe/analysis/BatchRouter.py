@@ -0,0 +1,211 @@
+from .. import defaults
+from .. import utils
+
+from shapely.wkt import loads as wktToLineString
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import threading
+import logging
+import time
+
+class BatchRouter():
+    """
+    Route many origin:dest pairs concurrently on a running scenario
+
+    Pairs are routed by `workers` threads sharing the scenario's query methods, and the
+    results are written into preallocated arrays. A pair which fails to route (ex. no route,
+    HTTP error) is logged and left empty without aborting the batch. Progress and throughput
+    are logged every `log_interval` seconds. With a ResultCache, routes already computed on the
+    same network are read from the cache.
+
+    Route geometries are requested as encoded polylines, the most compact format on the wire,
+    and decoded all at once into shapely LineStrings (see `utils.decode_polylines`). With
+    `annotations="nodes"`, the OSM node ids traversed by every route are collected as well.
+
+    Example
+    -------
+    >>> with scenario() as api:
+    >>>     router = BatchRouter(api, workers=16)
+    >>>     results = router(origin_coords, dest_coords)
+    >>>     router.get_stats()
+
+    Parameters
+    ----------
+    scenario: Scenario / ScenarioPool
+        Running scenario on which the routes will be calculated
+    workers: int, optional
+        Number of concurrent requests. Should be about the number of `osrm-routed` threads
+    log_interval: float, optional
+        Seconds between progress log entries
+    cache: ResultCache, optional
+        Persistent cache of computed routes
+    simplify: float, optional
+        Tolerance (in degrees) to simplify route geometries with while decoding them
+    **kwargs
+        Any additional parameters to be passed to `simple_route`
+    """
+
+    def __init__(self, scenario, workers=8, log_interval=10, cache=None, simplify=None, **kwargs):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.scenario = scenario
+        self.workers = workers
+        self.log_interval = log_interval
+        self.route_kwargs = {"geometry": "polyline", "overview": "full", **kwargs}
+        self.cache = cache
+        self.simplify = simplify
+
+        self.stats = None
+
+    def __call__(self, origins, dests):
+        """
+        Route every (origins[i], dests[i]) pair
+
+        Parameters
+        ----------
+        origins: list of 2-floats tuple
+            Origin coordinates as (x, y)
+        dests: list of 2-floats tuple
+            Destination coordinates as (x, y), same length as `origins`
+
+        Returns
+        -------
+        dict
+            Arrays of `duration`, `distance`, `geometry` (shapely LineString), `error` (None, or
+            the error message of a failed pair) and, with `annotations="nodes"`, `nodes` (array
+            of OSM node ids), in the order of the pairs
+        """
+
+        n_pairs = len(origins)
+        name = self.scenario.get_name()
+
+        results = {"duration": np.full(n_pairs, np.nan),
+                   "distance": np.full(n_pairs, np.nan),
+                   "geometry": np.empty(n_pairs, dtype=object),
+                   "error": np.empty(n_pairs, dtype=object)}
+
+        if "nodes" in str(self.route_kwargs.get("annotations", "")):
+            results["nodes"] = np.empty(n_pairs, dtype=object)
+
+        lock = threading.Lock()
+        progress = {"next": 0, "done": 0, "failed": 0, "cached": 0, "logged": time.time()}
+        fingerprint = self.scenario.get_network_fingerprint() if self.cache is not None else None
+        started = time.time()
+
+        def next_pair():
+            with lock:
+                idx = progress["next"]
+                progress["next"] += 1
+                return idx
+
+        def pair_done(failed, cached=False):
+            with lock:
+                progress["done"] += 1
+                progress["failed"] += failed
+                progress["cached"] += cached
+
+                if time.time() - progress["logged"] >= self.log_interval:
+                    progress["logged"] = time.time()
+                    self.log.info("{}: Routed {}/{} pairs ({:.1f} pairs/s)".format(
+                        name, progress["done"], n_pairs, progress["done"] / (time.time() - started)))
+
+        def worker():
+            idx = next_pair()
+
+            while idx < n_pairs:
+                try:
+                    route = self._get_route(fingerprint, origins[idx], dests[idx])
+
+                    results["duration"][idx] = route["duration"]
+                    results["distance"][idx] = route["distance"]
+                    results["geometry"][idx] = route["geometry"]
+
+                    if "nodes" in results:
+                        results["nodes"][idx] = np.array(route["nodes"], dtype=np.int64)
+
+                    pair_done(False, route.get("cached", False))
+
+                except Exception as exc:
+                    results["error"][idx] = str(exc)
+                    pair_done(True)
+
+                idx = next_pair()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(worker) for i in range(min(self.workers, max(1, n_pairs)))]:
+                future.result()
+
+        results["geometry"] = self._decode_geometries(results["geometry"])
+
+        seconds = time.time() - started
+
+        self.stats = {"pairs": n_pairs,
+                      "failed": progress["failed"],
+                      "cached": progress["cached"],
+                      "seconds": round(seconds, 2),
+                      "pairs_per_second": round(n_pairs / seconds, 1) if seconds > 0 else None}
+
+        self.log.info("{}: Routed {} pairs in {:.1f}s ({:.1f} pairs/s)".format(
+            name, n_pairs, seconds, n_pairs / seconds if seconds > 0 else 0))
+
+        if progress["failed"]:
+            self.log.warning("{}: {} pairs failed to route".format(name, progress["failed"]))
+
+        return results
+
+    def _get_route(self, fingerprint, origin, dest):
+        '''Return the first route between an origin and dest, from the cache if possible'''
+
+        if self.cache is None:
+            return self._route(origin, dest)
+
+        key = self.cache.get_key(fingerprint, "route", [origin, dest], **self.route_kwargs)
+        route = self.cache.get(key)
+
+        if route is not None:
+            return {**route, "cached": True}
+
+        route = self._route(origin, dest)
+
+        ## Only text geometries can be cached
+        if not isinstance(route["geometry"], bytes):
+            self.cache.put(key, route)
+
+        return route
+
+    def _route(self, origin, dest):
+        '''Return duration, distance, geometry (and traversed nodes) of the first route between an origin and dest'''
+
+        route = self.scenario.simple_route(origin, dest, **self.route_kwargs)["routes"][0]
+
+        result = {"duration": route["duration"],
+                  "distance": route["distance"],
+                  "geometry": route.get("geometry")} ## No geometry with overview="false"
+
+        if "nodes" in str(self.route_kwargs.get("annotations", "")):
+            result["nodes"] = [n for leg in route["legs"] for n in leg["annotation"]["nodes"]]
+
+        return result
+
+    def _decode_geometries(self, geometries):
+        '''Decode route geometries of the requested format into shapely LineStrings'''
+
+        geometry = self.route_kwargs["geometry"].lower()
+        routed = np.flatnonzero(geometries != None)
+
+        if geometry in ("polyline", "polyline6"):
+            geometries[routed] = utils.decode_polylines(geometries[routed].tolist(),
+                                                        precision=6 if geometry == "polyline6" else 5,
+                                                        simplify=self.simplify)
+        elif geometry in ("wkt", "well-known-text", "text"):
+            for idx in routed:
+                geometries[idx] = wktToLineString(geometries[idx])
+
+                if self.simplify:
+                    geometries[idx] = geometries[idx].simplify(self.simplify)
+
+        return geometries
+
+    def get_stats(self):
+        """Return dict of number of pairs, failed and cached pairs, seconds and throughput of the last batch"""
+        return self.stats
@@ -0,0 +1,277 @@
+from .. import defaults
+from .. import utils
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+import logging
+import math
+import time
+
+## k-nearest candidates are found with `dwithin` STRtree queries, new in shapely 2
+try:
+    from shapely import STRtree, points as shapely_points, box as shapely_box
+except ImportError: ## shapely < 2
+    STRtree = shapely_points = shapely_box = None
+
+def _require_shapely2():
+    if STRtree is None:
+        raise ImportError("shapely >= 2 is required for nearest facility analysis (pip install -U shapely)")
+
+class NearestFacility():
+    """
+    Find the nearest facility (ex. school, clinic) of every origin by route duration, without
+    routing every origin to every facility
+
+    Only the `k` facilities nearest to an origin as the crow flies are routed to, found with a
+    spatial index (STRtree). Distances are great-circle distances between the locations origins
+    and facilities snap to on the network (see `Scenario.snap`), which routes start and end at.
+    A facility farther than the k-th candidate can't be reached faster than that distance at
+    `max_speed`, so when the best routed duration of an origin is within that bound, its
+    nearest facility is exact. Otherwise, `k` is doubled for that origin and the new candidates
+    are routed, until the bound holds or every facility has been routed. Routing work grows
+    with origins x k instead of origins x facilities.
+
+    Candidate pairs are routed with `table` requests of at most `tile_size` origins by
+    `tile_size` facilities, grouping origins which share candidates.
+
+    Example
+    -------
+    >>> with scenario() as api:
+    >>>     nearest = NearestFacility(api, homesteads, clinics, max_speed=5, k=4)() ## walking
+
+    Parameters
+    ----------
+    scenario: Scenario / ScenarioPool
+        Running scenario on which the routes will be calculated
+    origins: POIDataset
+        Origin points. Index is used as origin id
+    facilities: POIDataset
+        Facility points. Index is used as facility id
+    max_speed: float
+        Maximum speed (in km/h) of the scenario's routing profile (ex. 5 for the default foot
+        profile). Results are exact as long as no route is faster, and candidates are only
+        pruned when routes are close to this speed, so a loose bound routes most facilities
+    k: int, optional
+        Initial number of candidate facilities per origin
+    tile_size: int, optional
+        Maximum number of origins and of facilities per request. Defaults to the scenario's
+        `max_table_size` (see `Scenario.get_max_table_size`)
+    workers: int, optional
+        Number of concurrent requests
+    """
+
+    def __init__(self, scenario, origins, facilities, max_speed, k=5, tile_size=None, workers=4):
+        _require_shapely2()
+
+        if not max_speed or max_speed <= 0:
+            raise ValueError("max_speed must be the positive maximum speed (km/h) of the routing profile")
+
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.scenario = scenario
+        self.origins = origins
+        self.facilities = facilities
+        self.k = k
+        self.max_speed = max_speed
+        self.tile_size = tile_size if tile_size else scenario.get_max_table_size()
+        self.workers = workers
+
+        self.stats = None
+
+    def __call__(self):
+        """
+        Find the nearest facility of every origin
+
+        Returns
+        -------
+        DataFrame
+            `facility_id`, route `duration` (seconds) and `distance` (meters) of the nearest
+            facility, indexed by origin id. Origins which can't reach any facility are NaN
+        """
+
+        name = self.scenario.get_name()
+        started = time.time()
+
+        origin_coords = np.column_stack([self.origins.geometry.x, self.origins.geometry.y])
+        facility_coords = np.column_stack([self.facilities.geometry.x, self.facilities.geometry.y])
+        (n_origins, n_facilities) = (len(origin_coords), len(facility_coords))
+
+        ## Routes start and end at the snapped locations, so distance bounds are measured there
+        if n_facilities:
+            origin_snapped = self.scenario.snap([tuple(c) for c in origin_coords.tolist()])["location"]
+            facility_snapped = self.scenario.snap([tuple(c) for c in facility_coords.tolist()])["location"]
+            tree = STRtree(shapely_points(facility_snapped))
+
+        durations = np.full(n_origins, np.nan)
+        distances = np.full(n_origins, np.nan)
+        nearest = np.full(n_origins, -1, dtype=np.int64)
+
+        pending = np.arange(n_origins) if n_facilities else np.array([], dtype=np.int64)
+        (k_done, k, rounds, routed) = (0, min(self.k, n_facilities), 0, 0)
+
+        while len(pending):
+            (candidates, bounds) = self._get_candidates(tree, facility_snapped, origin_snapped[pending], k)
+
+            ## Candidates are sorted by straight-line distance; route those not routed yet
+            pairs = (np.repeat(pending, k - k_done), candidates[:, k_done:].ravel())
+            (pair_durations, pair_distances) = self._route_pairs(origin_coords, facility_coords, *pairs)
+
+            ## Fastest new candidate of every origin, kept if faster than the previous best
+            pair_durations = np.where(np.isnan(pair_durations), np.inf, pair_durations)
+            order = np.lexsort((pair_durations, pairs[0]))
+            fastest = order[np.unique(pairs[0][order], return_index=True)[1]]
+            o = pairs[0][fastest]
+
+            better = pair_durations[fastest] < np.where(np.isnan(durations[o]), np.inf, durations[o])
+            (o, fastest) = (o[better], fastest[better])
+            (durations[o], distances[o], nearest[o]) = (pair_durations[fastest], pair_distances[fastest],
+                                                        pairs[1][fastest])
+
+            rounds += 1
+            routed += len(pairs[0])
+
+            ## Facilities beyond the k-th candidate take at least `bound` seconds to reach
+            bound = bounds[:, -1] / (self.max_speed / 3.6)
+            exact = (durations[pending] <= bound) | (k >= n_facilities)
+
+            if not exact.all():
+                self.log.info("{}: Widening nearest facility candidates of {} origins to k={}".format(
+                    name, (~exact).sum(), min(2 * k, n_facilities)))
+
+            pending = pending[~exact]
+            (k_done, k) = (k, min(2 * k, n_facilities))
+
+        facility_ids = np.full(n_origins, None, dtype=object)
+        facility_ids[nearest >= 0] = np.asarray(self.facilities.index, dtype=object)[nearest[nearest >= 0]]
+
+        result = pd.DataFrame({"facility_id": facility_ids,
+                               "duration": durations,
+                               "distance": distances}, index=self.origins.index)
+
+        seconds = time.time() - started
+
+        self.stats = {"origins": n_origins,
+                      "facilities": n_facilities,
+                      "routed_pairs": routed,
+                      "rounds": rounds,
+                      "seconds": round(seconds, 2)}
+
+        self.log.info("{}: Found nearest of {} facilities for {} origins with {} routed pairs in {:.1f}s".format(
+            name, n_facilities, n_origins, routed, seconds))
+
+        return result
+
+    def _get_candidates(self, tree, facility_coords, coords, k):
+        '''
+        Return (origins, k) arrays of the k nearest facilities of origin coordinates, and of their
+        great-circle distances in meters, sorted by distance
+        '''
+
+        n_facilities = len(facility_coords)
+        ((xmin, ymin), (xmax, ymax)) = (facility_coords.min(axis=0), facility_coords.max(axis=0))
+
+        ## Radius expected to hold k facilities if they were spread evenly, doubled until it does
+        meters_per_degree = math.radians(defaults.EARTH_RADIUS)
+        area = max((xmax - xmin) * math.cos(math.radians((ymin + ymax) / 2)) * (ymax - ymin) *
+                   meters_per_degree ** 2, 1.0)
+        radius = np.full(len(coords), max(math.sqrt(k * area / (math.pi * n_facilities)), 1.0))
+
+        candidates = np.zeros((len(coords), k), dtype=np.int64)
+        bounds = np.zeros((len(coords), k))
+        todo = np.arange(len(coords))
+
+        while len(todo):
+            (x, y) = coords[todo].T
+
+            ## Bounding box of every facility within the radius of an origin, spanning every
+            ## longitude when the radius reaches a pole
+            angle = radius[todo] / defaults.EARTH_RADIUS
+            dlat = np.degrees(angle)
+            ratio = np.sin(np.minimum(angle, math.pi / 2)) / np.cos(np.radians(y))
+            polar = (np.abs(y) + dlat >= 90) | (ratio >= 1)
+            dlon = np.degrees(np.arcsin(np.minimum(ratio, 1)))
+
+            boxes = shapely_box(np.where(polar, -180, x - dlon), y - dlat, np.where(polar, 180, x + dlon), y + dlat)
+            (src, dst) = tree.query(boxes, predicate="intersects")
+
+            dist = utils.haversine(coords[todo][src], facility_coords[dst])
+            within = dist <= radius[todo][src]
+            (src, dst, dist) = (src[within], dst[within], dist[within])
+
+            ## Every facility within the radius is found, so the k-th nearest of them is exact
+            enough = np.bincount(src, minlength=len(todo)) >= min(k, n_facilities)
+
+            keep = enough[src]
+            (src, dst, dist) = (src[keep], dst[keep], dist[keep])
+
+            ## Sort by origin, then distance, and keep the first k of every origin
+            order = np.lexsort((dist, src))
+            (src, dst, dist) = (src[order], dst[order], dist[order])
+            rank = np.arange(len(src)) - np.searchsorted(src, src)
+            first = rank < k
+
+            rows = np.searchsorted(np.flatnonzero(enough), src[first])
+            candidates[todo[enough][rows], rank[first]] = dst[first]
+            bounds[todo[enough][rows], rank[first]] = dist[first]
+
+            radius[todo[~enough]] *= 2
+            todo = todo[~enough]
+
+        return (candidates, bounds)
+
+    def _route_pairs(self, origin_coords, facility_coords, origins, facilities):
+        '''Return durations and distances of origin:facility pairs, routed with grouped table requests'''
+
+        pair_durations = np.full(len(origins), np.nan)
+        pair_distances = np.full(len(origins), np.nan)
+
+        ## Group origins in order of their first candidate, so neighbouring origins share requests
+        groups = []
+        by_origin = {}
+        for (pos, o) in enumerate(origins.tolist()):
+            by_origin.setdefault(o, []).append(pos)
+
+        sorted_origins = sorted(by_origin, key=lambda o: facilities[by_origin[o][0]])
+        (group_origins, group_facilities) = ([], set())
+
+        for o in sorted_origins:
+            o_facilities = set(facilities[by_origin[o]].tolist())
+
+            if group_origins and (len(group_origins) >= self.tile_size or
+                                  len(group_facilities | o_facilities) > self.tile_size):
+                groups.append((group_origins, sorted(group_facilities)))
+                (group_origins, group_facilities) = ([], set())
+
+            group_origins.append(o)
+            group_facilities |= o_facilities
+
+        if group_origins:
+            groups.append((group_origins, sorted(group_facilities)))
+
+        def run_group(group):
+            (g_origins, g_facilities) = group
+
+            response = self.scenario.table([tuple(c) for c in origin_coords[g_origins].tolist()],
+                                           coords_dest=[tuple(c) for c in facility_coords[g_facilities].tolist()],
+                                           output="raw", annotations="duration,distance")
+
+            g_durations = np.array(response["durations"], dtype=float)
+            g_distances = np.array(response["distances"], dtype=float)
+            columns = {f: j for (j, f) in enumerate(g_facilities)}
+
+            for (i, o) in enumerate(g_origins):
+                positions = by_origin[o]
+                cols = [columns[f] for f in facilities[positions].tolist()]
+
+                pair_durations[positions] = g_durations[i, cols]
+                pair_distances[positions] = g_distances[i, cols]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run_group, groups))
+
+        return (pair_durations, pair_distances)
+
+    def get_stats(self):
+        """Return dict of number of origins, facilities, routed pairs, rounds and seconds of the last run"""
+        return self.stats
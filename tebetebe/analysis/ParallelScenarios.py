@@ -1,3 +1,4 @@
+from ..BuildScheduler import BuildScheduler
 from .. import defaults
 import logging
 
@@ -10,15 +11,21 @@ class ParallelScenarios():
     ----------
     *args
         Arbitrary number of scenarios to be compiled, then executed in parallel
+    **kwargs
+        Arbitrary keyword arguments passed to the BuildScheduler compiling the scenarios
+        concurrently (`threads`, `memory`, `stage_threads`, `memory_factors`)
     """
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
 
         self.log = logging.getLogger(defaults.LOGGER)
         self.scenarios = {scenario.get_name(): scenario for scenario in args}
+        self.scheduler = BuildScheduler(*args, **kwargs)
 
     def __enter__(self):
+        self.scheduler()
+
         for scenario in self.scenarios.values():
-            scenario().__enter__()
+            scenario.__enter__()
 
         return self.scenarios
 
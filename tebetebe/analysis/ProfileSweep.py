@@ -0,0 +1,113 @@
+from ..BuildScheduler import BuildScheduler
+from ..Scenario import Scenario
+from .. import defaults
+from .. import utils
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import itertools
+import logging
+
+class ProfileSweep():
+    """
+    Run an analysis on every variant of a template RoutingProfile over a grid of parameters
+
+    Every combination of the `grid` parameter values is rendered into a profile (see
+    `RoutingProfile.render`) and a Scenario of the OSMDataset. The scenarios are compiled
+    concurrently by a BuildScheduler, so identical renders are compiled once and builds are
+    reused from the build cache. Every scenario is then served and passed to the analysis,
+    and the results are collected into one table, with a column per parameter.
+
+    Example
+    -------
+    >>> sweep = ProfileSweep(highways, tb.RoutingProfile("./profiles/walk_template.lua"),
+    >>>                      {"walking_speed": [4, 5], "ford_barrier": [False, True],
+    >>>                       "flood_prone_bridges": [True]}, extent=[homesteads, schools])
+    >>> results = sweep(lambda api: {"mean_duration": TiledTable(api)(o, d)["duration"].mean()})
+
+    Parameters
+    ----------
+    osm_dataset: OSMDataset
+        Route network of every scenario
+    template: RoutingProfile
+        Template profile with a `${param}` placeholder for every parameter of the grid
+    grid: dict
+        Parameter: list of values
+    name: str, optional
+        Prefix of the scenario names. Defaults to the template name
+    **kwargs
+        Arbitrary keyword arguments passed to every Scenario (ex. `tmp_dir`, `extent`)
+    """
+
+    def __init__(self, osm_dataset, template, grid, name=None, **kwargs):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.name = name if name else template.get_name()
+        self.variants = [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+
+        tmp_dir = kwargs.get("tmp_dir", defaults.TMP_DIR)
+        self.scenarios = []
+
+        for params in self.variants:
+            variant_name = "{}_{}".format(self.name, utils.hash_dict(params)[:8])
+            profile = template.render(name=variant_name, tmp_dir=tmp_dir, **params)
+
+            self.scenarios.append(Scenario(osm_dataset, profile, name=variant_name, **kwargs))
+
+    def __call__(self, analysis, workers=1, **kwargs):
+        '''
+        Compile every scenario, and run the analysis on each
+
+        Parameters
+        ----------
+        analysis: callable
+            Function of a running scenario, returning a dict (or Series) of results, a
+            DataFrame of results, or a single value
+        workers: int, optional
+            Number of scenarios served and analysed at once
+        **kwargs
+            Arbitrary keyword arguments passed to the BuildScheduler (`threads`, `memory`,
+            `stage_threads`, `memory_factors`)
+
+        Returns
+        -------
+        DataFrame
+            `scenario`, parameters and results of every variant. Variants which fail to compile
+            have no results
+        '''
+
+        compiled = BuildScheduler(*self.scenarios, **kwargs)()
+
+        def run_variant(variant):
+            (params, scenario) = variant
+            row = {"scenario": scenario.get_name(), **params}
+
+            if not compiled[scenario.get_name()]:
+                self.log.error("{}: Failed to compile, skipping analysis".format(scenario.get_name()))
+                return pd.DataFrame([row])
+
+            result = None ## Left empty if the scenario HTTP API fails
+
+            with scenario as api:
+                result = analysis(api)
+
+            if isinstance(result, pd.DataFrame):
+                return result.assign(**row)[[*row, *result.columns]]
+
+            if isinstance(result, pd.Series):
+                result = result.to_dict()
+
+            return pd.DataFrame([{**row, **(result if isinstance(result, dict) else {"result": result})}])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_variant, zip(self.variants, self.scenarios)))
+
+        return pd.concat(results, ignore_index=True)
+
+    def get_scenarios(self):
+        """Return list of the scenarios of every variant, in the order of the grid"""
+        return list(self.scenarios)
+
+    def get_variants(self):
+        """Return list of the parameters of every variant, in the order of the grid"""
+        return list(self.variants)
@@ -1,11 +1,17 @@
+from .TraversalIndex import TraversalIndex
+from .BatchRouter import BatchRouter
+from .RouteMatrix import RouteMatrix
+from .TiledTable import TiledTable
+from ..OverlayScenario import OverlayScenario
+from ..ResultCache import ResultCache
 from .. import defaults
+from .. import utils
 
-from shapely.wkt import loads as wktToLineString
+from concurrent.futures import ThreadPoolExecutor
 
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-import itertools
 import logging
 
 class RouteComparison():
@@ -23,10 +29,18 @@ class RouteComparison():
     dests_id_col: str, optional
         Column in `dests` dataset to be used as ID. Must be unique. If not specified, the index will be used
     cache: bool, optional
-        Whether to cache time matrices
+        Whether to cache route matrices in memory
+    result_cache: ResultCache / bool, optional
+        Persistent on-disk cache of table tiles and routes, reused across runs for as long as
+        the scenario network is unchanged. True to use a ResultCache with default options
+    collapse: str / float, optional
+        Only request one of the origins (and dests) which snap to the same network location
+        ("snap"), or lie within the same grid cell of `collapse` meters, when computing
+        duration matrices (see `TiledTable`)
     """
 
-    def __init__(self, origins, dests, origins_id_col=None, dests_id_col=None, cache=True):
+    def __init__(self, origins, dests, origins_id_col=None, dests_id_col=None, cache=True,
+                 result_cache=None, collapse=None):
 
         ## Set POIDataset indexes to id cols if specified, otherwise use row index
         self.origins = origins.set_index(origins_id_col) if origins_id_col else origins
@@ -36,57 +50,89 @@ class RouteComparison():
         self.od_pairs = self._get_index_pairs(self.origins, self.dests) \
                             .rename(columns={0: "origin_id", 1: "dest_id"})
 
-        ## Set up cache
+        ## Set up cache. Matrices are keyed by the fingerprint of the network they were
+        ## computed on, so a recompiled scenario with the same name is not served stale results
         self.cache = cache
-        self.duration_matrix = {}
+        self.route_matrix = {}
+        self.traversal_index = {}
+        self.result_cache = ResultCache() if result_cache is True else \
+            result_cache if result_cache else None
+        self.collapse = collapse
 
     ##
     ## Base Functions
 
-    def get_duration_matrix(self, scenario, melted=False):
+    def get_route_matrix(self, scenario, distances=False, workers=4):
         """
-        Calculate a duration matrix between `origins` and `dests`
+        Calculate a RouteMatrix of durations (and distances) between `origins` and `dests`. Large
+        matrices are split into `table` requests within the scenario's `max_table_size` (see `TiledTable`)
 
         Parameters
         ----------
         scenario: Scenario
-            Scenario to run calculate the duration matrix on
-        melted: bool, optional
-            Whether the matrix should be returned as a matrix DF, or melted into `origin_id` `dest_id` and `duration` columns
+            Scenario to calculate the matrix on
+        distances: bool, optional
+            Whether to calculate route distances in addition to durations
+        workers: int, optional
+            Number of `table` requests run concurrently
 
         Returns
         -------
-        pd.DataFrame
-            Duration Matrix DataFrame
+        RouteMatrix
         """
 
         s = scenario.get_name()
+        fingerprint = scenario.get_network_fingerprint()
+        matrix = self.route_matrix.get(fingerprint)
 
-        ## If hasn't been computed or cache is off
-        if s not in self.duration_matrix:
-
-            origin_ids = self.origins.index.tolist()
+        ## If hasn't been computed (with distances if needed) or cache is off
+        if matrix is None or (distances and matrix.distances is None):
             origin_coords = self.origins.geometry.apply(lambda o: (o.x, o.y)).tolist()
-
-            dest_ids = self.dests.index.tolist()
             dest_coords = self.dests.geometry.apply(lambda d: (d.x, d.y)).tolist()
 
-            (matrix, origin_snap, dest_snap) \
-                = scenario.table(origin_coords,
-                                 coords_dest = dest_coords,
-                                 output = "np")
+            annotations = ("duration", "distance") if distances else ("duration",)
+            ## Snap hints need the HTTP API
+            tables = TiledTable(scenario, workers=workers, cache=self.result_cache,
+                                hints=scenario.config is not None, collapse=self.collapse) \
+                (origin_coords, dest_coords, annotations=annotations)
 
-            ## Transform matrix to proper dataframe with index&columns
-            matrix = pd.DataFrame(matrix, columns = dest_ids, index = origin_ids)
+            matrix = RouteMatrix(tables["duration"], self.origins.index, self.dests.index,
+                                 distances=tables.get("distance"), name=s)
 
             if self.cache:
-                self.duration_matrix[s] = matrix
-            else:
-                return matrix
+                self.route_matrix[fingerprint] = matrix
+
+        ## Matrices of identical networks are shared between scenarios, under their own name
+        if matrix.get_name() != s:
+            matrix = RouteMatrix(matrix.durations, matrix.origin_ids, matrix.dest_ids,
+                                 distances=matrix.distances, name=s)
+
+        return matrix
+
+    def get_duration_matrix(self, scenario, melted=False, workers=4):
+        """
+        Calculate a duration matrix between `origins` and `dests`
+
+        Parameters
+        ----------
+        scenario: Scenario
+            Scenario to run calculate the duration matrix on
+        melted: bool, optional
+            Whether the matrix should be returned as a matrix DF, or melted into `origin_id` `dest_id` and `duration` columns
+        workers: int, optional
+            Number of `table` requests run concurrently
+
+        Returns
+        -------
+        pd.DataFrame
+            Duration Matrix DataFrame
+        """
 
-        return self.duration_matrix[s] if not melted else self._melt_duration_matrix(self.duration_matrix[s], scenario)
+        matrix = self.get_route_matrix(scenario, workers=workers)
 
-    def get_routes(self, scenario, od_pairs=None):
+        return matrix.to_frame() if not melted else matrix.melt()
+
+    def get_routes(self, scenario, od_pairs=None, workers=8, simplify=None):
         """
         Get routes between origins and dests
 
@@ -96,11 +142,16 @@ class RouteComparison():
             Scenario on which the origin:dest routes will be calculated
         od_pairs: pd.DataFrame, optional
             DataFrame of origin:dest pairs in two columns `origin_id` and `dest_id` for calculation. If not specified, all pairwise origin:dest routes will be calculated.
+        workers: int, optional
+            Number of routes requested concurrently (see `BatchRouter`)
+        simplify: float, optional
+            Tolerance (in degrees) to simplify route geometries with
 
         Returns
         -------
         GeoDataFrame
-           GDF with duration, distance, and route geometry for each origin:dest pair
+           GDF with duration, distance, and route geometry for each origin:dest pair. Pairs which
+           failed to route have a null duration, distance and geometry
         """
 
         s = scenario.get_name()
@@ -118,27 +169,20 @@ class RouteComparison():
                          .merge(dests_geom.to_frame(), left_on="dest_id",
                                 right_index=True)
 
-        ## Calculate an OSRM simple_route for a given diff_routes row
-        def route_from_row(api, row):
-            route = api.simple_route(row["origin_geom"], row["dest_geom"],
-                                     geometry = 'wkt', overview="full")
-
-            r_index = ["{}_duration".format(s), "{}_distance".format(s), "geometry"]
-
-            return pd.Series([route['routes'][0]['duration'],
-                              route['routes'][0]['distance'],
-                              wktToLineString(route["routes"][0]["geometry"])],
-                             index=r_index)
-
-        route_info = routes.apply(lambda r: route_from_row(scenario, r),
-                                  result_type="expand", axis=1)
+        ## Route all pairs concurrently
+        results = BatchRouter(scenario, workers=workers, cache=self.result_cache, simplify=simplify) \
+            (routes["origin_geom"].tolist(), routes["dest_geom"].tolist())
 
         ## Drop point geoms and scenario duration from routes DF (if exists. it will be added
-        ## by route_info anyway). Then, join to route info returned, then return GDF
-        routes.drop(columns=['origin_geom', 'dest_geom', '{}_duration'.format(scenario.get_name())],
-                    inplace=True, errors="ignore")
+        ## by the route results anyway). Then, add route results, then return GDF
+        routes = routes.drop(columns=['origin_geom', 'dest_geom', '{}_duration'.format(s)],
+                             errors="ignore")
+
+        routes["{}_duration".format(s)] = results["duration"]
+        routes["{}_distance".format(s)] = results["distance"]
+        routes["geometry"] = results["geometry"]
 
-        return gpd.GeoDataFrame(routes.join(route_info))
+        return gpd.GeoDataFrame(routes, geometry="geometry")
 
     def get_duration_table(self, *args):
         """
@@ -155,51 +199,193 @@ class RouteComparison():
             DF of origin:dest pairs and durations for each scenario
         """
 
-        table = self.get_duration_matrix(args[0], melted=True)
-
-        for s_idx in range(1, len(args)):
-            table = table.merge(self.get_duration_matrix(args[s_idx], melted=True))
-
-        return table
+        return RouteMatrix.melt_many([self.get_route_matrix(scenario) for scenario in args])
 
     ##
     ## Higher level
 
-    def get_difference(self, scenario0, scenario1):
-        """Get DF of origin:dest pairs whos routes differ between scenarios"""
-        duration_table = self.get_duration_table(scenario0, scenario1)
+    def get_traversal_index(self, scenario, workers=8):
+        """
+        Get the index of the OSM nodes traversed by the routes of all origin:dest pairs on a
+        scenario, in the order of `od_pairs`. Building the index routes every pair once; it is
+        then reused for any variant of the scenario (see `get_difference`)
 
-        s0_duration = duration_table['{}_duration'.format(scenario0.get_name())]
-        s1_duration = duration_table['{}_duration'.format(scenario1.get_name())]
+        Parameters
+        ----------
+        scenario: Scenario
+            Baseline scenario
+        workers: int, optional
+            Number of routes requested concurrently
+
+        Returns
+        -------
+        TraversalIndex
+        """
 
-        return duration_table[s0_duration != s1_duration]
+        fingerprint = scenario.get_network_fingerprint()
+
+        if fingerprint not in self.traversal_index:
+            origins_geom = self.origins.geometry.apply(lambda o: (o.x, o.y))
+            dests_geom = self.dests.geometry.apply(lambda d: (d.x, d.y))
+
+            results = BatchRouter(scenario, workers=workers, cache=self.result_cache,
+                                  annotations="nodes", overview="false") \
+                (origins_geom.loc[self.od_pairs["origin_id"]].tolist(),
+                 dests_geom.loc[self.od_pairs["dest_id"]].tolist())
+
+            self.traversal_index[fingerprint] = TraversalIndex(results["nodes"])
+
+        return self.traversal_index[fingerprint]
+
+    def get_variant_matrix(self, baseline, variant, segments=None, nodes=None, workers=4):
+        """
+        Get the RouteMatrix of a variant of a baseline scenario which only slows down or closes
+        segments, by routing on the variant only the pairs whose baseline route crosses a changed
+        segment or node, or which have no baseline route. All other pairs keep their baseline
+        duration.
+
+        Parameters
+        ----------
+        baseline: Scenario
+            Baseline scenario
+        variant: Scenario
+            Variant of the baseline, with slowed down or closed segments only
+        segments: iterable of (int, int), optional
+            Changed (from OSM node id, to OSM node id) segments
+        nodes: iterable of int, optional
+            Changed OSM node ids
+
+        Returns
+        -------
+        RouteMatrix
+        """
+
+        matrix0 = self.get_route_matrix(baseline, workers=workers)
+        index = self.get_traversal_index(baseline)
+        affected = np.union1d(index.get_pairs(segments=segments, nodes=nodes), index.unrouted)
+
+        ## od_pairs are in row-major (origin, dest) order
+        (rows, cols) = np.divmod(affected, len(self.dests))
+        durations = np.array(matrix0.durations)
+
+        groups = self._get_pair_groups(rows, cols)
+        variant_durations = np.full(durations.shape, np.nan)
+
+        origin_coords = self.origins.geometry.apply(lambda o: (o.x, o.y)).tolist()
+        dest_coords = self.dests.geometry.apply(lambda d: (d.x, d.y)).tolist()
+
+        def route_group(group):
+            (g_rows, g_cols) = group
+
+            variant_durations[np.ix_(g_rows, g_cols)] = \
+                TiledTable(variant, workers=1, cache=self.result_cache, hints=variant.config is not None,
+                           collapse=self.collapse)([origin_coords[i] for i in g_rows],
+                                                   [dest_coords[j] for j in g_cols])["duration"]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(route_group, groups))
+
+        durations[rows, cols] = variant_durations[rows, cols]
+
+        logging.getLogger(defaults.LOGGER).info(
+            "{}: Routed {} pairs in {} tables for {} of {} pairs crossing changed segments or without "
+            "baseline route".format(variant.get_name(), sum(len(r) * len(c) for (r, c) in groups), len(groups),
+                                   len(affected), durations.size))
+
+        return RouteMatrix(durations, matrix0.origin_ids, matrix0.dest_ids, name=variant.get_name())
+
+    def get_difference(self, scenario0, scenario1, segments=None, nodes=None):
+        """
+        Get DF of origin:dest pairs whos routes differ between scenarios, including pairs only routable in one
+
+        If `scenario1` only slows down or closes segments of `scenario0`, pass the changed
+        `segments` and/or `nodes` so that only the pairs whose `scenario0` route crosses them are
+        routed on `scenario1` (see `get_variant_matrix`). For an OverlayScenario derived from
+        `scenario0` with closures only (speed 0), the changed segments are found automatically.
+        """
+
+        (segments, nodes) = (segments, nodes) if segments or nodes else self._get_closures(scenario0, scenario1)
+
+        matrix0 = self.get_route_matrix(scenario0)
+        matrix1 = self.get_route_matrix(scenario1) if not (segments or nodes) \
+            else self.get_variant_matrix(scenario0, scenario1, segments=segments, nodes=nodes)
+
+        (d0, d1) = (matrix0.durations, matrix1.durations)
+        differ = (d0 != d1) & ~(np.isnan(d0) & np.isnan(d1))
+
+        return RouteMatrix.melt_many([matrix0, matrix1], mask=differ)
 
     def get_same(self, scenario0, scenario1):
         """Get DF of origin:dest pairs whos routes are the same between scenarios"""
-        duration_table = self.get_duration_table(scenario0, scenario1)
+        matrix0 = self.get_route_matrix(scenario0)
+        matrix1 = self.get_route_matrix(scenario1)
 
-        s0_duration = duration_table['{}_duration'.format(scenario0.get_name())]
-        s1_duration = duration_table['{}_duration'.format(scenario1.get_name())]
+        return RouteMatrix.melt_many([matrix0, matrix1], mask=matrix0.durations == matrix1.durations)
 
-        return duration_table[s0_duration == s1_duration]
+    def get_extent(self, method="hull"):
+        """
+        Get extent of the origins and dests, to limit a Scenario's OSMDataset (see `Scenario` `extent`)
+
+        Parameters
+        ----------
+        method: str, optional
+            Either "hull" (convex hull) or "bbox" (bounding box)
+
+        Returns
+        -------
+        shapely Polygon
+        """
+        return utils.get_extent(self.origins, self.dests, method=method)
 
     ##
     ## Utils
 
-    def _get_index_pairs(self, df0, df1):
-        df0_ids = df0.index.tolist()
-        df1_ids = df1.index.tolist()
+    def _get_closures(self, scenario0, scenario1):
+        '''
+        Return (segments, nodes) closed by an OverlayScenario of scenario0, or (None, None) if
+        scenario1 is not an OverlayScenario of scenario0 or changes anything else than closures
+        '''
+
+        if not isinstance(scenario1, OverlayScenario) or \
+           scenario1.get_base().get_fingerprint() != scenario0.get_network_fingerprint():
+            return (None, None)
+
+        speeds = scenario1.get_segment_speeds()
+
+        ## Turn penalties or slowdowns may be speed-ups from the profile values
+        if scenario1.turn_penalties or any(speed != 0 for speed in speeds.values()):
+            return (None, None)
+
+        return (list(speeds.keys()), None)
+
+    def _get_pair_groups(self, rows, cols):
+        '''
+        Return list of (origin indices, dest indices) tables covering (origin, dest) index pairs.
+        Pairs are covered by one table if they are dense enough, otherwise by one table per group
+        of origins with the same dests, so that pairs spread out don't request the whole matrix
+        '''
 
-        return pd.DataFrame(list(itertools.product(df0_ids, df1_ids)))
+        if not len(rows):
+            return []
 
-    def _melt_duration_matrix(self, matrix, scenario):
-        """Melt a duration matrix into an origin_id:dest_id DF with duration"""
+        (origin_idx, dest_idx) = (np.unique(rows), np.unique(cols))
 
-        index_rename = {"level_0": "origin_id",
-                        "level_1": "dest_id"}
+        if len(origin_idx) * len(dest_idx) <= 2 * len(rows):
+            return [(origin_idx, dest_idx)]
+
+        dests_of = {}
+        for (row, col) in zip(rows.tolist(), cols.tolist()):
+            dests_of.setdefault(row, []).append(col)
+
+        origins_of = {}
+        for (row, row_cols) in dests_of.items():
+            origins_of.setdefault(tuple(sorted(row_cols)), []).append(row)
+
+        return [(np.array(g_rows), np.array(g_cols)) for (g_cols, g_rows) in origins_of.items()]
+
+    def _get_index_pairs(self, df0, df1):
+        df0_ids = df0.index.values
+        df1_ids = df1.index.values
 
-        return matrix.stack().reset_index() \
-                             .rename(columns={
-                                 **index_rename,
-                                 **{0: "{}_duration".format(scenario.get_name())}
-                             })
+        return pd.DataFrame({0: np.repeat(df0_ids, len(df1_ids)),
+                             1: np.tile(df1_ids, len(df0_ids))})
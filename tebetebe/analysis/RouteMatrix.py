@@ -0,0 +1,153 @@
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+import json
+
+class RouteMatrix():
+    """
+    Compact origins x dests matrix of route durations (and distances) of a scenario
+
+    Durations and distances are kept as float32 arrays indexed by the origin and dest ids,
+    and are only melted into a long DataFrame when asked. Matrices can be saved to a folder of
+    `.npy` files and loaded back memory-mapped, so large matrices don't need to fit in memory.
+    Unroutable pairs are NaN.
+
+    Parameters
+    ----------
+    durations: np.ndarray
+        (origins, dests) array of route durations in seconds
+    origin_ids: list / pd.Index
+        Origin ids, in the order of the matrix rows
+    dest_ids: list / pd.Index
+        Dest ids, in the order of the matrix columns
+    distances: np.ndarray, optional
+        (origins, dests) array of route distances in meters
+    name: str, optional
+        Scenario name, used in melted column names
+    """
+
+    def __init__(self, durations, origin_ids, dest_ids, distances=None, name=None):
+        self.durations = durations if durations.dtype == np.float32 else durations.astype(np.float32)
+        self.distances = distances if distances is None or distances.dtype == np.float32 \
+            else distances.astype(np.float32)
+
+        self.origin_ids = pd.Index(origin_ids, name="origin_id")
+        self.dest_ids = pd.Index(dest_ids, name="dest_id")
+        self.name = name
+
+        if self.durations.shape != (len(self.origin_ids), len(self.dest_ids)):
+            raise ValueError("Matrix shape {} does not match {} origins and {} dests".format(
+                self.durations.shape, len(self.origin_ids), len(self.dest_ids)))
+
+    @property
+    def shape(self):
+        return self.durations.shape
+
+    def get_name(self):
+        """Return the scenario name of the matrix"""
+        return self.name
+
+    def to_frame(self, annotation="duration"):
+        """Return the `duration` or `distance` matrix as a DataFrame indexed by origin and dest ids"""
+        values = self.durations if annotation == "duration" else self.distances
+        return pd.DataFrame(values, index=self.origin_ids, columns=self.dest_ids)
+
+    def melt(self, mask=None):
+        """
+        Melt the matrix into a DataFrame of `origin_id`, `dest_id`, `{name}_duration` (and
+        `{name}_distance`) columns, one row per origin:dest pair
+
+        Parameters
+        ----------
+        mask: np.ndarray, optional
+            (origins, dests) boolean array of the pairs to be included. Defaults to all pairs
+        """
+
+        return self.melt_many([self], mask=mask)
+
+    @staticmethod
+    def melt_many(matrices, mask=None):
+        """
+        Melt matrices of several scenarios sharing origins and dests into a single DataFrame,
+        with one duration (and distance) column per scenario
+
+        Parameters
+        ----------
+        matrices: list of RouteMatrix
+            Matrices with identical origin and dest ids
+        mask: np.ndarray, optional
+            (origins, dests) boolean array of the pairs to be included. Defaults to all pairs
+        """
+
+        first = matrices[0]
+
+        for matrix in matrices[1:]:
+            if not (matrix.origin_ids.equals(first.origin_ids) and matrix.dest_ids.equals(first.dest_ids)):
+                raise ValueError("{}: Matrix origins/dests differ from {}".format(matrix.get_name(), first.get_name()))
+
+        ## Pairs in row-major (origin, dest) order
+        if mask is None:
+            table = {"origin_id": np.repeat(first.origin_ids.values, first.shape[1]),
+                     "dest_id": np.tile(first.dest_ids.values, first.shape[0])}
+            select = lambda values: values.ravel()
+        else:
+            (rows, cols) = np.nonzero(mask)
+            table = {"origin_id": first.origin_ids.values[rows],
+                     "dest_id": first.dest_ids.values[cols]}
+            select = lambda values: values[rows, cols]
+
+        for matrix in matrices:
+            table["{}_duration".format(matrix.get_name())] = select(matrix.durations)
+
+            if matrix.distances is not None:
+                table["{}_distance".format(matrix.get_name())] = select(matrix.distances)
+
+        return pd.DataFrame(table)
+
+    def save(self, path):
+        """
+        Save the matrix to a folder of `.npy` arrays and an `index.json` of the origin and dest ids
+
+        Parameters
+        ----------
+        path: str
+            Output folder
+        """
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        np.save(path / "durations.npy", self.durations)
+
+        if self.distances is not None:
+            np.save(path / "distances.npy", self.distances)
+
+        (path / "index.json").write_text(json.dumps({"name": self.name,
+                                                     "origin_ids": self.origin_ids.tolist(),
+                                                     "dest_ids": self.dest_ids.tolist()}))
+
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a matrix saved with `save`
+
+        Parameters
+        ----------
+        path: str
+            Folder of the saved matrix
+        mmap: bool, optional
+            Memory-map the arrays read-only instead of reading them into memory
+        """
+
+        path = Path(path)
+        mmap_mode = "r" if mmap else None
+        index = json.loads((path / "index.json").read_text())
+
+        distances_path = path / "distances.npy"
+        distances = np.load(distances_path, mmap_mode=mmap_mode) if distances_path.is_file() else None
+
+        return cls(np.load(path / "durations.npy", mmap_mode=mmap_mode),
+                   index["origin_ids"], index["dest_ids"], distances=distances, name=index["name"])
@@ -0,0 +1,189 @@
+from .. import defaults
+from .. import utils
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import threading
+import logging
+import time
+
+class TiledTable():
+    """
+    Compute large duration/distance matrices on a running scenario with many `table` requests
+
+    The origins x dests matrix is split into tiles of at most `tile_size` origins by `tile_size`
+    dests, so every request stays within the `--max-table-size` limit of `osrm-routed` (100 by
+    default). Tiles are requested by `workers` threads and written straight into preallocated
+    arrays. Progress and throughput are logged every `log_interval` seconds. With a
+    ResultCache, tiles already computed on the same network are read from the cache.
+
+    With `hints=True`, origins and dests are snapped to the network once (see `Scenario.snap`)
+    and their hints are sent along with every tile, so routed skips snapping them again.
+
+    With `collapse`, origins (and dests) which snap to the same network location, or fall in
+    the same grid cell of `collapse` meters, are only requested once: the matrix is computed
+    between the first coordinate of every group and expanded back to all coordinates.
+
+    Example
+    -------
+    >>> with scenario() as api:
+    >>>     durations = TiledTable(api, workers=4)(origin_coords, dest_coords)["duration"]
+
+    Parameters
+    ----------
+    scenario: Scenario / ScenarioPool
+        Running scenario on which the matrix will be calculated
+    tile_size: int, optional
+        Maximum number of origins and of dests per request. Defaults to the scenario's
+        `max_table_size` (see `Scenario.get_max_table_size`)
+    workers: int, optional
+        Number of concurrent requests
+    log_interval: float, optional
+        Seconds between progress log entries
+    cache: ResultCache, optional
+        Persistent cache of computed tiles
+    hints: bool, optional
+        Send the snap hints of origins and dests with every tile
+    collapse: str / float, optional
+        "snap" to group coordinates by snapped location, or tolerance in meters to group
+        coordinates by grid cell
+    """
+
+    def __init__(self, scenario, tile_size=None, workers=4, log_interval=10, cache=None, hints=False,
+                 collapse=None):
+        self.log = logging.getLogger(defaults.LOGGER)
+        self.scenario = scenario
+        self.tile_size = tile_size if tile_size else scenario.get_max_table_size()
+        self.workers = workers
+        self.log_interval = log_interval
+        self.cache = cache
+        self.hints = hints
+        self.collapse = collapse
+
+        self.stats = None
+
+    def __call__(self, origins, dests, annotations=("duration",)):
+        """
+        Compute the matrix of every annotation between origins and dests
+
+        Parameters
+        ----------
+        origins: list of 2-floats tuple
+            Origin coordinates as (x, y)
+        dests: list of 2-floats tuple
+            Destination coordinates as (x, y)
+        annotations: tuple of str, optional
+            Matrices to compute, "duration" (seconds) and/or "distance" (meters)
+
+        Returns
+        -------
+        dict
+            Annotation: (len(origins), len(dests)) array. Unroutable pairs are NaN
+        """
+
+        name = self.scenario.get_name()
+
+        if self.collapse:
+            (origins, origins_inverse) = self._collapse(origins)
+            (dests, dests_inverse) = self._collapse(dests)
+
+        n_origins, n_dests = len(origins), len(dests)
+
+        matrices = {a: np.full((n_origins, n_dests), np.nan) for a in annotations}
+
+        tiles = [(i, j) for i in range(0, n_origins, self.tile_size)
+                        for j in range(0, n_dests, self.tile_size)]
+
+        fingerprint = self.scenario.get_network_fingerprint() if self.cache is not None else None
+
+        if self.hints:
+            origin_hints = self.scenario.snap(origins)["hint"].tolist()
+            dest_hints = self.scenario.snap(dests)["hint"].tolist()
+
+        lock = threading.Lock()
+        progress = {"done": 0, "cached": 0, "pairs": 0, "logged": time.time()}
+        started = time.time()
+
+        def run_tile(tile):
+            (i, j) = tile
+            (i_end, j_end) = (min(i + self.tile_size, n_origins), min(j + self.tile_size, n_dests))
+
+            key = None if self.cache is None else \
+                self.cache.get_key(fingerprint, "table", list(origins[i:i_end]) + list(dests[j:j_end]),
+                                   sources=i_end - i, annotations=list(annotations))
+            values = None if key is None else self.cache.get(key)
+            cached = values is not None
+
+            if not cached and self.hints:
+                response = self.scenario.request("table", list(origins[i:i_end]) + list(dests[j:j_end]),
+                                                 sources=range(i_end - i),
+                                                 destinations=range(i_end - i, i_end - i + j_end - j),
+                                                 hints=origin_hints[i:i_end] + dest_hints[j:j_end],
+                                                 annotations=",".join(annotations))
+            elif not cached:
+                response = self.scenario.table(origins[i:i_end], coords_dest=dests[j:j_end],
+                                               output="raw", annotations=",".join(annotations))
+
+            if not cached:
+                values = np.array([np.array(response["{}s".format(a)], dtype=float) for a in annotations])
+
+                if key is not None:
+                    self.cache.put(key, values)
+
+            for (a_idx, a) in enumerate(annotations):
+                matrices[a][i:i_end, j:j_end] = values[a_idx]
+
+            with lock:
+                progress["done"] += 1
+                progress["cached"] += cached
+                progress["pairs"] += (i_end - i) * (j_end - j) ## Edge tiles are smaller than tile_size
+
+                if time.time() - progress["logged"] >= self.log_interval:
+                    progress["logged"] = time.time()
+                    self.log.info("{}: Computed {}/{} table tiles ({:.0f} pairs/s)".format(
+                        name, progress["done"], len(tiles),
+                        progress["pairs"] / (time.time() - started)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run_tile, tiles))
+
+        seconds = time.time() - started
+        n_pairs = n_origins * n_dests
+
+        if self.collapse:
+            matrices = {a: m[origins_inverse][:, dests_inverse] for (a, m) in matrices.items()}
+
+            self.log.info("{}: Collapsed {}x{} table to {}x{}".format(
+                name, len(origins_inverse), len(dests_inverse), n_origins, n_dests))
+
+        self.stats = {"pairs": n_pairs,
+                      "expanded_pairs": matrices[annotations[0]].size,
+                      "tiles": len(tiles),
+                      "cached_tiles": progress["cached"],
+                      "seconds": round(seconds, 2),
+                      "pairs_per_second": round(n_pairs / seconds, 1) if seconds > 0 else None}
+
+        self.log.info("{}: Computed {}x{} table in {} tiles ({} cached) in {:.1f}s ({:.0f} pairs/s)".format(
+            name, n_origins, n_dests, len(tiles), progress["cached"], seconds,
+            n_pairs / seconds if seconds > 0 else 0))
+
+        return matrices
+
+    def _collapse(self, coords):
+        '''Return the first coordinate of every group of coordinates, and the group of every coordinate'''
+
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+
+        if self.collapse == "snap":
+            keys = self.scenario.snap(coords.tolist())["location"]
+        else:
+            keys = utils.get_grid_cells(coords, float(self.collapse))
+
+        (_, first, inverse) = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+
+        return ([tuple(c) for c in coords[first].tolist()], inverse.reshape(-1))
+
+    def get_stats(self):
+        """Return dict of number of requested and expanded pairs, tiles, cached tiles, seconds and throughput of the last matrix"""
+        return self.stats
@@ -0,0 +1,68 @@
+import numpy as np
+
+class TraversalIndex():
+    """
+    Index of the OSM nodes and segments traversed by the routes of many origin:dest pairs
+
+    Built from the routes of a baseline scenario (see `RouteComparison.get_traversal_index`),
+    the index returns the pairs whose route crosses a set of changed segments or nodes. When a
+    variant of the baseline only slows down or closes segments, the route of any other pair is
+    unchanged, so only the returned pairs need to be routed on the variant. This does not hold
+    for speed-ups or new segments, which can attract routes that never used them.
+
+    Pairs without a baseline route (ex. a failed request) can't be ruled out, so they are
+    listed in `unrouted` and should be routed on the variant as well.
+
+    Parameters
+    ----------
+    nodes: list of np.ndarray
+        OSM node ids traversed by the route of every pair, in order. None for unrouted pairs
+    """
+
+    def __init__(self, nodes):
+        lengths = np.array([len(n) if n is not None else 0 for n in nodes], dtype=np.int64)
+
+        self.n_pairs = len(nodes)
+        self.nodes = np.concatenate([n for n in nodes if n is not None] + [np.array([], dtype=np.int64)]) \
+                       .astype(np.int64)
+        self.pairs = np.repeat(np.arange(self.n_pairs), lengths)
+        self.unrouted = np.array([i for (i, n) in enumerate(nodes) if n is None], dtype=np.int64)
+
+    def get_pairs(self, segments=None, nodes=None):
+        """
+        Return the pairs whose route traverses any of the given segments or nodes
+
+        Parameters
+        ----------
+        segments: iterable of (int, int), optional
+            Directed (from OSM node id, to OSM node id) segments
+        nodes: iterable of int, optional
+            OSM node ids (ex. the via node of a turn penalty)
+
+        Returns
+        -------
+        np.ndarray
+            Sorted positions of the pairs, in the order the index was built with
+        """
+
+        affected = [np.array([], dtype=np.int64)]
+
+        if nodes:
+            node_ids = np.fromiter(nodes, dtype=np.int64)
+            affected.append(self.pairs[np.isin(self.nodes, node_ids)])
+
+        if segments:
+            segments = set((int(n0), int(n1)) for (n0, n1) in segments)
+            from_ids = np.fromiter((n0 for (n0, n1) in segments), dtype=np.int64)
+
+            ## Candidate steps start at a segment's from node and stay within the same route
+            steps = np.flatnonzero(np.isin(self.nodes[:-1], from_ids) & (self.pairs[:-1] == self.pairs[1:]))
+            crossed = [(n0, n1) in segments for (n0, n1) in zip(self.nodes[steps].tolist(),
+                                                               self.nodes[steps + 1].tolist())]
+
+            affected.append(self.pairs[steps[np.array(crossed, dtype=bool)]])
+
+        return np.unique(np.concatenate(affected))
+
+    def __len__(self):
+        return self.n_pairs
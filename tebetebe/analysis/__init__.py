@@ -3,3 +3,10 @@
 from .ParallelScenarios import ParallelScenarios
 from .AccessIsochrone import AccessIsochrone
 from .RouteComparison import RouteComparison
+from .BatchRouter import BatchRouter
+from .TiledTable import TiledTable
+from .RouteMatrix import RouteMatrix
+from .TraversalIndex import TraversalIndex
+from .BatchIsochrone import BatchIsochrone
+from .NearestFacility import NearestFacility
+from .ProfileSweep import ProfileSweep
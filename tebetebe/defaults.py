@@ -4,7 +4,14 @@ import tempfile
 from pathlib import Path
 
 TMP_DIR = Path(tempfile.gettempdir())
+CACHE_DIR = TMP_DIR / "tebetebe_cache"
+REGISTRY_DIR = TMP_DIR / "tebetebe_registry"
+RESULT_CACHE = CACHE_DIR / "results.sqlite"
 OVERWRITE = False
 VERBOSE = False
+MAX_TABLE_SIZE = 100 ## osrm-routed default --max-table-size
+EXTENT_BUFFER = 5000 ## meters of detour around a Scenario extent
+EARTH_RADIUS = 6371008.8 ## mean earth radius in meters
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 LOGGER = "tebetebe"
 LOGGER_LEVEL = 20
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import osrm
+
+from functools import partial
+
+from .. import utils
+
+class HTTPEngine():
+    """
+    Query engine sending requests to an `osrm-routed` HTTP server with `python-osrm`
+    (https://github.com/ustroetz/python-osrm). This is the default Scenario engine.
+
+    Parameters
+    ----------
+    port : int
+        Port of the `osrm-routed` HTTP server on localhost
+    """
+
+    name = "http"
+
+    def __init__(self, port):
+        self.port = port
+        self.config = osrm.RequestConfig("127.0.0.1:{}/v1/skobuffs".format(port))
+
+        self.simple_route = partial(osrm.simple_route, url_config=self.config)
+        self.nearest = partial(osrm.nearest, url_config=self.config)
+        self.match = partial(osrm.match, url_config=self.config)
+        self.table = partial(osrm.table, url_config=self.config)
+        self.trip = partial(osrm.trip, url_config=self.config)
+        self.request = partial(utils.request, url_config=self.config)
+
+    def close(self):
+        """Nothing to release, the HTTP server is managed by the Scenario"""
+        pass
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+from .. import utils
+
+## pyosrm is only required for the in-process engine
+try:
+    import pyosrm
+except ImportError:
+    pyosrm = None
+
+class LibOSRMEngine():
+    """
+    Query engine routing in-process with the libosrm Python bindings of `pyosrm`
+    (https://github.com/gojekfarm/pyosrm), skipping the HTTP round-trip and JSON encoding of
+    `osrm-routed` for the hot path of many small routes. Results have the same shape as those
+    of the HTTPEngine.
+
+    The `pyosrm` bindings only expose the `route` service with its default options, so this
+    engine is not a standalone backend: it loads the compiled network next to a `fallback`
+    engine (the Scenario's `osrm-routed` HTTPEngine), answers `simple_route` in-process when
+    the options allow it, and sends every other route (ex. `overview="full"`, annotations) and
+    service (`table`, `nearest`, ...) to the fallback.
+
+    Parameters
+    ----------
+    osrm_path : str
+        Path to *.osrm
+    fallback : HTTPEngine
+        Engine answering the services and route options libosrm can't
+    algorithm : str, optional
+        Algorithm the network was compiled with (either "CH" or "MLD")
+    shared_memory : bool, optional
+        Use the network loaded in shared memory by `osrm-datastore` instead of `osrm_path`
+    """
+
+    name = "libosrm"
+
+    def __init__(self, osrm_path, fallback, algorithm="MLD", shared_memory=False):
+        if pyosrm is None:
+            raise ImportError("pyosrm is required for the libosrm engine (https://github.com/gojekfarm/pyosrm)")
+
+        self.fallback = fallback
+        self.config = fallback.config
+
+        if shared_memory:
+            self.router = pyosrm.PyOSRM(use_shared_memory=True, algorithm=algorithm)
+        else:
+            self.router = pyosrm.PyOSRM(str(osrm_path), algorithm=algorithm)
+
+        self.nearest = fallback.nearest
+        self.match = fallback.match
+        self.table = fallback.table
+        self.trip = fallback.trip
+        self.request = fallback.request
+
+    @staticmethod
+    def supports(alternatives=False, steps=False, overview="simplified", annotations=None, **kwargs):
+        """True if a route with these `simple_route` options can be answered in-process"""
+
+        kwargs.pop("send_as_polyline", None) ## Only affects how coordinates are sent over HTTP
+
+        return not kwargs and overview in (None, "simplified") and \
+            all(v in (None, False, "false") for v in (alternatives, steps, annotations))
+
+    def simple_route(self, coord_origin, coord_dest, coord_intermediate=None, output="full",
+                     geometry="polyline", **kwargs):
+        """
+        Compute a route between an origin and destination, with the same parameters and
+        results as `osrm.simple_route`. Routes with options libosrm can't honour are sent
+        to the fallback engine.
+        """
+
+        if self.router is None or not self.supports(**kwargs):
+            return self.fallback.simple_route(coord_origin, coord_dest, coord_intermediate=coord_intermediate,
+                                              output=output, geometry=geometry, **kwargs)
+
+        coords = [list(coord_origin)] + \
+                 [list(c) for c in (coord_intermediate if coord_intermediate else [])] + \
+                 [list(coord_dest)]
+
+        result = self.router.route(coords)
+        parsed_json = result.json()
+
+        if result.status != pyosrm.Status.Ok or "Ok" not in parsed_json.get("code", ""):
+            raise ValueError(
+                'Error - OSRM status : {} \n Full json reponse : {}'.format(
+                    parsed_json.get("code"), parsed_json))
+
+        ## Decode polyline geometries to WKT/WKB like python-osrm
+        utils.decode_routes(parsed_json["routes"], geometry)
+
+        return parsed_json if output == "full" else parsed_json["routes"]
+
+    def close(self):
+        """Release the in-process network"""
+        self.router = None
+        self.fallback.close()
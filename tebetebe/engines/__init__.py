@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+from .HTTPEngine import HTTPEngine
+from .LibOSRMEngine import LibOSRMEngine
+
+ENGINES = {"http": HTTPEngine,
+           "libosrm": LibOSRMEngine}
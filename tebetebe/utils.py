@@ -1,12 +1,372 @@
 #!/usr/bin/env python3
 
+import threading
 import shutil
+import os
 import socket
 import hashlib
+import json
+import math
+import time
+
+from shapely.geometry import box, MultiPoint, LineString
+from polyline import decode as polyline_decode, encode as polyline_encode
+from urllib.parse import quote, urlencode
+from urllib.request import urlopen, Request
+from urllib.error import URLError
+from http.client import HTTPException, IncompleteRead
+from shapely import affinity
+
+import numpy as np
+
+try:
+    from shapely import linestrings as shapely_linestrings, simplify as shapely_simplify
+except ImportError: ## shapely < 2
+    shapely_linestrings = shapely_simplify = None
+from pathlib import Path
+
+from . import defaults
+
+## Memoized file fingerprints, keyed by (path, size, mtime, inode)
+_fingerprints = {}
 
 def hash_(_str):
     return hashlib.md5(_str.encode()).hexdigest()
 
+def hash_bytes(_bytes):
+    return hashlib.md5(_bytes).hexdigest()
+
+def hash_dict(_dict):
+    """Return md5 hash of a JSON-serializable dict, independent of key order"""
+    return hash_(json.dumps(_dict, sort_keys=True, default=str))
+
+def fingerprint_file(path, block_size=1 << 20, cache_dir=defaults.CACHE_DIR):
+    '''
+    Return a content fingerprint of a file, hashed in full by reading `block_size` bytes at a
+    time. Fingerprints are memoized in memory and in `cache_dir`, keyed by the file path, size,
+    modification time and inode, so a file is only read again once it changes, even by later
+    processes.
+    '''
+
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    if key in _fingerprints:
+        return _fingerprints[key]
+
+    memo_path = Path(cache_dir) / "fingerprints" / hash_(json.dumps(key))
+
+    try:
+        _fingerprints[key] = memo_path.read_text()
+        return _fingerprints[key]
+    except OSError:
+        pass
+
+    md5 = hashlib.md5(str(stat.st_size).encode())
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+
+    _fingerprints[key] = md5.hexdigest()
+
+    ## Write to a temporary file and rename it, so concurrent processes never read a partial memo
+    try:
+        memo_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = memo_path.with_name("{}.{}.tmp".format(memo_path.name, os.getpid()))
+        tmp_path.write_text(_fingerprints[key])
+        os.replace(tmp_path, memo_path)
+    except OSError: ## Read-only cache, the fingerprint is only memoized in memory
+        pass
+
+    return _fingerprints[key]
+
+def link_or_copy(src_path, dst_path):
+    '''Hard link `src_path` to `dst_path`, falling back to a copy across filesystems'''
+    try:
+        Path(dst_path).unlink()
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.link(str(src_path), str(dst_path))
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+def to_geometry(geometry):
+    """Return shapely geometry of a (minx, miny, maxx, maxy) bounding box or geometry"""
+    if isinstance(geometry, (tuple, list)):
+        return box(*geometry)
+
+    return geometry
+
+def get_extent(*datasets, method="hull"):
+    '''
+    Return the extent of the points of one or many GeoDataFrames (ex. POIDatasets)
+
+    Parameters
+    ----------
+    *datasets
+        GeoDataFrames whose geometries define the extent
+    method : str, optional
+        Either "hull" (convex hull) or "bbox" (bounding box)
+    '''
+
+    geometries = [geom for dataset in datasets for geom in dataset.geometry]
+    points = MultiPoint([pt for geom in geometries for pt in getattr(geom, "geoms", [geom])])
+
+    if method == "hull":
+        return points.convex_hull
+    elif method == "bbox":
+        return box(*points.bounds)
+    else:
+        raise ValueError("Unknown extent method ({})".format(method))
+
+def buffer_geometry(geometry, buffer):
+    '''
+    Buffer a WGS84 geometry by `buffer` meters, using an equirectangular approximation
+    around the geometry centroid
+    '''
+
+    if not buffer:
+        return geometry
+
+    scale = math.cos(math.radians(geometry.centroid.y))
+
+    geometry = affinity.scale(geometry, xfact=scale, yfact=1, origin=(0, 0))
+    geometry = geometry.buffer(buffer / 111320)
+
+    return affinity.scale(geometry, xfact=1 / scale, yfact=1, origin=(0, 0))
+
+def haversine(coords0, coords1):
+    '''Return great-circle distances in meters between arrays of WGS84 (x, y) coordinates'''
+
+    (lon0, lat0) = np.radians(np.asarray(coords0, dtype=float)).reshape(-1, 2).T
+    (lon1, lat1) = np.radians(np.asarray(coords1, dtype=float)).reshape(-1, 2).T
+
+    a = np.sin((lat1 - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2) ** 2
+
+    return 2 * defaults.EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def get_grid_cells(coords, size):
+    '''
+    Return the (column, row) of the `size` meters grid cell of every WGS84 (x, y) coordinate,
+    using an equirectangular approximation around the coordinates' mean latitude
+    '''
+
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    scale = math.cos(math.radians(coords[:, 1].mean())) if len(coords) else 1
+
+    return np.floor(coords * [scale * 111320 / size, 111320 / size]).astype(np.int64)
+
+def decode_routes(routes, geometry):
+    '''
+    Decode the polyline geometries of OSRM routes in place to WKT or WKB, like
+    `osrm.simple_route` does. Routes with "polyline" or "geojson" geometries are untouched
+    '''
+
+    if geometry.lower() not in ("wkt", "well-known-text", "text", "wkb", "well-known-binary"):
+        return routes
+
+    for route in routes:
+        line = LineString([(lon, lat) for lat, lon in polyline_decode(route["geometry"])])
+        route["geometry"] = line.wkb if "b" in geometry.lower() else line.wkt
+
+    return routes
+
+def decode_polylines(polylines, precision=5, simplify=None):
+    '''
+    Decode encoded polylines (ex. OSRM "polyline" or "polyline6" route geometries) in bulk
+    with vectorized numpy operations
+
+    Parameters
+    ----------
+    polylines: list of str
+        Encoded polylines
+    precision: int, optional
+        Coordinate precision, 5 for "polyline" and 6 for "polyline6"
+    simplify: float, optional
+        Tolerance (in degrees) to simplify the decoded lines with
+
+    Returns
+    -------
+    np.ndarray
+        Array of shapely LineStrings (None for polylines with less than 2 points)
+    '''
+
+    geoms = np.full(len(polylines), None, dtype=object)
+
+    ## Empty polylines would start past the end of the characters
+    nonempty = np.flatnonzero([len(p) > 0 for p in polylines])
+
+    if not len(nonempty):
+        return geoms
+
+    n_lines = len(nonempty)
+    encoded = [polylines[i].encode() for i in nonempty]
+    chars = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.int64) - 63
+    lengths = np.array([len(p) for p in encoded], dtype=np.int64)
+
+    ## Every coordinate delta is a varint of 5-bit chunks; the last chunk has no 0x20 flag
+    ends = (chars & 0x20) == 0
+    starts = np.flatnonzero(np.concatenate([[True], ends[:-1]]))
+    chunk_idx = np.arange(len(chars)) - np.repeat(starts, np.diff(np.append(starts, len(chars))))
+
+    values = np.add.reduceat((chars & 0x1f) << (5 * chunk_idx), starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1).reshape(-1, 2)
+
+    ## Number of points of every polyline, from the number of varints ending in each
+    n_points = np.add.reduceat(ends, np.cumsum(lengths) - lengths) // 2
+
+    ## Cumulative sum of the deltas, restarted at every polyline
+    cumulative = np.cumsum(deltas, axis=0)
+    line_starts = np.cumsum(n_points) - n_points
+    offsets = np.vstack([np.zeros((1, 2), dtype=np.int64), cumulative])[line_starts]
+    coords = (cumulative - np.repeat(offsets, n_points, axis=0)) / 10 ** precision
+
+    ## (lat, lon) to (x, y)
+    coords = coords[:, ::-1]
+
+    valid = n_points >= 2
+    line_idx = np.repeat(np.arange(n_lines), n_points)
+    keep = valid[line_idx]
+
+    if valid.any():
+        if shapely_linestrings is not None:
+            lines = shapely_linestrings(coords[keep],
+                                        indices=np.repeat(np.arange(valid.sum()), n_points[valid]))
+        else: ## shapely < 2
+            bounds = np.cumsum(n_points[valid])[:-1]
+            lines = np.array([LineString(c) for c in np.split(coords[keep], bounds)] + [None])[:-1]
+
+        if simplify:
+            lines = np.array([line.simplify(simplify) for line in lines] + [None])[:-1] \
+                if shapely_simplify is None else shapely_simplify(lines, simplify)
+
+        geoms[nonempty[valid]] = lines
+
+    return geoms
+
+def get_request_url(url_config, service, coords, **params):
+    '''
+    Return the URL of an osrm-routed HTTP API request. Coordinates are sent as a polyline;
+    booleans in `params` are lowercased, lists are joined with ";" and None values are omitted
+    '''
+
+    host = url_config.host.rstrip("/")
+    host = host if "//" in host else "http://{}".format(host)
+
+    def format_param(value):
+        if isinstance(value, bool):
+            return str(value).lower()
+        elif isinstance(value, (list, tuple, range, np.ndarray)):
+            return ";".join(format_param(v) for v in value)
+        else:
+            return str(value)
+
+    query = urlencode({k: format_param(v) for k, v in params.items() if v is not None}, safe=";,")
+
+    return "{}/{}/{}/{}/polyline({}){}".format(host, service, url_config.version, url_config.profile,
+                                               quote(polyline_encode([(y, x) for x, y in coords])),
+                                               "?" + query if query else "")
+
+def request(service, coords, url_config=None, **params):
+    '''
+    Query any osrm-routed service with any parameters, such as those not supported by
+    python-osrm (ex. `hints`), and return the JSON response as a dict
+
+    Parameters
+    ----------
+    service : str
+        osrm-routed service ("route", "table", "nearest", "match", "trip")
+    coords : list of 2-floats tuple
+        Coordinates as (x, y)
+    url_config : osrm.RequestConfig
+        HTTP API configuration of the server
+    **params
+        Service query parameters
+    '''
+
+    req = Request(get_request_url(url_config, service, coords, **params))
+
+    if getattr(url_config, "auth", None):
+        req.add_header("Authorization", url_config.auth)
+
+    parsed_json = json.loads(urlopen(req).read().decode("utf-8"))
+
+    if "Ok" not in parsed_json.get("code", ""):
+        raise ValueError('Error - OSRM status : {} \n Full json reponse : {}'.format(
+            parsed_json.get("code"), parsed_json))
+
+    return parsed_json
+
+def download(url, path, data=None, chunk_size=1 << 20, retries=3, timeout=600):
+    '''
+    Stream a download to disk in chunks of `chunk_size` bytes, without holding it in memory.
+
+    The download is written to a `.part` file next to `path`, and moved into place once
+    complete. After a dropped connection, the download resumes from the end of the `.part`
+    file with a `Range` request, up to `retries` times. Servers which ignore `Range` (status
+    200 instead of 206) restart the download from the beginning. A `.part` file left by a
+    previous failed call is resumed too.
+
+    Parameters
+    ----------
+    url : str
+        URL to download
+    path : str
+        Output path
+    data : bytes, optional
+        POST body. The download is a GET request if not specified
+    chunk_size : int, optional
+        Number of bytes read and written at once
+    retries : int, optional
+        Number of times a failed download is resumed
+    timeout : float, optional
+        Socket timeout in seconds
+
+    Returns
+    -------
+    Path
+    '''
+
+    path = Path(path)
+    part_file = path.with_name(path.name + ".part")
+
+    for attempt in range(retries + 1):
+        offset = part_file.stat().st_size if part_file.is_file() else 0
+        req = Request(url, data=data, headers={"Range": "bytes={}-".format(offset)} if offset else {})
+
+        try:
+            with urlopen(req, timeout=timeout) as response:
+                resumed = offset and response.status == 206
+                (length, received) = (response.headers.get("Content-Length"), 0)
+
+                with open(part_file, "ab" if resumed else "wb") as f:
+                    for chunk in iter(lambda: response.read(chunk_size), b""):
+                        f.write(chunk)
+                        received += len(chunk)
+
+                ## urllib ends chunked reads quietly when the connection drops early
+                if length is not None and received < int(length):
+                    raise IncompleteRead(b"", int(length) - received)
+
+            part_file.rename(path)
+            return path
+
+        except (URLError, HTTPException, OSError) as exc:
+            ## Range past the end of the resource: restart from the beginning
+            if getattr(exc, "code", 0) == 416 and attempt < retries:
+                part_file.unlink()
+                continue
+
+            ## Client errors (ex. bad query) won't succeed on retry
+            if attempt == retries or 400 <= getattr(exc, "code", 0) < 500:
+                raise
+
+            time.sleep(2 ** attempt)
+
 def find_open_port():
     # Thanks to this gist! https://gist.github.com/jdavis/4040223
 
@@ -14,5 +374,31 @@ def find_open_port():
     sock.bind(('', 0))
 
     _, port = sock.getsockname()
+    sock.close()
 
     return port
+
+## Ports handed out by reserve_port and not yet released
+_reserved_ports = set()
+_reserved_ports_lock = threading.Lock()
+
+def reserve_port():
+    '''
+    Return an open port which has not been reserved by another thread of this process.
+    The port must be released with `release_port` once the server using it has exited.
+    '''
+
+    with _reserved_ports_lock:
+        port = find_open_port()
+
+        while port in _reserved_ports:
+            port = find_open_port()
+
+        _reserved_ports.add(port)
+
+    return port
+
+def release_port(port):
+    """Release a port reserved with `reserve_port`"""
+    with _reserved_ports_lock:
+        _reserved_ports.discard(port)
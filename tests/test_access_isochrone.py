@@ -0,0 +1,55 @@
+from tebetebe.analysis import AccessIsochrone
+import numpy as np
+import unittest
+
+class FakeScenario():
+    '''
+    Stand-in for a running scenario, with durations of 100 min per degree as the crow flies.
+    Coordinates snap to a 0.001 degree grid, and nothing can be reached with `unreachable`
+    '''
+
+    def __init__(self, unreachable=False):
+        self.queries = 0
+        self.unreachable = unreachable
+
+    def get_name(self):
+        return "fake"
+
+    def get_max_table_size(self):
+        return 100
+
+    def snap(self, coords):
+        return {"location": np.round(np.array(coords, dtype=float).reshape(-1, 2), 3)}
+
+    def nearest(self, coord):
+        return {"code": "Ok", "waypoints": [{"location": list(coord)}]}
+
+    def table(self, coords_src, coords_dest=None, output="raw", annotations="duration"):
+        self.queries += len(coords_dest)
+
+        return {"code": "Ok", "durations": [[None if self.unreachable else np.hypot(d[0] - o[0], d[1] - o[1]) * 6000
+                                             for d in coords_dest] for o in coords_src]}
+
+class AccessIsochroneTestCase(unittest.TestCase):
+    def test_adaptive_grid(self):
+        scenario = FakeScenario()
+        resolution = 0.4 / 64
+
+        isochrone = AccessIsochrone(scenario, (0, 0), points_grid=100, size=0.4, resolution=resolution,
+                                    levels=[10, 20])
+        grid = isochrone.get_grid()
+
+        assert scenario.queries < ((2 * 0.4 / resolution) + 1) ** 2 / 4, "Grid not refined adaptively"
+        assert len(grid[(grid.time - 10).abs() < 60 * resolution]), "Grid not refined around levels"
+        assert not len(grid[(grid.time - 5).abs() < 60 * resolution / 2]), "Grid refined away from levels"
+        assert np.allclose(grid.geometry.x, grid.geometry.x.round(3)), "Grid points not snapped"
+
+    def test_adaptive_grid_unreachable(self):
+        isochrone = AccessIsochrone(FakeScenario(unreachable=True), (0, 0), points_grid=100, size=0.4,
+                                    resolution=0.4 / 64, levels=5)
+
+        assert len(isochrone.get_grid()) == 0, "Unreachable grid points kept"
+
+
+if __name__ == '__main__':
+    unittest.main()
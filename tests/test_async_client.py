@@ -0,0 +1,82 @@
+import tebetebe as tb
+import threading
+import unittest
+import asyncio
+import json
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+class RouteHandler(BaseHTTPRequestHandler):
+    '''Stand-in for osrm-routed, failing the first request of every url with a 503'''
+
+    seen = set()
+
+    def do_GET(self):
+        if self.path not in RouteHandler.seen:
+            RouteHandler.seen.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = json.dumps({"code": "Ok", "waypoints": [],
+                           "routes": [{"duration": 60, "distance": 100,
+                                       "geometry": "_p~iF~ps|U_ulLnnqC"}]}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class AsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        RouteHandler.seen = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RouteHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.config = SimpleNamespace(host="127.0.0.1:{}".format(self.server.server_port),
+                                      version="v1", profile="skobuffs", auth=None)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_route_many(self):
+        pairs = [((31.1, -26.5), (31.2, -26.6 - i / 100)) for i in range(20)]
+
+        async def route_many():
+            async with tb.AsyncClient(self.config, concurrency=4, backoff=0) as client:
+                return await client.route_many(pairs, geometry="wkt", output="routes")
+
+        routes = asyncio.run(route_many())
+
+        assert len(routes) == len(pairs), "Not all pairs routed"
+        assert all(r[0]["geometry"].startswith("LINESTRING") for r in routes), "Geometry not decoded"
+
+    def test_closed_on_shutdown(self):
+        client = tb.AsyncClient(self.config, backoff=0)
+
+        ## Pool left open, as by Scenario.aroute, until the event loop shuts down
+        async def route():
+            return await client.route((31.1, -26.5), (31.2, -26.6))
+
+        asyncio.run(route())
+
+        assert client.session is None, "Connection pool not closed with the event loop"
+
+    def test_retries_exhausted(self):
+        async def route():
+            async with tb.AsyncClient(self.config, retries=0, backoff=0) as client:
+                return await client.route_many([((31.1, -26.5), (31.2, -26.6))] * 2, concurrency=1)
+
+        routes = asyncio.run(route())
+
+        assert isinstance(routes[0], ConnectionError), "Failed request not isolated"
+        assert isinstance(routes[1], dict), "Request after a failure not routed"
+
+
+if __name__ == '__main__':
+    unittest.main()
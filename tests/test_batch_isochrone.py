@@ -0,0 +1,52 @@
+from tebetebe.analysis import BatchIsochrone
+import numpy as np
+import unittest
+import tempfile
+
+class FakeScenario():
+    '''Stand-in for a running scenario, with durations of 100 min per degree as the crow flies'''
+
+    config = None
+
+    def get_name(self):
+        return "fake"
+
+    def get_max_table_size(self):
+        return 10
+
+    def table(self, coords_src, coords_dest=None, output="raw", annotations="duration"):
+        return {"code": "Ok", "durations": [[np.hypot(d[0] - o[0], d[1] - o[1]) * 6000 for d in coords_dest]
+                                            for o in coords_src]}
+
+class BatchIsochroneTestCase(unittest.TestCase):
+    def test_batch_isochrone(self):
+        origins = [(0.05 * i, 0) for i in range(12)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            isochrones = BatchIsochrone(FakeScenario(), origins, size=0.1, resolution=0.01, path=tmp_dir)
+            surface = isochrones()
+
+            durations = isochrones.get_durations()
+            nearest = isochrones.get_nearest()
+
+            assert durations.shape == (12, 20, 75), "Unexpected grid shape"
+            assert np.allclose(surface, durations.min(axis=0)), "Surface is not the minimum duration"
+            assert (np.take_along_axis(durations, nearest[None].astype(np.int64), 0)[0] == surface).all(), \
+                "Nearest origin does not match surface"
+
+            (row, col) = (10, 14) ## Cell centered on (0.045, -0.005), closest to origin (0.05, 0)
+            assert nearest[row, col] == 1, "Unexpected nearest origin"
+
+            contours = isochrones.render_contours([3])
+            coverage = isochrones.render_coverage([3, 6])
+
+            assert len(contours) == 12, "Missing contours"
+            assert coverage.geometry[0].within(coverage.geometry[1]), "Coverage levels not nested"
+            assert np.isclose(coverage.geometry[1].area, (surface <= 6).sum() * 0.01 ** 2), \
+                "Coverage not made of reached cells"
+
+            del durations, nearest, surface, isochrones
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from tebetebe.analysis import BatchRouter
+from polyline import encode as polyline_encode
+from tebetebe import utils
+import numpy as np
+import unittest
+import time
+
+class FakeScenario():
+    '''Stand-in for a running scenario, failing to route to (0, 0)'''
+
+    def get_name(self):
+        return "fake"
+
+    def simple_route(self, origin, dest, **kwargs):
+        time.sleep(0.001)
+
+        if dest == (0, 0):
+            raise ValueError("NoRoute")
+
+        return {"routes": [{"duration": origin[0] + dest[0], "distance": 1,
+                            "geometry": polyline_encode([origin[::-1], dest[::-1]])}]}
+
+class BatchRouterTestCase(unittest.TestCase):
+    def test_batch_router(self):
+        origins = [(i, 1) for i in range(100)]
+        dests = [(i, 2) if i % 10 else (0, 0) for i in range(100)]
+
+        router = BatchRouter(FakeScenario(), workers=8)
+        results = router(origins, dests)
+
+        failed = np.array([i % 10 == 0 for i in range(100)])
+
+        assert np.isnan(results["duration"][failed]).all(), "Failed pairs not left empty"
+        assert (results["duration"][~failed] == 2 * np.arange(100)[~failed]).all(), "Results out of order"
+        assert results["geometry"][1].coords[0] == (1, 1), "Geometry not decoded"
+        assert results["geometry"][0] is None, "Failed pair has a geometry"
+        assert results["error"][0] == "NoRoute", "Error not recorded"
+        assert router.get_stats()["failed"] == 10, "Failed pairs not counted"
+
+    def test_decode_empty_polylines(self):
+        line = polyline_encode([(-26.5, 31.1), (-26.6, 31.2)])
+        geoms = utils.decode_polylines(["", line, ""])
+
+        assert geoms[0] is None and geoms[2] is None, "Empty polyline decoded"
+        assert geoms[1].coords[-1] == (31.2, -26.6), "Polyline after an empty one not decoded"
+        assert utils.decode_polylines([""])[0] is None, "Only empty polylines not handled"
+
+
+if __name__ == '__main__':
+    unittest.main()
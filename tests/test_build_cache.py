@@ -0,0 +1,80 @@
+import tebetebe as tb
+import unittest
+import tempfile
+import shutil
+import os
+
+from pathlib import Path
+
+class BuildCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = tb.BuildCache(self.tmp_dir / "cache")
+
+        ## Copy of the walk_normal profile and its lib/ includes
+        shutil.copytree("./profiles", self.tmp_dir / "profiles")
+        self.profile = tb.RoutingProfile(self.tmp_dir / "profiles" / "walk_normal.lua")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_and_link(self):
+        def compile_fn(osrm_path):
+            for ext in ["", ".ebg", ".partition"]:
+                Path("{}{}".format(osrm_path, ext)).write_text(ext)
+
+        path = self.cache.build("abc", {"algorithm": "MLD"}, compile_fn)
+
+        assert path.is_file(), "Build not moved into cache"
+        assert self.cache.has("abc"), "Build has no manifest"
+        assert len(self.cache.get_manifest("abc")["files"]) == 3, "Manifest missing files"
+
+        dst_path = self.cache.link("abc", self.tmp_dir / "scenario" / "scenario.osrm")
+        assert Path("{}.ebg".format(dst_path)).read_text() == ".ebg", "Build not linked"
+
+    def test_failed_build_not_cached(self):
+        def compile_fn(osrm_path):
+            raise RuntimeError("osrm-extract failed")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.build("abc", {}, compile_fn)
+
+        assert not self.cache.has("abc"), "Failed build cached"
+        assert not list((self.tmp_dir / "cache").iterdir()), "Staging folder left behind"
+
+    def test_profile_fingerprint_includes_lib(self):
+        fingerprint = self.profile.get_fingerprint()
+
+        with open(self.tmp_dir / "profiles" / "lib" / "access.lua", "a") as lib:
+            lib.write("\n-- edited\n")
+
+        assert self.profile.get_fingerprint() != fingerprint, "lib/*.lua edit not detected"
+
+    def test_file_fingerprint(self):
+        osm_path = self.tmp_dir / "network.osm"
+        osm_path.write_bytes(b"a" * 4096)
+        fingerprint = tb.utils.fingerprint_file(osm_path, cache_dir=self.tmp_dir / "cache")
+
+        ## Same-size edit in the middle of the file
+        osm_path.write_bytes(b"a" * 2000 + b"b" + b"a" * 2095)
+        assert tb.utils.fingerprint_file(osm_path, cache_dir=self.tmp_dir / "cache") != fingerprint, \
+            "File change not detected"
+
+    def test_file_fingerprint_memo(self):
+        osm_path = self.tmp_dir / "network.osm"
+        osm_path.write_bytes(b"a" * 4096)
+        fingerprint = tb.utils.fingerprint_file(osm_path, cache_dir=self.tmp_dir / "cache")
+
+        ## Rewrite the file in place but keep its size and mtime, like an unchanged file
+        stat = osm_path.stat()
+        osm_path.write_bytes(b"b" * 4096)
+        os.utime(osm_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        ## A new process reads the memoized fingerprint instead of hashing the file again
+        tb.utils._fingerprints.clear()
+        assert tb.utils.fingerprint_file(osm_path, cache_dir=self.tmp_dir / "cache") == fingerprint, \
+            "Fingerprint not memoized on disk"
+
+
+if __name__ == '__main__':
+    unittest.main()
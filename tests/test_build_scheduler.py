@@ -0,0 +1,41 @@
+import tebetebe as tb
+import unittest
+import threading
+import time
+
+class BuildBudgetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.env = tb.Environment(tmp_dir="/tmp/test_build_scheduler")
+        self.scenario = self.env.Scenario(self.env.OSMDataset("./data/ngwempisi.osm.pbf"),
+                                          self.env.RoutingProfile("./profiles/walk_normal.lua"))
+
+    def test_threads_allocation(self):
+        budget = tb.BuildBudget(threads=4, memory=1024 ** 4, stage_threads=3)
+
+        with budget.allocate(self.scenario, "extract") as threads0:
+            with budget.allocate(self.scenario, "partition") as threads1:
+                assert (threads0, threads1) == (3, 1), "Threads not split within budget"
+
+        assert budget.free_threads == 4, "Threads not released"
+        assert len(budget.stages) == 2, "Stages not recorded"
+
+    def test_memory_budget(self):
+        ## Only one extract fits in the memory budget at a time
+        budget_memory = tb.BuildBudget().estimate_memory(self.scenario, "extract")
+        budget = tb.BuildBudget(threads=4, memory=budget_memory)
+        running = []
+
+        def extract():
+            with budget.allocate(self.scenario, "extract"):
+                running.append(budget.running)
+                time.sleep(0.1)
+
+        threads = [threading.Thread(target=extract) for _ in range(3)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+        assert max(running) == 1, "Memory budget exceeded"
+
+
+if __name__ == '__main__':
+    unittest.main()
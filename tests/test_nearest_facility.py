@@ -0,0 +1,102 @@
+from tebetebe.analysis import NearestFacility
+from geopandas import GeoDataFrame, points_from_xy
+import numpy as np
+import unittest
+import math
+
+class FakeScenario():
+    '''
+    Stand-in for a running scenario at `speed` km/h, with a detour factor of 1 to 3 depending
+    on the facility. Facility 0 can't be reached
+    '''
+
+    def __init__(self, facilities, speed=60):
+        self.facilities = facilities
+        self.speed = speed
+        self.pairs = 0
+
+    def get_name(self):
+        return "fake"
+
+    def get_max_table_size(self):
+        return 10
+
+    def get_duration(self, o, d):
+        meters = math.hypot((d[0] - o[0]) * math.cos(math.radians(o[1])), d[1] - o[1]) * 111320
+        facility = self.facilities.index(d)
+        return None if facility == 0 else meters * (1 + 2 * (facility % 7) / 6) / (self.speed / 3.6)
+
+    def snap(self, coords):
+        return {"location": np.array(coords, dtype=float).reshape(-1, 2), "distance": np.zeros(len(coords))}
+
+    def table(self, coords_src, coords_dest=None, output="raw", annotations="duration"):
+        if len(coords_src) * len(coords_dest) > self.get_max_table_size() ** 2:
+            raise ValueError("TooBig")
+
+        self.pairs += len(coords_src) * len(coords_dest)
+
+        durations = [[self.get_duration(o, d) for d in coords_dest] for o in coords_src]
+        return {"code": "Ok", "durations": durations,
+                "distances": [[t and t * self.speed / 3.6 for t in row] for row in durations]}
+
+class NearestFacilityTestCase(unittest.TestCase):
+    def test_nearest_facility(self):
+        rng = np.random.default_rng(0)
+        (origins, facilities) = (rng.uniform(0, 0.5, (300, 2)), rng.uniform(0, 0.5, (40, 2)))
+
+        origins = GeoDataFrame(geometry=points_from_xy(*origins.T), index=np.arange(300) + 1000)
+        facilities = GeoDataFrame(geometry=points_from_xy(*facilities.T), index=["f{}".format(i) for i in range(40)])
+        scenario = FakeScenario([(p.x, p.y) for p in facilities.geometry])
+
+        analysis = NearestFacility(scenario, origins, facilities, k=3, max_speed=60)
+        nearest = analysis()
+
+        brute = np.array([[scenario.get_duration((o.x, o.y), (f.x, f.y)) or np.inf for f in facilities.geometry]
+                          for o in origins.geometry])
+
+        assert (nearest.index == origins.index).all(), "Results not indexed by origin id"
+        assert np.allclose(nearest.duration, brute.min(axis=1)), "Nearest facility not exact"
+        assert (nearest.facility_id == facilities.index[brute.argmin(axis=1)]).all(), "Wrong nearest facility"
+        assert scenario.pairs < 300 * 40, "Every pair was routed"
+        assert analysis.get_stats()["rounds"] > 1, "Candidates never widened"
+
+    def test_nearest_facility_latitudes(self):
+        ## Origins far north and south of the facilities' mean latitude
+        rng = np.random.default_rng(1)
+        origins = np.column_stack([rng.uniform(0, 2, 100), rng.choice([-60, 0, 60], 100) + rng.uniform(0, 1, 100)])
+        facilities = np.column_stack([rng.uniform(0, 2, 60), rng.choice([-60, 0, 60], 60) + rng.uniform(0, 1, 60)])
+
+        origins = GeoDataFrame(geometry=points_from_xy(*origins.T))
+        facilities = GeoDataFrame(geometry=points_from_xy(*facilities.T))
+        scenario = FakeScenario([(p.x, p.y) for p in facilities.geometry])
+
+        nearest = NearestFacility(scenario, origins, facilities, k=2, max_speed=60)()
+
+        brute = np.array([[scenario.get_duration((o.x, o.y), (f.x, f.y)) or np.inf for f in facilities.geometry]
+                          for o in origins.geometry])
+
+        assert np.allclose(nearest.duration, brute.min(axis=1)), "Nearest facility not exact"
+
+    def test_nearest_facility_walking(self):
+        ## Walking distances to facilities spread over a small town
+        rng = np.random.default_rng(2)
+        (origins, facilities) = (rng.uniform(0, 0.05, (400, 2)), rng.uniform(0, 0.05, (80, 2)))
+
+        origins = GeoDataFrame(geometry=points_from_xy(*origins.T))
+        facilities = GeoDataFrame(geometry=points_from_xy(*facilities.T))
+        scenario = FakeScenario([(p.x, p.y) for p in facilities.geometry], speed=5)
+
+        nearest = NearestFacility(scenario, origins, facilities, max_speed=5, k=4)()
+
+        brute = np.array([[scenario.get_duration((o.x, o.y), (f.x, f.y)) or np.inf for f in facilities.geometry]
+                          for o in origins.geometry])
+
+        assert np.allclose(nearest.duration, brute.min(axis=1)), "Nearest facility not exact"
+        assert scenario.pairs < 400 * 80 / 4, "Candidates not pruned at walking speed"
+
+        with self.assertRaises(ValueError):
+            NearestFacility(scenario, origins, facilities, max_speed=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
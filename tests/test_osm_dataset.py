@@ -0,0 +1,97 @@
+import tebetebe as tb
+import threading
+import unittest
+import tempfile
+import shutil
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+from pathlib import Path
+
+OVERPASS_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="Overpass API">
+  <node id="1" lat="-26.70" lon="30.90"/>
+  <node id="2" lat="-26.71" lon="30.91"/>
+  <node id="3" lat="-26.72" lon="30.92"/>
+  <way id="10">
+    <bounds minlat="-26.72" minlon="30.90" maxlat="-26.70" maxlon="30.92"/>
+    <nd ref="1" lat="-26.70" lon="30.90"/>
+    <nd ref="2" lat="-26.71" lon="30.91"/>
+    <nd ref="3" lat="-26.72" lon="30.92"/>
+    <tag k="highway" v="primary"/>
+  </way>
+</osm>
+''' + b"<!-- padding -->\n" * 1000
+
+class OverpassHandler(BaseHTTPRequestHandler):
+    '''Stand-in for the Overpass API, dropping the connection halfway through the first response'''
+
+    requests = []
+
+    def do_POST(self):
+        query = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())["data"][0]
+        OverpassHandler.requests.append((query, self.headers.get("Range")))
+
+        start = int(self.headers["Range"][len("bytes="):-1]) if self.headers.get("Range") else 0
+
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(OVERPASS_XML) - start))
+        self.end_headers()
+
+        if len(OverpassHandler.requests) == 1:
+            self.wfile.write(OVERPASS_XML[:len(OVERPASS_XML) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(OVERPASS_XML[start:])
+
+    def log_message(self, *args):
+        pass
+
+class OSMDatasetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.env = tb.Environment(tmp_dir=self.tmp_dir)
+        self.route_network = self.env.OSMDataset("./data/ngwempisi.osm.pbf")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_clip(self):
+        clipped = self.route_network.clip((30.79, -26.8, 31.05, -26.6), buffer=500)
+
+        assert clipped.get_path().is_file(), "Clipped dataset not saved"
+        assert clipped.get_path().stat().st_size < self.route_network.get_path().stat().st_size, \
+            "Clipped dataset not smaller than source"
+
+        ## Same source & geometry reuses the clipped dataset
+        assert self.route_network.clip((30.79, -26.8, 31.05, -26.6), buffer=500).get_path() \
+            == clipped.get_path(), "Clipped dataset not reused"
+
+        assert self.route_network.clip((30.79, -26.8, 31.05, -26.6), buffer=1000).get_path() \
+            != clipped.get_path(), "Clipped dataset reused for another geometry"
+
+    def test_from_overpass(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), OverpassHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            dataset = tb.OSMDataset.from_overpass("way(10);(._;>;);out;", name="overpass", tmp_dir=self.tmp_dir,
+                                                  chunk_size=256, retries=1,
+                                                  url="http://127.0.0.1:{}/api/interpreter".format(server.server_port))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        (query, first_range) = OverpassHandler.requests[0]
+        (_, resume_range) = OverpassHandler.requests[1]
+
+        assert query == "[out:xml];way(10);(._;>;);out;", "Unexpected query"
+        assert first_range is None and resume_range == "bytes={}-".format(len(OVERPASS_XML) // 2), \
+            "Download not resumed"
+        assert dataset.get_path().name == "overpass.osm.pbf", "Dataset not converted to PBF"
+        assert not (self.tmp_dir / "overpass.osm").exists(), "XML download not removed"
+        assert dataset.get_way_nodes([10]) == {10: [1, 2, 3]}, "Dataset contents differ"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from tebetebe import POIDataset, OSMDataset
+from geopandas import GeoDataFrame
+from shapely.geometry import Point, box
+import unittest
+import tempfile
+import json
+import os
+
+class POIDatasetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "pois.geojson")
+
+        ## 100 points on a line and a polygon, which is not a POI
+        gdf = GeoDataFrame({"id": list(range(101)), "amenity": ["school"] * 101},
+                           geometry=[Point(i, 0) for i in range(100)] + [box(0, 0, 1, 1)], crs="EPSG:4326")
+        gdf.to_file(self.path, driver="GeoJSON")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_from_file(self):
+        pois = POIDataset.from_file(self.path, columns=["id"], bbox=(9.5, -1, 19.5, 1))
+
+        assert pois.get_name() == "pois", "Dataset not named after file"
+        assert list(pois.columns) == ["id", "geometry"], "Columns not selected"
+        assert sorted(pois["id"]) == list(range(10, 20)), "Features not filtered by bbox"
+
+    def test_iter_file(self):
+        chunks = list(POIDataset.iter_file(self.path, chunk_size=30))
+
+        assert [len(c) for c in chunks] == [30, 30, 30, 10], "Unexpected chunks"
+        assert (chunks[-1].geom_type == "Point").all(), "Non-Point geometries not filtered"
+
+    def test_iter_file_bbox(self):
+        chunks = list(POIDataset.iter_file(self.path, chunk_size=4, columns=["id"], bbox=(9.5, -1, 19.5, 1)))
+
+        assert [len(c) for c in chunks] == [4, 4, 2], "Unexpected chunks"
+        assert list(chunks[0].columns) == ["id", "geometry"], "Columns not selected"
+        assert sorted(i for c in chunks for i in c["id"]) == list(range(10, 20)), "Features not filtered by bbox"
+
+    def test_from_osm(self):
+        osm_dataset = OSMDataset("./data/ngwempisi.osm.pbf")
+        filters = {"homesteads": {"building": True}, "schools": {"amenity": ["school", "college"]}}
+
+        pois = POIDataset.from_osm_many(osm_dataset, filters, tmp_dir=self.tmp_dir.name)
+        schools = json.load(open("./data/ngwempisi_schools.geojson"))["features"]
+
+        assert len(pois["homesteads"]) == 2507, "Unexpected number of buildings"
+        assert set(pois["schools"].index) == set(int(s["properties"]["osm_way_id"]) for s in schools), \
+            "Unexpected schools"
+        assert pois["schools"].get_name() == "schools", "Dataset not named after filter"
+
+        ## Same dataset & filter reuses the extracted POIs
+        cached = POIDataset.from_osm(osm_dataset, filters["schools"], name="schools", tmp_dir=self.tmp_dir.name)
+
+        assert len(os.listdir(self.tmp_dir.name)) == 3, "POIs not cached by filter"
+        assert cached.geometry.geom_equals_exact(pois["schools"].geometry, 1e-9).all(), "Cached POIs differ"
+
+
+if __name__ == '__main__':
+    unittest.main()
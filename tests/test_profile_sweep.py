@@ -0,0 +1,46 @@
+from tebetebe.analysis import ProfileSweep
+import tebetebe as tb
+import unittest
+import tempfile
+import shutil
+
+from pathlib import Path
+
+class ProfileSweepTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.env = tb.Environment(tmp_dir=self.tmp_dir)
+
+        shutil.copytree("./profiles/lib", str(self.tmp_dir / "template" / "lib"))
+        template_path = self.tmp_dir / "template" / "walk_template.lua"
+        template_path.write_text(Path("./profiles/walk_normal.lua").read_text()
+                                 .replace("local walking_speed = 5", "local walking_speed = ${walking_speed}"))
+
+        self.template = self.env.RoutingProfile(template_path)
+        self.route_network = self.env.OSMDataset("./data/ngwempisi.osm.pbf")
+        self.origins = self.env.POIDataset.from_file("./data/ngwempisi_homesteads.geojson")
+        self.dests = self.env.POIDataset.from_file("./data/ngwempisi_schools.geojson")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sweep(self):
+        sweep = ProfileSweep(self.route_network, self.template, {"walking_speed": [4, 4, 6]},
+                             tmp_dir=self.tmp_dir)
+
+        origins = list(zip(self.origins.geometry.x, self.origins.geometry.y))
+        dests = list(zip(self.dests.geometry.x, self.dests.geometry.y))
+
+        def mean_duration(api):
+            durations = api.table(origins, coords_dest=dests, output="raw")["durations"]
+            return {"mean_duration": sum(map(sum, durations)) / (len(origins) * len(dests))}
+
+        results = sweep(mean_duration)
+
+        assert list(results.columns) == ["scenario", "walking_speed", "mean_duration"], "Unexpected columns"
+        assert results.mean_duration[0] == results.mean_duration[1], "Identical variants differ"
+        assert results.mean_duration[2] < results.mean_duration[0], "Faster variant not faster"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import tebetebe as tb
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import time
+
+from pathlib import Path
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = tb.ResultCache(self.tmp_dir / "results.sqlite", max_size=None)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_get_put(self):
+        key = self.cache.get_key("abc", "table", [(31.1, -26.5), (31.2, -26.6)], sources=1)
+
+        assert key != self.cache.get_key("abc", "table", [(31.1, -26.5), (31.2, -26.6)], sources=2), \
+            "Options not part of the key"
+        assert key != self.cache.get_key("def", "table", [(31.1, -26.5), (31.2, -26.6)], sources=1), \
+            "Fingerprint not part of the key"
+        assert self.cache.get(key) is None, "Result cached before put"
+
+        self.cache.put(key, np.array([[1.5, np.nan]]))
+        self.cache.put("route", {"duration": 60, "geometry": "LINESTRING (0 0, 1 1)"})
+
+        ## Results persist across instances
+        cache = tb.ResultCache(self.tmp_dir / "results.sqlite")
+
+        assert np.array_equal(cache.get(key), np.array([[1.5, np.nan]]), equal_nan=True), "Array not cached"
+        assert cache.get("route")["duration"] == 60, "Route not cached"
+        assert cache.get_stats()["hits"] == 2, "Hits not counted"
+
+        cache.close()
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 3 * 1000
+
+        for i in range(3):
+            self.cache.put(str(i), np.zeros(100)) ## ~900 bytes each
+            time.sleep(0.01)
+
+        self.cache.get("0") ## "1" is now the least recently used
+        self.cache.put("3", np.zeros(100))
+
+        assert self.cache.get("1") is None, "Least recently used result not evicted"
+        assert self.cache.get("0") is not None, "Recently used result evicted"
+        assert self.cache.get_stats()["evictions"] >= 1, "Evictions not counted"
+        assert self.cache.get_stats()["size"] <= self.cache.max_size, "Cache over max_size"
+
+    def test_replace(self):
+        self.cache.put("0", np.zeros(100))
+        size = self.cache.get_stats()["size"]
+
+        self.cache.put("0", np.ones(100))
+        assert self.cache.get_stats()["size"] == size, "Replaced result counted twice"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+from tebetebe.analysis import RouteMatrix
+import numpy as np
+import unittest
+import tempfile
+
+class RouteMatrixTestCase(unittest.TestCase):
+    def setUp(self):
+        self.normal = RouteMatrix(np.array([[1, 2, 3], [4, 5, np.nan]]), ["a", "b"], [10, 20, 30],
+                                  distances=np.ones((2, 3)), name="normal")
+        self.flood = RouteMatrix(np.array([[1, 9, 3], [np.nan, 5, np.nan]]), ["a", "b"], [10, 20, 30],
+                                 name="flood")
+
+    def test_melt(self):
+        table = RouteMatrix.melt_many([self.normal, self.flood])
+
+        assert list(table.columns) == ["origin_id", "dest_id", "normal_duration", "normal_distance",
+                                       "flood_duration"], "Unexpected columns"
+        assert table["origin_id"].tolist() == ["a"] * 3 + ["b"] * 3, "Pairs not in row-major order"
+        assert table["dest_id"].tolist() == [10, 20, 30] * 2, "Pairs not in row-major order"
+        assert table["normal_duration"].dtype == np.float32, "Durations not float32"
+
+        differ = self.normal.durations != self.flood.durations
+        assert len(self.normal.melt(mask=differ)) == int(differ.sum()), "Mask not applied"
+
+    def test_save_load(self):
+        path = self.normal.save(tempfile.mkdtemp())
+        matrix = RouteMatrix.load(path)
+
+        assert isinstance(matrix.durations, np.memmap), "Matrix not memory-mapped"
+        assert np.array_equal(matrix.durations, self.normal.durations, equal_nan=True), "Durations not saved"
+        assert matrix.origin_ids.equals(self.normal.origin_ids), "Origin ids not saved"
+        assert matrix.get_name() == "normal", "Name not saved"
+
+
+if __name__ == '__main__':
+    unittest.main()
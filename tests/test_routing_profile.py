@@ -0,0 +1,40 @@
+import tebetebe as tb
+import unittest
+import tempfile
+import shutil
+
+from pathlib import Path
+
+class RoutingProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+
+        ## Template from the test walking profile, next to its lib/
+        shutil.copytree("./profiles/lib", str(self.tmp_dir / "template" / "lib"))
+        template_path = self.tmp_dir / "template" / "walk_template.lua"
+        template_path.write_text(Path("./profiles/walk_normal.lua").read_text()
+                                 .replace("local walking_speed = 5", "local walking_speed = ${walking_speed}"))
+
+        self.template = tb.RoutingProfile(template_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_render(self):
+        slow = self.template.render(tmp_dir=self.tmp_dir, walking_speed=4)
+        fast = self.template.render(tmp_dir=self.tmp_dir, walking_speed=6)
+
+        assert "local walking_speed = 4" in slow.get_path().read_text(), "Parameter not rendered"
+        assert (slow.get_path().parent / "lib" / "access.lua").is_file(), "lib/ not available to render"
+        assert slow.get_fingerprint() != fast.get_fingerprint(), "Renders share a fingerprint"
+
+        ## Identical renders share a file and fingerprint
+        assert self.template.render(tmp_dir=self.tmp_dir, walking_speed=4).get_path() == slow.get_path(), \
+            "Identical render not reused"
+
+        with self.assertRaises(ValueError):
+            self.template.render(tmp_dir=self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
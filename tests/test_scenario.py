@@ -1,4 +1,7 @@
 import tebetebe as tb
+from tebetebe.analysis import TiledTable
+import numpy as np
+import importlib.util
 import unittest
 
 class ScenarioTestCase(unittest.TestCase):
@@ -39,6 +42,103 @@ class ScenarioTestCase(unittest.TestCase):
         with self.scenario as scenario:
             assert scenario.is_alive() == True, "Scenario not alive after context manager execution"
 
+    def test_scenario_overlay_MLD(self):
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal,
+                                          algorithm="MLD", name="MLD")
+
+        ## Close a way of the base scenario
+        self.overlay = self.scenario.derive("MLD_closed", way_speeds={132430111: 0})
+
+        ## Test Compilation
+        self.overlay()
+        assert self.overlay.path.is_file(), "Overlay scenario not compiled"
+        assert self.overlay.get_fingerprint() != self.scenario.get_fingerprint(), \
+            "Overlay scenario shares base scenario fingerprint"
+
+        ## Test Scenario HTTP API
+        with self.overlay as scenario:
+            assert scenario.is_alive() == True, "Scenario not alive after context manager execution"
+
+        with self.assertRaises(ValueError):
+            self.env.Scenario(self.route_network, self.walk_normal,
+                              algorithm="CH", name="CH").derive("CH_closed")
+
+    def test_scenario_shared_memory(self):
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal,
+                                          algorithm="MLD", name="MLD_shm", shared_memory=True)
+        self.overlay = self.scenario.derive("MLD_shm_closed", way_speeds={132430111: 0})
+
+        with self.scenario as scenario:
+            assert scenario.is_alive() == True, "Scenario not alive after context manager execution"
+
+            ## Hot-swap the served network to the overlay
+            scenario.swap(self.overlay)
+            assert scenario.loaded == self.overlay.get_fingerprint(), "Scenario not swapped"
+            assert scenario.is_alive() == True, "Scenario not alive after swap"
+
+        assert self.scenario.loaded is None, "Shared memory not released on exit"
+
+    def test_scenario_shared_memory_persistent(self):
+        registry = tb.ServerRegistry(registry_dir="/tmp/test_scenario/registry")
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal, algorithm="MLD",
+                                          name="MLD_shm_persistent", shared_memory=True, persistent=registry)
+
+        try:
+            with self.scenario as scenario:
+                assert scenario.is_alive() == True, "Scenario not alive after context manager execution"
+
+            ## The persistent server keeps serving its dataset, but no longer counts as a user
+            assert tb.Scenario._dataset_users[self.scenario.name] == 0, "Dataset user not released on exit"
+            assert self.scenario.loaded is not None, "Shared memory of persistent server released"
+        finally:
+            registry.stop_all()
+
+    def test_scenario_pool(self):
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal,
+                                          algorithm="MLD", name="MLD_pool")
+
+        with tb.ScenarioPool(self.scenario, workers=3) as pool:
+            assert pool.is_alive() == True, "Pool workers not alive after context manager execution"
+            assert len(set(w["port"] for w in pool.get_stats())) == 3, "Pool workers share a port"
+
+    def test_scenario_extent(self):
+        ## A single POI has no hull area, and is buffered anyway
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal, name="MLD_extent",
+                                          extent=self.dests.iloc[:1], extent_buffer=0)
+        assert self.scenario.extent.area > 0, "Extent of a single POI has no area"
+
+        with self.assertRaises(TypeError):
+            self.env.Scenario(self.route_network, self.walk_normal, name="MLD_extent", extent=object())
+
+    @unittest.skipUnless(importlib.util.find_spec("pyosrm"), "pyosrm not installed")
+    def test_scenario_libosrm(self):
+        self.scenario = self.env.Scenario(self.route_network, self.walk_normal,
+                                          algorithm="MLD", name="MLD_libosrm", engine="libosrm")
+
+        origin = self.origins.geometry.iloc[0]
+        dest = self.dests.geometry.iloc[0]
+
+        ## Test in-process routes against osrm-routed
+        with self.scenario as scenario:
+            assert scenario.is_alive() == True, "Scenario engine not loaded"
+            libosrm_route = scenario.simple_route((origin.x, origin.y), (dest.x, dest.y))
+
+            ## Options and services libosrm can't provide are answered by osrm-routed
+            full_route = scenario.simple_route((origin.x, origin.y), (dest.x, dest.y), overview="full",
+                                               annotations="nodes")
+            assert "annotation" in full_route["routes"][0]["legs"][0], "Route options not honoured"
+
+            durations = TiledTable(scenario)([(origin.x, origin.y)], [(dest.x, dest.y)])["duration"]
+            assert not np.isnan(durations[0, 0]), "Table not answered by osrm-routed"
+
+        self.scenario.engine_name = "http"
+
+        with self.scenario as scenario:
+            http_route = scenario.simple_route((origin.x, origin.y), (dest.x, dest.y))
+
+        assert libosrm_route["routes"][0]["duration"] == http_route["routes"][0]["duration"], \
+            "libosrm and http engines return different routes"
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+import tebetebe as tb
+import subprocess
+import unittest.mock
+import unittest
+import tempfile
+import json
+import shutil
+import socket
+import time
+import sys
+
+from pathlib import Path
+
+class ServerRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+
+        ## Stand-in for a detached osrm-routed server
+        self.port = tb.utils.find_open_port()
+        self.server = subprocess.Popen([sys.executable, "-m", "http.server", str(self.port),
+                                        "--bind", "127.0.0.1"],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        for _ in range(500):
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.kill()
+        self.server.wait()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_attach(self):
+        registry = tb.ServerRegistry(self.tmp_dir)
+        assert registry.attach("key") is None, "Attached to unregistered server"
+
+        registry.register("key", "scenario", self.server.pid, self.port)
+
+        ## Another process opening the same registry attaches to the server
+        server = tb.ServerRegistry(self.tmp_dir).attach("key")
+        assert server is not None and server["port"] == self.port, "Server not attached"
+
+    def test_idle_eviction(self):
+        registry = tb.ServerRegistry(self.tmp_dir, idle_timeout=0.1)
+        registry.register("key", "scenario", self.server.pid, self.port)
+
+        time.sleep(0.2)
+
+        assert registry.attach("key") is None, "Idle server not evicted"
+        assert self.server.wait(timeout=5) is not None, "Idle server not stopped"
+
+    def test_attached_not_evicted(self):
+        registry = tb.ServerRegistry(self.tmp_dir, idle_timeout=0.1)
+        registry.register("key", "scenario", self.server.pid, self.port)
+        registry.attach("key")
+
+        time.sleep(0.2)
+        assert "key" in registry.get_servers(), "Attached server evicted"
+
+        registry.detach("key")
+        time.sleep(0.2)
+        assert registry.get_servers() == {}, "Detached idle server not evicted"
+
+    def test_reused_pid(self):
+        registry = tb.ServerRegistry(self.tmp_dir)
+        registry.register("key", "scenario", self.server.pid, self.port)
+
+        ## Registered process replaced by another with the same pid
+        servers = json.loads((self.tmp_dir / "registry.json").read_text())
+        servers["key"]["pid_started"] = "Thu Jan  1 00:00:00 1970"
+        (self.tmp_dir / "registry.json").write_text(json.dumps(servers))
+
+        assert registry.attach("key") is None, "Attached to a reused pid"
+        assert self.server.poll() is None, "Process with a reused pid signalled"
+
+    def test_access_without_ps(self):
+        registry = tb.ServerRegistry(self.tmp_dir, idle_timeout=60)
+        registry.register("key", "scenario", self.server.pid, self.port)
+
+        ## Accessing the registry only checks pids, without spawning a process per server
+        with unittest.mock.patch("subprocess.check_output", side_effect=AssertionError("ps spawned")):
+            assert "key" in registry.get_servers(), "Running server evicted"
+
+    def test_memory_eviction(self):
+        registry = tb.ServerRegistry(self.tmp_dir, max_memory=1)
+        registry.register("key", "scenario", self.server.pid, self.port)
+
+        assert registry.get_servers() == {}, "Server over memory cap not evicted"
+
+
+if __name__ == '__main__':
+    unittest.main()
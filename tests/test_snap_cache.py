@@ -0,0 +1,52 @@
+from tebetebe import SnapCache
+import unittest
+
+class FakeScenario():
+    '''Stand-in for a running scenario, snapping coordinates to the integer grid'''
+
+    def __init__(self, fingerprint="net"):
+        self.fingerprint = fingerprint
+        self.requests = 0
+
+    def get_name(self):
+        return "fake"
+
+    def get_network_fingerprint(self):
+        return self.fingerprint
+
+    def get_max_table_size(self):
+        return 4
+
+    def request(self, service, coords, sources=None, destinations=None, **params):
+        self.requests += 1
+
+        return {"code": "Ok",
+                "sources": [{"hint": "{}:{}".format(self.fingerprint, c),
+                             "location": [round(c[0]), round(c[1])],
+                             "distance": abs(c[0] - round(c[0]))} for c in coords]}
+
+class SnapCacheTestCase(unittest.TestCase):
+    def test_snap_cache(self):
+        cache = SnapCache(workers=2)
+        api = FakeScenario()
+
+        coords = [(i + 0.25, i) for i in range(10)]
+        snaps = cache.snap(api, coords)
+
+        assert api.requests == 3, "Coordinates not snapped in chunks of max_table_size"
+        assert tuple(snaps["location"][3]) == (3, 3), "Snaps out of order"
+        assert (snaps["distance"] == 0.25).all(), "Snapping distance not returned"
+
+        snaps = cache.snap(api, coords[::-1] + [(20.25, 0)])
+
+        assert api.requests == 4, "Known coordinates snapped again"
+        assert snaps["hint"][0] == "net:(9.25, 9.0)", "Snaps out of order"
+
+        other = FakeScenario("other")
+        cache.snap(other, coords[:2])
+
+        assert other.requests == 1, "Snaps shared across networks"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from tebetebe.analysis import TiledTable
+import numpy as np
+import unittest
+
+class FakeScenario():
+    '''Stand-in for a running scenario, rejecting tables over max_table_size like osrm-routed'''
+
+    def get_name(self):
+        return "fake"
+
+    def get_max_table_size(self):
+        return 7
+
+    def table(self, coords_src, coords_dest=None, output="raw", annotations="duration"):
+        if len(coords_src) * len(coords_dest) > self.get_max_table_size() ** 2:
+            raise ValueError("TooBig")
+
+        durations = [[o[0] * 1000 + d[0] for d in coords_dest] for o in coords_src]
+        distances = [[None for d in coords_dest] for o in coords_src]
+
+        return {"code": "Ok", "durations": durations, "distances": distances}
+
+class TiledTableTestCase(unittest.TestCase):
+    def test_tiled_table(self):
+        origins = [(i, 0) for i in range(23)]
+        dests = [(j, 1) for j in range(16)]
+
+        table = TiledTable(FakeScenario(), workers=3)
+        matrices = table(origins, dests, annotations=("duration", "distance"))
+
+        expected = np.arange(23)[:, None] * 1000 + np.arange(16)[None, :]
+
+        assert (matrices["duration"] == expected).all(), "Tiles not assembled in place"
+        assert np.isnan(matrices["distance"]).all(), "Unroutable pairs not NaN"
+        assert table.get_stats()["tiles"] == 4 * 3, "Unexpected number of tiles"
+
+    def test_tiled_table_collapse(self):
+        ## Origins 0.1 apart along the equator (~11 km), duplicated a few meters apart
+        origins = [(i / 10 + k * 1e-5, 0) for i in range(10) for k in range(3)]
+        dests = [(j / 10, 1) for j in range(5)]
+
+        scenario = FakeScenario()
+        table = TiledTable(scenario, collapse=100)
+        durations = table(origins, dests)["duration"]
+
+        assert durations.shape == (30, 5), "Matrix not expanded back to all origins"
+        assert (durations[0::3] == durations[1::3]).all(), "Origins in the same cell not collapsed"
+        assert table.get_stats()["pairs"] == 10 * 5, "Collapsed pairs not requested once"
+        assert table.get_stats()["expanded_pairs"] == 30 * 5, "Expanded pairs not counted"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from tebetebe.analysis import TraversalIndex, RouteComparison
+from geopandas import GeoDataFrame, points_from_xy
+import numpy as np
+import unittest
+
+class FakeScenario():
+    '''
+    Stand-in for a running scenario on which the route of origin (i, 0) to dest (j, 0) goes
+    through OSM nodes i and 100 + j. Routes of `failing` (i, j) pairs raise like a transient
+    HTTP error
+    '''
+
+    config = None
+
+    def __init__(self, name, offset=0, failing=()):
+        self.name = name
+        self.offset = offset
+        self.failing = failing
+
+    def get_name(self):
+        return self.name
+
+    def get_network_fingerprint(self):
+        return self.name
+
+    def get_max_table_size(self):
+        return 10
+
+    def get_duration(self, o, d):
+        return 10 * o[0] + d[0] + self.offset
+
+    def table(self, coords_src, coords_dest=None, output="raw", annotations="duration"):
+        return {"code": "Ok", "durations": [[self.get_duration(o, d) for d in coords_dest] for o in coords_src]}
+
+    def simple_route(self, origin, dest, **kwargs):
+        if (origin[0], dest[0]) in self.failing:
+            raise ConnectionError("HTTP Error 503: Service Unavailable")
+
+        return {"code": "Ok", "routes": [{"duration": self.get_duration(origin, dest), "distance": 0,
+                                          "legs": [{"annotation": {"nodes": [origin[0], 100 + dest[0]]}}]}]}
+
+class TraversalIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = TraversalIndex([np.array([1, 2, 3, 4]),
+                                     None, ## unrouted pair
+                                     np.array([4, 3, 2]),
+                                     np.array([5, 2, 6])])
+
+    def test_segments(self):
+        assert self.index.get_pairs(segments=[(2, 3)]).tolist() == [0], "Segments are directed"
+        assert self.index.get_pairs(segments=[(3, 2), (2, 6)]).tolist() == [2, 3], "Pairs not found"
+        assert self.index.get_pairs(segments=[(4, 4)]).tolist() == [], "Segment across routes found"
+
+    def test_nodes(self):
+        assert self.index.get_pairs(nodes=[2]).tolist() == [0, 2, 3], "Pairs not found"
+        assert self.index.get_pairs(nodes=[6], segments=[(1, 2)]).tolist() == [0, 3], "Pairs not merged"
+        assert self.index.get_pairs().tolist() == [], "Pairs found without changes"
+
+    def test_unrouted(self):
+        assert self.index.unrouted.tolist() == [1], "Pairs without baseline route not listed"
+
+    def test_variant_failed_baseline(self):
+        points = GeoDataFrame(geometry=points_from_xy(np.arange(3), np.zeros(3)))
+        comparison = RouteComparison(points, points)
+
+        baseline = FakeScenario("baseline", failing=[(2, 1)])
+        variant = FakeScenario("variant", offset=1000)
+
+        durations = comparison.get_variant_matrix(baseline, variant, nodes=[0]).durations
+
+        expected = np.add.outer(10 * np.arange(3), np.arange(3)).astype(float)
+        expected[0] += 1000 ## Routes through the changed node
+        expected[2, 1] += 1000 ## Failed on the baseline, so it may cross the changed node
+
+        assert np.array_equal(durations, expected), "Failed baseline pair not routed on the variant"
+
+
+if __name__ == '__main__':
+    unittest.main()